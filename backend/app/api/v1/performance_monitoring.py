@@ -9,6 +9,13 @@ import logging
 
 from ...services.enterprise.performance_monitoring_service import PerformanceMonitoringService
 from ...core.security import get_current_user
+from ...core.vector_store import get_vector_store
+from ...services.ai.query_embedding_cache import get_query_embedding_cache
+from ...services.ai.retrieval_cache import get_retrieval_cache
+from ...services.ai.contextual_summary_cache import get_contextual_summary_cache
+from ...services.ai.project_prefilter import get_project_prefilter
+from ...services.ai.llm_rate_limiter import get_classification_rate_limiter
+from ...services.ai.rag_agent_service import get_rag_latency_metrics
 from ...models.schemas.user import User
 
 logger = logging.getLogger(__name__)
@@ -90,6 +97,36 @@ async def get_current_metrics(
         raise HTTPException(status_code=500, detail=f"Failed to get current metrics: {str(e)}")
 
 
+@router.get("/metrics/retrieval", response_model=Dict[str, Any])
+async def get_retrieval_metrics(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get retrieval infrastructure metrics (vector store connection reuse, embedding cache hit rates).
+    
+    Args:
+        current_user: Current authenticated user
+        
+    Returns:
+        Retrieval metrics
+    """
+    try:
+        return {
+            "success": True,
+            "vector_store": get_vector_store().get_metrics(),
+            "query_embedding_cache": get_query_embedding_cache().get_metrics(),
+            "retrieval_cache": get_retrieval_cache().get_metrics(),
+            "contextual_summary_cache": get_contextual_summary_cache().get_metrics(),
+            "classification_prefilter": get_project_prefilter().get_metrics(),
+            "classification_rate_limiter": get_classification_rate_limiter().get_metrics(),
+            "rag_agent": get_rag_latency_metrics()
+        }
+        
+    except Exception as e:
+        logger.error(f"Failed to get retrieval metrics: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get retrieval metrics: {str(e)}")
+
+
 @router.get("/metrics/history", response_model=Dict[str, Any])
 async def get_metrics_history(
     hours: int = Query(24, ge=1, le=168, description="Number of hours to look back"),
@@ -379,6 +416,7 @@ async def get_monitoring_status(
                 "/health",
                 "/metrics/current",
                 "/metrics/history",
+                "/metrics/retrieval",
                 "/metrics/summary",
                 "/optimize",
                 "/activity/track",
@@ -14,6 +14,7 @@ import json
 from datetime import datetime
 
 from ....services.attendee.attendee_webhook_handler import AttendeeWebhookHandler
+from ....services.attendee.webhook_processor_service import webhook_processor_service
 from ....core.database import get_supabase
 from ....core.config import get_settings
 
@@ -55,8 +56,18 @@ async def handle_attendee_webhook(
         else:
             logger.info(f"Webhook secret not configured - skipping signature validation for user {user_id}")
         
-        # Process the webhook
         webhook_handler = AttendeeWebhookHandler()
+        
+        # Queue the webhook for the processor's consumers when they are running
+        if webhook_processor_service.is_running:
+            log_id = await webhook_handler.record_webhook(webhook_data, user_id)
+            await webhook_processor_service.enqueue(webhook_data, user_id, log_id)
+            return JSONResponse(
+                content={"status": "success", "message": "Webhook queued for processing"},
+                status_code=200
+            )
+        
+        # Process the webhook
         success = await webhook_handler.process_webhook(webhook_data, user_id)
         
         if success:
@@ -51,6 +51,7 @@ class Settings(BaseSettings):
     
     # Supabase
     supabase_url: Optional[str] = Field(default=None, env="SUPABASE_URL")
+    supabase_max_workers: int = Field(default=16, env="SUPABASE_MAX_WORKERS")
     supabase_anon_key: Optional[str] = Field(default=None, env="SUPABASE_ANON_KEY")
     supabase_service_role_key: Optional[str] = Field(default=None, env="SUPABASE_SERVICE_ROLE_KEY")
     
@@ -73,6 +74,8 @@ class Settings(BaseSettings):
     pinecone_host_url: str = Field(default="https://sunny-wws6cxq.svc.aped-4627-b74a.pinecone.io", env="PINECONE_HOST_URL")
     pinecone_environment: Optional[str] = Field(default=None, env="PINECONE_ENVIRONMENT")
     pinecone_index_name: Optional[str] = Field(default=None, env="PINECONE_INDEX_NAME")
+    pinecone_pool_threads: int = Field(default=8, env="PINECONE_POOL_THREADS")
+    pinecone_upsert_batch_size: int = Field(default=100, env="PINECONE_UPSERT_BATCH_SIZE")
     
     # Embedding settings
     embedding_base_url: str = Field(default="https://api.openai.com/v1", env="EMBEDDING_BASE_URL")
@@ -80,22 +83,75 @@ class Settings(BaseSettings):
     embedding_model_choice: str = Field(default="text-embedding-3-small", env="EMBEDDING_MODEL_CHOICE")
     embedding_model_large: str = Field(default="text-embedding-3-large", env="EMBEDDING_MODEL_LARGE")
     
+    # Chunk embedding batches
+    embedding_batch_max_tokens: int = Field(default=100000, env="EMBEDDING_BATCH_MAX_TOKENS")
+    embedding_batch_max_inputs: int = Field(default=256, env="EMBEDDING_BATCH_MAX_INPUTS")
+    embedding_batch_concurrency: int = Field(default=4, env="EMBEDDING_BATCH_CONCURRENCY")
+    
+    # Near-duplicate chunk detection (MinHash/LSH)
+    near_duplicate_threshold: float = Field(default=0.8, env="NEAR_DUPLICATE_THRESHOLD")
+    minhash_num_perm: int = Field(default=128, env="MINHASH_NUM_PERM")
+    minhash_bands: int = Field(default=16, env="MINHASH_BANDS")
+    
+    # Query embedding cache
+    embedding_cache_max_entries: int = Field(default=5000, env="EMBEDDING_CACHE_MAX_ENTRIES")
+    embedding_cache_max_mb: int = Field(default=64, env="EMBEDDING_CACHE_MAX_MB")
+    embedding_cache_ttl_seconds: int = Field(default=86400, env="EMBEDDING_CACHE_TTL_SECONDS")
+    embedding_cache_use_redis: bool = Field(default=False, env="EMBEDDING_CACHE_USE_REDIS")
+    
+    # RAG retrieval result cache
+    retrieval_cache_max_entries: int = Field(default=1000, env="RETRIEVAL_CACHE_MAX_ENTRIES")
+    retrieval_cache_ttl_seconds: int = Field(default=1800, env="RETRIEVAL_CACHE_TTL_SECONDS")
+    retrieval_cache_version_ttl_seconds: int = Field(default=15, env="RETRIEVAL_CACHE_VERSION_TTL_SECONDS")
+    
     # Hybrid search configuration
     use_hybrid_search: bool = Field(default=True, env="USE_HYBRID_SEARCH")
     semantic_weight: float = Field(default=0.7, env="SEMANTIC_WEIGHT")
     keyword_weight: float = Field(default=0.3, env="KEYWORD_WEIGHT")
+    semantic_search_timeout: float = Field(default=8.0, env="SEMANTIC_SEARCH_TIMEOUT")
+    keyword_search_timeout: float = Field(default=5.0, env="KEYWORD_SEARCH_TIMEOUT")
+    keyword_index_build_lease_seconds: int = Field(default=300, env="KEYWORD_INDEX_BUILD_LEASE_SECONDS")
     
     # Advanced chunking configuration
     max_chunk_tokens: int = Field(default=400, env="MAX_CHUNK_TOKENS")
     min_chunk_tokens: int = Field(default=100, env="MIN_CHUNK_TOKENS")
     chunk_overlap: int = Field(default=50, env="CHUNK_OVERLAP")
     similarity_threshold: float = Field(default=0.7, env="SIMILARITY_THRESHOLD")
+    semantic_smoothing_window: int = Field(default=3, env="SEMANTIC_SMOOTHING_WINDOW")
+    semantic_embedding_batch_size: int = Field(default=100, env="SEMANTIC_EMBEDDING_BATCH_SIZE")
     
     # Contextual retrieval configuration
     use_contextual_retrieval: bool = Field(default=True, env="USE_CONTEXTUAL_RETRIEVAL")
+    use_hierarchical_chunking: bool = Field(default=False, env="USE_HIERARCHICAL_CHUNKING")
     contextual_chunk_max_length: int = Field(default=4000, env="CONTEXTUAL_CHUNK_MAX_LENGTH")
     contextual_summary_max_tokens: int = Field(default=150, env="CONTEXTUAL_SUMMARY_MAX_TOKENS")
     contextual_temperature: float = Field(default=0.1, env="CONTEXTUAL_TEMPERATURE")
+    contextual_summary_model: str = Field(default="gpt-4o-mini", env="CONTEXTUAL_SUMMARY_MODEL")
+    contextual_summary_concurrency: int = Field(default=8, env="CONTEXTUAL_SUMMARY_CONCURRENCY")
+    contextual_summary_cache_max_entries: int = Field(default=5000, env="CONTEXTUAL_SUMMARY_CACHE_MAX_ENTRIES")
+    
+    # Classification project prefilter
+    classification_prefilter_top_k: int = Field(default=5, env="CLASSIFICATION_PREFILTER_TOP_K")
+    classification_fast_path_score: float = Field(default=0.75, env="CLASSIFICATION_FAST_PATH_SCORE")
+    classification_fast_path_margin: float = Field(default=0.15, env="CLASSIFICATION_FAST_PATH_MARGIN")
+    
+    # Batch classification
+    classification_batch_concurrency: int = Field(default=8, env="CLASSIFICATION_BATCH_CONCURRENCY")
+    classification_batch_flush_size: int = Field(default=25, env="CLASSIFICATION_BATCH_FLUSH_SIZE")
+    classification_requests_per_minute: int = Field(default=500, env="CLASSIFICATION_REQUESTS_PER_MINUTE")
+    classification_tokens_per_minute: int = Field(default=300000, env="CLASSIFICATION_TOKENS_PER_MINUTE")
+    classification_rate_limit_retries: int = Field(default=3, env="CLASSIFICATION_RATE_LIMIT_RETRIES")
+    
+    # Attendee webhook processing
+    attendee_webhook_queue_backend: str = Field(default="memory", env="ATTENDEE_WEBHOOK_QUEUE_BACKEND")  # memory or redis
+    attendee_webhook_consumers: int = Field(default=8, env="ATTENDEE_WEBHOOK_CONSUMERS")
+    attendee_transcript_workers: int = Field(default=2, env="ATTENDEE_TRANSCRIPT_WORKERS")
+    attendee_webhook_marker_flush_size: int = Field(default=100, env="ATTENDEE_WEBHOOK_MARKER_FLUSH_SIZE")
+    attendee_webhook_marker_flush_seconds: float = Field(default=1.0, env="ATTENDEE_WEBHOOK_MARKER_FLUSH_SECONDS")
+    attendee_webhook_sweep_interval_seconds: int = Field(default=300, env="ATTENDEE_WEBHOOK_SWEEP_INTERVAL_SECONDS")
+    attendee_webhook_sweep_min_age_seconds: int = Field(default=120, env="ATTENDEE_WEBHOOK_SWEEP_MIN_AGE_SECONDS")
+    attendee_webhook_sweep_claim_seconds: int = Field(default=900, env="ATTENDEE_WEBHOOK_SWEEP_CLAIM_SECONDS")
+    attendee_webhook_shard_lease_seconds: int = Field(default=30, env="ATTENDEE_WEBHOOK_SHARD_LEASE_SECONDS")
     
     # Webhook settings
     webhook_base_url: str = Field(default="https://backend-staging-6085.up.railway.app", env="WEBHOOK_BASE_URL")
@@ -109,6 +165,50 @@ class Settings(BaseSettings):
     # Gmail email processing settings
     gmail_mark_processed_action: str = Field(default="read_then_delete", env="GMAIL_MARK_PROCESSED_ACTION")
     
+    # Gmail polling fetch settings
+    gmail_batch_size: int = Field(default=50, env="GMAIL_BATCH_SIZE")
+    gmail_batch_max_retries: int = Field(default=3, env="GMAIL_BATCH_MAX_RETRIES")
+    gmail_batch_retry_backoff_seconds: float = Field(default=1.0, env="GMAIL_BATCH_RETRY_BACKOFF_SECONDS")
+    gmail_pending_message_max_attempts: int = Field(default=5, env="GMAIL_PENDING_MESSAGE_MAX_ATTEMPTS")
+    gmail_history_page_size: int = Field(default=500, env="GMAIL_HISTORY_PAGE_SIZE")
+    gmail_full_resync_days: int = Field(default=7, env="GMAIL_FULL_RESYNC_DAYS")
+    gmail_full_resync_max_messages: int = Field(default=500, env="GMAIL_FULL_RESYNC_MAX_MESSAGES")
+    
+    # Drive changes feed settings
+    drive_changes_page_size: int = Field(default=1000, env="DRIVE_CHANGES_PAGE_SIZE")
+    drive_change_max_attempts: int = Field(default=5, env="DRIVE_CHANGE_MAX_ATTEMPTS")
+    
+    # Google API client cache settings
+    google_client_cache_max_entries: int = Field(default=1000, env="GOOGLE_CLIENT_CACHE_MAX_ENTRIES")
+    google_client_cache_revalidate_seconds: int = Field(default=300, env="GOOGLE_CLIENT_CACHE_REVALIDATE_SECONDS")
+
+    # Google token refresh engine settings
+    google_token_refresh_concurrency: int = Field(default=10, env="GOOGLE_TOKEN_REFRESH_CONCURRENCY")
+    google_token_refresh_lead_minutes: int = Field(default=15, env="GOOGLE_TOKEN_REFRESH_LEAD_MINUTES")
+    google_token_refresh_lease_seconds: int = Field(default=120, env="GOOGLE_TOKEN_REFRESH_LEASE_SECONDS")
+    google_token_refresh_rescan_seconds: int = Field(default=300, env="GOOGLE_TOKEN_REFRESH_RESCAN_SECONDS")
+    google_token_refresh_retry_seconds: int = Field(default=300, env="GOOGLE_TOKEN_REFRESH_RETRY_SECONDS")
+    google_token_refresh_scan_limit: int = Field(default=1000, env="GOOGLE_TOKEN_REFRESH_SCAN_LIMIT")
+    
+    # Calendar incremental sync settings
+    calendar_sync_page_size: int = Field(default=250, env="CALENDAR_SYNC_PAGE_SIZE")
+    calendar_full_sync_days: int = Field(default=30, env="CALENDAR_FULL_SYNC_DAYS")
+    calendar_recurrence_horizon_days: int = Field(default=30, env="CALENDAR_RECURRENCE_HORIZON_DAYS")
+    
+    # Gmail polling cron fan-out settings
+    gmail_polling_concurrency: int = Field(default=10, env="GMAIL_POLLING_CONCURRENCY")
+    gmail_polling_per_project_concurrency: int = Field(default=5, env="GMAIL_POLLING_PER_PROJECT_CONCURRENCY")
+    gmail_polling_user_timeout_seconds: float = Field(default=120.0, env="GMAIL_POLLING_USER_TIMEOUT_SECONDS")
+    gmail_polling_quota_cooldown_seconds: float = Field(default=30.0, env="GMAIL_POLLING_QUOTA_COOLDOWN_SECONDS")
+    virtual_email_index_ttl_seconds: int = Field(default=300, env="VIRTUAL_EMAIL_INDEX_TTL_SECONDS")
+    
+    # Adaptive multi-service sync scheduler settings
+    sync_max_concurrent_users: int = Field(default=20, env="SYNC_MAX_CONCURRENT_USERS")
+    sync_calendar_concurrency: int = Field(default=10, env="SYNC_CALENDAR_CONCURRENCY")
+    sync_drive_concurrency: int = Field(default=5, env="SYNC_DRIVE_CONCURRENCY")
+    sync_gmail_concurrency: int = Field(default=10, env="SYNC_GMAIL_CONCURRENCY")
+    sync_attendee_concurrency: int = Field(default=5, env="SYNC_ATTENDEE_CONCURRENCY")
+    
     # Attendee service settings
     attendee_api_base_url: Optional[str] = Field(default=None, env="ATTENDEE_API_BASE_URL")
     master_attendee_api_key: Optional[str] = Field(default=None, env="ATTENDEE_API_KEY")
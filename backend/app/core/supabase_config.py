@@ -3,7 +3,9 @@ Supabase configuration module for BeSunny.ai Python backend.
 Handles Supabase client initialization, authentication, and database operations.
 """
 
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any, List
 from supabase import create_client, Client
 from supabase.lib.client_options import ClientOptions
@@ -201,3 +203,25 @@ def get_supabase_service_role_key() -> Optional[str]:
 def get_supabase() -> Optional[Client]:
     """Get initialized Supabase client (alias for get_supabase_client)."""
     return get_supabase_client()
+
+
+# Bounded thread pool for blocking supabase-py calls made from async code
+_supabase_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_supabase_executor() -> ThreadPoolExecutor:
+    """Get the shared thread pool used to run blocking Supabase queries."""
+    global _supabase_executor
+    if _supabase_executor is None:
+        from .config import get_settings
+        _supabase_executor = ThreadPoolExecutor(
+            max_workers=get_settings().supabase_max_workers,
+            thread_name_prefix="supabase"
+        )
+    return _supabase_executor
+
+
+async def execute_async(query) -> Any:
+    """Execute a supabase-py query builder on the shared thread pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_supabase_executor(), query.execute)
@@ -0,0 +1,242 @@
+"""
+Vector store module for BeSunny.ai Python backend.
+Provides a process-wide, lazily created Pinecone client with pooled index handles.
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+class VectorStoreManager:
+    """Shared Pinecone client and index handles with an async query/upsert API."""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._client = None
+        self._indexes: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.pool_threads = self.settings.pinecone_pool_threads
+        self.upsert_batch_size = self.settings.pinecone_upsert_batch_size
+
+        self._metrics = {
+            'clients_created': 0,
+            'index_handles_created': 0,
+            'index_handle_reuses': 0,
+            'queries': 0,
+            'upserts': 0,
+            'vectors_upserted': 0,
+            'deletes': 0,
+            'errors': 0,
+            'total_query_time_ms': 0.0
+        }
+
+    @property
+    def default_index_name(self) -> str:
+        return self.settings.pinecone_vector_store
+
+    def get_client(self):
+        """Get the shared Pinecone control-plane client, creating it on first use."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:  # Double-check pattern
+                    from pinecone import Pinecone
+                    self._client = Pinecone(api_key=self.settings.pinecone_api_key)
+                    self._metrics['clients_created'] += 1
+                    logger.info("Pinecone client initialized")
+        return self._client
+
+    def get_index(self, index_name: Optional[str] = None):
+        """Get a pooled index handle, reusing its HTTP connections across calls."""
+        index_name = index_name or self.default_index_name
+        index = self._indexes.get(index_name)
+        if index is not None:
+            self._metrics['index_handle_reuses'] += 1
+            return index
+
+        with self._lock:
+            index = self._indexes.get(index_name)
+            if index is None:
+                client = self.get_client()
+                # A known host skips the describe_index round trip
+                if index_name == self.settings.pinecone_vector_store and self.settings.pinecone_host_url:
+                    index = client.Index(index_name, host=self.settings.pinecone_host_url, pool_threads=self.pool_threads)
+                else:
+                    index = client.Index(index_name, pool_threads=self.pool_threads)
+                self._indexes[index_name] = index
+                self._metrics['index_handles_created'] += 1
+                logger.info(f"Pinecone index handle created for {index_name}")
+            else:
+                self._metrics['index_handle_reuses'] += 1
+        return index
+
+    def ensure_index(self, index_name: Optional[str] = None, dimension: int = 1536, metric: str = "cosine"):
+        """Create the index if it does not exist yet and return its pooled handle."""
+        index_name = index_name or self.default_index_name
+        if index_name in self._indexes:
+            return self.get_index(index_name)
+
+        client = self.get_client()
+        if index_name not in client.list_indexes().names():
+            from pinecone import ServerlessSpec
+            logger.info(f"Creating new Pinecone index: {index_name}")
+
+            client.create_index(
+                name=index_name,
+                dimension=dimension,
+                metric=metric,
+                spec=ServerlessSpec(
+                    cloud="aws",
+                    region="us-east-1"
+                )
+            )
+
+            # Wait for index to be ready
+            while not client.describe_index(index_name).status['ready']:
+                time.sleep(1)
+
+            logger.info(f"Pinecone index {index_name} created successfully")
+
+        return self.get_index(index_name)
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking Pinecone call on the vector store thread pool."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_threads, thread_name_prefix="pinecone")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        filter: Optional[Dict[str, Any]] = None,
+        include_metadata: bool = True,
+        index_name: Optional[str] = None,
+        namespace: Optional[str] = None
+    ):
+        """Query the index without blocking the event loop."""
+        index = self.get_index(index_name)
+        kwargs = {
+            'vector': vector,
+            'top_k': top_k,
+            'include_metadata': include_metadata
+        }
+        if filter:
+            kwargs['filter'] = filter
+        if namespace:
+            kwargs['namespace'] = namespace
+
+        start_time = time.perf_counter()
+        try:
+            return await self._run(index.query, **kwargs)
+        except Exception:
+            self._metrics['errors'] += 1
+            raise
+        finally:
+            self._metrics['queries'] += 1
+            self._metrics['total_query_time_ms'] += (time.perf_counter() - start_time) * 1000
+
+    async def upsert(
+        self,
+        vectors: List[Dict[str, Any]],
+        index_name: Optional[str] = None,
+        namespace: Optional[str] = None,
+        batch_size: Optional[int] = None
+    ) -> int:
+        """Upsert vectors in size-capped batches. Returns the number of vectors written."""
+        index = self.get_index(index_name)
+        batch_size = batch_size or self.upsert_batch_size
+        kwargs = {'namespace': namespace} if namespace else {}
+
+        upserted = 0
+        try:
+            for i in range(0, len(vectors), batch_size):
+                batch = vectors[i:i + batch_size]
+                await self._run(index.upsert, vectors=batch, **kwargs)
+                upserted += len(batch)
+                self._metrics['upserts'] += 1
+        except Exception:
+            self._metrics['errors'] += 1
+            raise
+        finally:
+            self._metrics['vectors_upserted'] += upserted
+        return upserted
+
+    async def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        index_name: Optional[str] = None
+    ):
+        """Delete vectors by ID or metadata filter."""
+        index = self.get_index(index_name)
+        kwargs = {}
+        if ids:
+            kwargs['ids'] = ids
+        if filter:
+            kwargs['filter'] = filter
+
+        try:
+            self._metrics['deletes'] += 1
+            return await self._run(index.delete, **kwargs)
+        except Exception:
+            self._metrics['errors'] += 1
+            raise
+
+    async def describe_index_stats(self, filter: Optional[Dict[str, Any]] = None, index_name: Optional[str] = None):
+        """Get index statistics."""
+        index = self.get_index(index_name)
+        if filter:
+            return await self._run(index.describe_index_stats, filter=filter)
+        return await self._run(index.describe_index_stats)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get connection reuse and call metrics."""
+        metrics = dict(self._metrics)
+        handle_requests = metrics['index_handles_created'] + metrics['index_handle_reuses']
+        metrics['index_handle_reuse_rate'] = (
+            metrics['index_handle_reuses'] / handle_requests if handle_requests else 0.0
+        )
+        metrics['average_query_time_ms'] = (
+            metrics['total_query_time_ms'] / metrics['queries'] if metrics['queries'] else 0.0
+        )
+        metrics['open_index_handles'] = list(self._indexes.keys())
+        return metrics
+
+    def close(self):
+        """Drop index handles and shut down the worker pool."""
+        with self._lock:
+            self._indexes.clear()
+            self._client = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        logger.info("Vector store closed")
+
+# Global vector store instance
+_vector_store: Optional[VectorStoreManager] = None
+
+def get_vector_store() -> VectorStoreManager:
+    """Get the global vector store instance."""
+    global _vector_store
+    if _vector_store is None:
+        _vector_store = VectorStoreManager()
+    return _vector_store
+
+async def close_vector_store():
+    """Close the global vector store."""
+    global _vector_store
+    if _vector_store is not None:
+        _vector_store.close()
+        _vector_store = None
+    return True
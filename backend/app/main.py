@@ -139,6 +139,13 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.error(f"Error stopping Gmail watch scheduler: {e}")
         
+        # Release the shared Pinecone client
+        try:
+            from app.core.vector_store import close_vector_store
+            await close_vector_store()
+        except Exception as e:
+            logger.error(f"Error closing vector store: {e}")
+        
         logger.info("Application shutdown completed")
         
         _health_status["services"]["shutdown"] = "completed"
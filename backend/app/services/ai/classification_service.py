@@ -7,15 +7,17 @@ Uses OpenAI API for real LLM classification.
 
 import json
 import logging
-from typing import Dict, Any, List, Optional, Union
+from typing import Dict, Any, List, Optional, Tuple, Union
 from datetime import datetime, timedelta
 import asyncio
 import uuid
 import openai
 
-from ...core.supabase_config import get_supabase_service_client
+from ...core.supabase_config import get_supabase_service_client, execute_async
 from ...core.config import get_settings
 from .vector_embedding_service import VectorEmbeddingService
+from .project_prefilter import get_project_prefilter
+from .llm_rate_limiter import get_classification_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +37,12 @@ class ClassificationService:
         # Initialize vector embedding service
         self.vector_service = VectorEmbeddingService()
         
+        # First-stage project ranking before the LLM
+        self.project_prefilter = get_project_prefilter()
+        
+        # Shared pacing of classification LLM calls across concurrent requests and batches
+        self.rate_limiter = get_classification_rate_limiter()
+        
         # Classification Agent system prompt
         self.classification_prompt = """CLASSIFICATION AGENT v4.0
 You are a Classification Agent for a production workspace. Your job is to analyze incoming content (emails, Google Drive files, meeting transcripts) and match them to the most relevant existing project using stored project metadata.
@@ -180,50 +188,20 @@ Cross-project collaboration: Match to primary project based on content focus"""
             
             # Get user's projects
             projects = await self._get_user_projects(user_id)
-            if not projects:
-                logger.warning(f"No projects found for user {user_id}")
-                result = self._create_unclassified_result("No projects found for user")
-                await self._log_classification_activity(content, result, user_id, batch_id, start_time, processing_start)
-                return result
-            
-            # Prepare content for LLM analysis
-            llm_content = self._prepare_content_for_llm(content)
             
-            # Get LLM classification
-            classification_result = await self._get_llm_classification(llm_content, projects)
+            processed_result, completed = await self._classify_against_projects(content, projects, user_id)
             
-            if not classification_result:
-                logger.warning("LLM classification failed, marking as unclassified")
-                result = self._create_unclassified_result("LLM classification failed")
-                await self._log_classification_activity(content, result, user_id, batch_id, start_time, processing_start)
-                return result
-            
-            # Validate and process LLM response
-            processed_result = self._process_llm_response(classification_result, content)
-            
-            # Store classification result
-            await self._store_classification_result(content, processed_result, user_id, batch_id)
+            if completed:
+                # Store classification result
+                await self._store_classification_result(content, processed_result, user_id, batch_id)
             
             # Log agent activity
             await self._log_classification_activity(content, processed_result, user_id, batch_id, start_time, processing_start)
             
-            # Log AI processing metrics
-            await self._log_ai_processing(content, processed_result, user_id, start_time, processing_start)
-            
-            # Update document with project_id if classified
-            if processed_result.get('project_id') and not processed_result.get('unclassified', True):
-                await self._update_document_project(content, processed_result['project_id'])
-                
-                # Send to vector embedding pipeline for classified content
-                try:
-                    embedding_result = await self.vector_service.embed_classified_content(
-                        content=content,
-                        classification_result=processed_result,
-                        user_id=user_id
-                    )
-                    logger.info(f"Vector embedding completed: {embedding_result.get('chunks_created', 0)} chunks created")
-                except Exception as e:
-                    logger.error(f"Vector embedding failed: {e}")
+            if completed:
+                # Log AI processing metrics
+                await self._log_ai_processing(content, processed_result, user_id, start_time, processing_start)
+                await self._apply_classification(content, processed_result, user_id)
             
             logger.info(f"Classification completed: {processed_result.get('project_id', 'unclassified')} (confidence: {processed_result.get('confidence', 0)})")
             return processed_result
@@ -234,6 +212,62 @@ Cross-project collaboration: Match to primary project based on content focus"""
             await self._log_classification_activity(content, result, user_id, batch_id, start_time, processing_start)
             return result
     
+    async def _classify_against_projects(
+        self,
+        content: Dict[str, Any],
+        projects: List[Dict[str, Any]],
+        user_id: str
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Classify content against already-fetched projects without writing anything.
+        
+        Returns:
+            Tuple of (result, completed) where completed is False when no projects
+            exist or the LLM returned nothing, i.e. only an agent log should be written
+        """
+        if not projects:
+            logger.warning(f"No projects found for user {user_id}")
+            return self._create_unclassified_result("No projects found for user"), False
+        
+        # Prepare content for LLM analysis
+        llm_content = self._prepare_content_for_llm(content)
+        
+        # Rank projects; a clear single match skips the LLM, otherwise only the top candidates are sent
+        ranked_projects = await self.project_prefilter.rank_projects(llm_content, projects)
+        fast_path_match = self.project_prefilter.fast_path_match(ranked_projects)
+        
+        if fast_path_match:
+            classification_result = self._prefilter_classification(llm_content, fast_path_match)
+        else:
+            candidates = self.project_prefilter.select_candidates(ranked_projects)
+            classification_result = await self._get_llm_classification(llm_content, candidates)
+        
+        if not classification_result:
+            logger.warning("LLM classification failed, marking as unclassified")
+            return self._create_unclassified_result("LLM classification failed"), False
+        
+        # Validate and process LLM response
+        return self._process_llm_response(classification_result, content), True
+    
+    async def _apply_classification(self, content: Dict[str, Any], result: Dict[str, Any], user_id: str):
+        """Assign classified content to its project and send it to the vector embedding pipeline."""
+        if not result.get('project_id') or result.get('unclassified', True):
+            return
+        
+        # Update document with project_id if classified
+        await self._update_document_project(content, result['project_id'])
+        
+        # Send to vector embedding pipeline for classified content
+        try:
+            embedding_result = await self.vector_service.embed_classified_content(
+                content=content,
+                classification_result=result,
+                user_id=user_id
+            )
+            logger.info(f"Vector embedding completed: {embedding_result.get('chunks_created', 0)} chunks created")
+        except Exception as e:
+            logger.error(f"Vector embedding failed: {e}")
+    
     async def classify_content_batch(
         self,
         contents: List[Dict[str, Any]],
@@ -244,6 +278,12 @@ Cross-project collaboration: Match to primary project based on content focus"""
         """
         Classify multiple content items in batch.
         
+        Projects are fetched once for the whole batch and items run concurrently up
+        to classification_batch_concurrency, with LLM calls paced by the shared
+        classification rate limiter. Result and log rows are written with bulk
+        inserts every classification_batch_flush_size items, together with a
+        progress update on the batch row.
+        
         Args:
             contents: List of content items to classify
             user_id: User ID to get projects for
@@ -261,32 +301,67 @@ Cross-project collaboration: Match to primary project based on content focus"""
             # Create classification batch
             batch_id = await self._create_classification_batch(user_id, contents, workflow, priority)
             
-            # Process each content item
-            results = []
-            success_count = 0
-            error_count = 0
+            # Get user's projects once for every item
+            projects = await self._get_user_projects(user_id)
             
-            for content in contents:
-                try:
-                    result = await self.classify_content(content, user_id, batch_id)
-                    results.append(result)
+            results: List[Optional[Dict[str, Any]]] = [None] * len(contents)
+            pending_rows: Dict[str, List[Dict[str, Any]]] = {
+                'classification_results': [],
+                'agent_logs': [],
+                'ai_processing_logs': []
+            }
+            progress = {'processed_count': 0, 'success_count': 0, 'error_count': 0}
+            flush_size = max(1, self.settings.classification_batch_flush_size)
+            semaphore = asyncio.Semaphore(max(1, self.settings.classification_batch_concurrency))
+            
+            async def flush():
+                # Swap the buffers out before awaiting so concurrent items start new ones
+                rows = {table: table_rows for table, table_rows in pending_rows.items() if table_rows}
+                for table in rows:
+                    pending_rows[table] = []
+                await asyncio.gather(*(self._bulk_insert(table, table_rows) for table, table_rows in rows.items()))
+                await self._update_batch_progress(batch_id, dict(progress))
+            
+            async def classify_item(index: int, content: Dict[str, Any]):
+                async with semaphore:
+                    item_start = datetime.now()
+                    try:
+                        result, completed = await self._classify_against_projects(content, projects, user_id)
+                    except Exception as e:
+                        logger.error(f"Error classifying content: {e}")
+                        result, completed = self._create_unclassified_result(f"Error: {str(e)}"), False
                     
+                    if completed:
+                        pending_rows['classification_results'].append(self._classification_result_row(content, result, batch_id))
+                        pending_rows['ai_processing_logs'].append(self._ai_processing_row(content, result, user_id, item_start))
+                    pending_rows['agent_logs'].append(self._agent_log_row(content, result, user_id, batch_id, item_start))
+                    results[index] = result
+                    
+                    progress['processed_count'] += 1
                     if not result.get('unclassified', True):
-                        success_count += 1
+                        progress['success_count'] += 1
                     else:
-                        error_count += 1
-                        
-                except Exception as e:
-                    logger.error(f"Error classifying content: {e}")
-                    error_count += 1
-                    results.append(self._create_unclassified_result(f"Error: {str(e)}"))
+                        progress['error_count'] += 1
+                    should_flush = progress['processed_count'] % flush_size == 0
+                    
+                    if completed:
+                        await self._apply_classification(content, result, user_id)
+                    
+                    if should_flush:
+                        await flush()
+            
+            await asyncio.gather(*(classify_item(i, content) for i, content in enumerate(contents)))
+            await flush()
+            
+            success_count = progress['success_count']
+            error_count = progress['error_count']
             
             # Update batch with results
             await self._update_classification_batch(batch_id, results, success_count, error_count)
             
             processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
             
-            logger.info(f"Batch classification completed: {success_count} successful, {error_count} errors")
+            logger.info(f"Batch classification completed: {success_count} successful, {error_count} errors in {processing_time}ms")
             
             return {
                 'batch_id': batch_id,
@@ -326,10 +401,12 @@ Cross-project collaboration: Match to primary project based on content focus"""
                 'workflow': workflow,
                 'priority': priority,
                 'status': 'pending',
+                'total_count': len(contents),
+                'processed_count': 0,
                 'created_at': datetime.now().isoformat()
             }
             
-            result = self.supabase.table('classification_batches').insert(batch_data).execute()
+            result = await execute_async(self.supabase.table('classification_batches').insert(batch_data))
             
             if result.data:
                 batch_id = result.data[0]['batch_id']
@@ -343,6 +420,19 @@ Cross-project collaboration: Match to primary project based on content focus"""
             # Return a fallback batch ID
             return f"fallback_{uuid.uuid4().hex[:8]}"
     
+    async def _update_batch_progress(self, batch_id: str, progress: Dict[str, int]):
+        """Record how many items of a running batch have been processed."""
+        try:
+            await execute_async(
+                self.supabase.table('classification_batches').update({
+                    **progress,
+                    'status': 'processing',
+                    'updated_at': datetime.now().isoformat()
+                }).eq('batch_id', batch_id)
+            )
+        except Exception as e:
+            logger.error(f"Error updating classification batch progress: {e}")
+    
     async def _update_classification_batch(
         self, 
         batch_id: str, 
@@ -357,15 +447,92 @@ Cross-project collaboration: Match to primary project based on content focus"""
                 'results': results,
                 'success_count': success_count,
                 'error_count': error_count,
-                'completed_at': datetime.now().isoformat()
+                'processed_count': len(results),
+                'completed_at': datetime.now().isoformat(),
+                'updated_at': datetime.now().isoformat()
             }
             
-            self.supabase.table('classification_batches').update(update_data).eq('batch_id', batch_id).execute()
+            await execute_async(self.supabase.table('classification_batches').update(update_data).eq('batch_id', batch_id))
             logger.info(f"Updated classification batch: {batch_id}")
             
         except Exception as e:
             logger.error(f"Error updating classification batch: {e}")
     
+    async def _bulk_insert(self, table: str, rows: List[Dict[str, Any]]):
+        """Insert rows into a table in one request."""
+        try:
+            await execute_async(self.supabase.table(table).insert(rows))
+            logger.info(f"Inserted {len(rows)} rows into {table}")
+        except Exception as e:
+            logger.error(f"Error bulk inserting into {table}: {e}")
+    
+    def _classification_result_row(self, content: Dict[str, Any], result: Dict[str, Any], batch_id: str) -> Dict[str, Any]:
+        """Build a classification_results row."""
+        return {
+            'batch_id': batch_id,
+            'document_id': content.get('source_id'),
+            'classification_result': result,
+            'created_at': datetime.now().isoformat()
+        }
+    
+    def _agent_log_row(
+        self,
+        content: Dict[str, Any],
+        result: Dict[str, Any],
+        user_id: str,
+        batch_id: str,
+        start_time: datetime
+    ) -> Dict[str, Any]:
+        """Build an agent_logs row for a classification."""
+        processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
+        
+        return {
+            'agent_name': 'classification',
+            'input_id': content.get('source_id'),
+            'input_type': content.get('type'),
+            'output': result,
+            'confidence': result.get('confidence', 0.0),
+            'notes': f"Batch: {batch_id}, User: {user_id}, Processing time: {processing_time}ms",
+            'created_at': datetime.now().isoformat()
+        }
+    
+    def _ai_processing_row(
+        self,
+        content: Dict[str, Any],
+        result: Dict[str, Any],
+        user_id: str,
+        start_time: datetime
+    ) -> Dict[str, Any]:
+        """Build an ai_processing_logs row for a classification."""
+        processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
+        
+        # Estimate tokens (rough calculation: 1 token ≈ 4 characters)
+        content_length = len(content.get('content_text', ''))
+        estimated_tokens = content_length // 4
+        
+        # Estimate cost (rough calculation: $0.002 per 1K tokens for GPT-4)
+        estimated_cost = (estimated_tokens / 1000) * 0.002
+        
+        return {
+            'user_id': user_id,
+            'document_id': content.get('source_id'),
+            'processing_type': 'classification',
+            'model_used': 'gpt-4',  # Will be updated when real LLM is integrated
+            'processing_time_ms': processing_time,
+            'tokens_used': estimated_tokens,
+            'cost_estimate': estimated_cost,
+            'success': not result.get('unclassified', True),
+            'error_message': None if not result.get('unclassified', True) else "Classification failed",
+            'result_metadata': {
+                'confidence': result.get('confidence', 0.0),
+                'project_id': result.get('project_id'),
+                'matched_tags': result.get('document', {}).get('matched_tags', []),
+                'inferred_tags': result.get('document', {}).get('inferred_tags', []),
+                'classification_notes': result.get('document', {}).get('classification_notes', '')
+            },
+            'created_at': datetime.now().isoformat()
+        }
+    
     async def _store_classification_result(
         self, 
         content: Dict[str, Any], 
@@ -375,14 +542,9 @@ Cross-project collaboration: Match to primary project based on content focus"""
     ):
         """Store classification result in classification_results table."""
         try:
-            result_data = {
-                'batch_id': batch_id,
-                'document_id': content.get('source_id'),
-                'classification_result': result,
-                'created_at': datetime.now().isoformat()
-            }
+            result_data = self._classification_result_row(content, result, batch_id)
             
-            self.supabase.table('classification_results').insert(result_data).execute()
+            await execute_async(self.supabase.table('classification_results').insert(result_data))
             logger.info(f"Classification result stored for {content.get('type')} {content.get('source_id')}")
             
         except Exception as e:
@@ -399,19 +561,9 @@ Cross-project collaboration: Match to primary project based on content focus"""
     ):
         """Log classification activity in agent_logs table."""
         try:
-            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
+            log_data = self._agent_log_row(content, result, user_id, batch_id, start_time)
             
-            log_data = {
-                'agent_name': 'classification',
-                'input_id': content.get('source_id'),
-                'input_type': content.get('type'),
-                'output': result,
-                'confidence': result.get('confidence', 0.0),
-                'notes': f"Batch: {batch_id}, User: {user_id}, Processing time: {processing_time}ms",
-                'created_at': datetime.now().isoformat()
-            }
-            
-            self.supabase.table('agent_logs').insert(log_data).execute()
+            await execute_async(self.supabase.table('agent_logs').insert(log_data))
             logger.info(f"Classification activity logged for {content.get('type')} {content.get('source_id')}")
             
         except Exception as e:
@@ -427,36 +579,9 @@ Cross-project collaboration: Match to primary project based on content focus"""
     ):
         """Log AI processing metrics in ai_processing_logs table."""
         try:
-            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
-            
-            # Estimate tokens (rough calculation: 1 token ≈ 4 characters)
-            content_length = len(content.get('content_text', ''))
-            estimated_tokens = content_length // 4
-            
-            # Estimate cost (rough calculation: $0.002 per 1K tokens for GPT-4)
-            estimated_cost = (estimated_tokens / 1000) * 0.002
+            log_data = self._ai_processing_row(content, result, user_id, start_time)
             
-            log_data = {
-                'user_id': user_id,
-                'document_id': content.get('source_id'),
-                'processing_type': 'classification',
-                'model_used': 'gpt-4',  # Will be updated when real LLM is integrated
-                'processing_time_ms': processing_time,
-                'tokens_used': estimated_tokens,
-                'cost_estimate': estimated_cost,
-                'success': not result.get('unclassified', True),
-                'error_message': None if not result.get('unclassified', True) else "Classification failed",
-                'result_metadata': {
-                    'confidence': result.get('confidence', 0.0),
-                    'project_id': result.get('project_id'),
-                    'matched_tags': result.get('document', {}).get('matched_tags', []),
-                    'inferred_tags': result.get('document', {}).get('inferred_tags', []),
-                    'classification_notes': result.get('document', {}).get('classification_notes', '')
-                },
-                'created_at': datetime.now().isoformat()
-            }
-            
-            self.supabase.table('ai_processing_logs').insert(log_data).execute()
+            await execute_async(self.supabase.table('ai_processing_logs').insert(log_data))
             logger.info(f"AI processing logged for {content.get('type')} {content.get('source_id')}")
             
         except Exception as e:
@@ -512,31 +637,48 @@ Cross-project collaboration: Match to primary project based on content focus"""
             user_message = f"""Please classify the following content to the most relevant project.
 
 CONTENT TO CLASSIFY:
-{json.dumps(llm_content, indent=2)}
+{json.dumps(llm_content, default=str)}
 
 AVAILABLE PROJECTS:
-{json.dumps(projects, indent=2)}
+{json.dumps([self.project_prefilter.trim_project(project) for project in projects], default=str)}
 
 Please analyze the content and return ONLY a valid JSON response following the exact format specified in the system prompt."""
             
-            # Make the OpenAI API call
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4o",  # Use gpt-4o which supports response_format
-                messages=[
-                    {"role": "system", "content": self.classification_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=0.1,  # Low temperature for consistent classification
-                max_tokens=1000,
-                response_format={"type": "json_object"}
-            )
+            max_tokens = 1000
+            # Reserve prompt tokens (rough calculation: 1 token ≈ 4 characters) plus the completion cap
+            estimated_tokens = (len(self.classification_prompt) + len(user_message)) // 4 + max_tokens
+            
+            for attempt in range(self.settings.classification_rate_limit_retries + 1):
+                reserved_tokens = await self.rate_limiter.acquire(estimated_tokens)
+                try:
+                    # Make the OpenAI API call
+                    response = await self.openai_client.chat.completions.create(
+                        model="gpt-4o",  # Use gpt-4o which supports response_format
+                        messages=[
+                            {"role": "system", "content": self.classification_prompt},
+                            {"role": "user", "content": user_message}
+                        ],
+                        temperature=0.1,  # Low temperature for consistent classification
+                        max_tokens=max_tokens,
+                        response_format={"type": "json_object"}
+                    )
+                    break
+                except openai.RateLimitError:
+                    if attempt >= self.settings.classification_rate_limit_retries:
+                        raise
+                    backoff = 2 ** attempt
+                    logger.warning(f"Classification rate limited, backing off {backoff}s (attempt {attempt + 1})")
+                    self.rate_limiter.penalize(backoff)
+            
+            usage = getattr(response, 'usage', None)
+            self.rate_limiter.record_usage(reserved_tokens, usage.total_tokens if usage else None)
             
             # Extract the response content
             llm_response = response.choices[0].message.content
             logger.info(f"OpenAI API response received: {llm_response[:200]}...")
             
             # Log token usage for cost tracking
-            if hasattr(response, 'usage'):
+            if usage:
                 logger.info(f"Tokens used: {response.usage.total_tokens} (input: {response.usage.prompt_tokens}, output: {response.usage.completion_tokens})")
             
             return llm_response
@@ -547,6 +689,28 @@ Please analyze the content and return ONLY a valid JSON response following the e
             logger.warning("Falling back to mock classification due to API error")
             return self._mock_classification(content, projects)
     
+    def _prefilter_classification(self, content: Dict[str, Any], match: Dict[str, Any]) -> str:
+        """Build a classification response from a clear prefilter match without calling the LLM."""
+        project = match['project']
+        content_text = content.get('content_text', '')
+        evidence = "project name mention" if match['name_match'] else f"keywords {', '.join(match['matched_terms'][:5])}"
+        
+        return json.dumps({
+            "project_id": project.get('id') or project.get('project_id'),
+            "confidence": round(min(match['score'], 0.95), 3),
+            "unclassified": False,
+            "document": {
+                "source": content.get('type', 'email'),
+                "source_id": content.get('source_id', ''),
+                "author": content.get('author', ''),
+                "date": content.get('date', ''),
+                "content_text": content_text[:200] + "..." if len(content_text) > 200 else content_text,
+                "matched_tags": match['matched_terms'][:5],
+                "inferred_tags": [],
+                "classification_notes": f"Prefilter match ({evidence}, embedding similarity {match['embedding_score']:.2f}); LLM skipped"
+            }
+        })
+    
     def _mock_classification(
         self, 
         content: Dict[str, Any], 
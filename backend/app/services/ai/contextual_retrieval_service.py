@@ -4,6 +4,7 @@ Implements contextual embeddings and BM25 for improved RAG retrieval performance
 Based on Anthropic's Contextual Retrieval research.
 """
 
+import asyncio
 import logging
 import re
 import math
@@ -13,9 +14,34 @@ import openai
 from collections import Counter
 
 from ...core.config import get_settings
+from ...core.vector_store import get_vector_store
+from .keyword_index_service import get_keyword_index_service
+from .query_embedding_cache import get_query_embedding_cache
+from .contextual_summary_cache import get_contextual_summary_cache
 
 logger = logging.getLogger(__name__)
 
+# Static instructions sent first so every chunk request shares an identical prompt prefix
+CONTEXT_INSTRUCTIONS = """You situate chunks within a document for the purposes of improving search retrieval.
+Given a document and one chunk of it, give a short, succinct context for the chunk. Focus on:
+- What project this relates to
+- What type of content this is (email, document, meeting)
+- Key people, dates, or entities mentioned
+- The purpose or context of this information
+
+Answer only with the succinct context and nothing else."""
+
+async def run_search_leg(name: str, leg, timeout: float) -> List[Dict[str, Any]]:
+    """Await a retrieval leg with a timeout, returning no results instead of failing the search."""
+    try:
+        return await asyncio.wait_for(leg, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"{name} timed out after {timeout}s, continuing with partial results")
+        return []
+    except Exception as e:
+        logger.error(f"{name} failed: {e}")
+        return []
+
 class ContextualRetrievalService:
     """Service for contextual retrieval using contextual embeddings and BM25."""
     
@@ -26,13 +52,20 @@ class ContextualRetrievalService:
             base_url=self.settings.openai_base_url if hasattr(self.settings, 'openai_base_url') else None
         )
         
+        # Persistent inverted index for project-wide BM25 search
+        self.keyword_index = get_keyword_index_service()
+        self.vector_store = get_vector_store()
+        self.embedding_cache = get_query_embedding_cache()
+        self.summary_cache = get_contextual_summary_cache()
+        
         # BM25 parameters
         self.k1 = 1.2
         self.b = 0.75
         
-        # Document frequency tracking for BM25
+        # Document frequency tracking for ad-hoc BM25 over in-memory documents
         self.doc_freq = {}
         self.total_docs = 0
+        self.avg_doc_length = 100.0
         
     async def create_contextual_chunks(self, content: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
@@ -57,30 +90,22 @@ class ContextualRetrievalService:
             base_chunks = await semantic_chunker.create_semantic_chunks(content_text, content)
             
             # Add contextual information to each chunk
+            context_summaries = await self._generate_chunk_contexts(
+                content_text,
+                [chunk['text'] for chunk in base_chunks],
+                content
+            )
+            
             contextual_chunks = []
-            for i, chunk in enumerate(base_chunks):
-                try:
-                    # Generate contextual summary for this chunk
-                    context_summary = await self._generate_chunk_context(
-                        content_text, 
-                        chunk['text'], 
-                        content
-                    )
-                    
-                    # Create contextual chunk
-                    contextual_chunk = {
-                        **chunk,
-                        'text': f"{context_summary}\n\n{chunk['text']}",
-                        'context_summary': context_summary,
-                        'original_text': chunk['text'],
-                        'chunk_index': i
-                    }
-                    contextual_chunks.append(contextual_chunk)
-                    
-                except Exception as e:
-                    logger.error(f"Error creating contextual chunk {i}: {e}")
-                    # Fallback to original chunk
-                    contextual_chunks.append(chunk)
+            for i, (chunk, context_summary) in enumerate(zip(base_chunks, context_summaries)):
+                # Create contextual chunk
+                contextual_chunks.append({
+                    **chunk,
+                    'text': f"{context_summary}\n\n{chunk['text']}",
+                    'context_summary': context_summary,
+                    'original_text': chunk['text'],
+                    'chunk_index': i
+                })
             
             logger.info(f"Created {len(contextual_chunks)} contextual chunks")
             return contextual_chunks
@@ -89,37 +114,75 @@ class ContextualRetrievalService:
             logger.error(f"Error creating contextual chunks: {e}")
             return []
     
-    async def _generate_chunk_context(self, full_document: str, chunk_text: str, content: Dict[str, Any]) -> str:
-        """Generate contextual summary for a chunk using Claude/GPT."""
+    async def _generate_chunk_contexts(self, full_document: str, chunk_texts: List[str],
+                                       content: Dict[str, Any]) -> List[str]:
+        """
+        Generate contextual summaries for all chunks of a document.
+        
+        Summaries are cached per (document hash, chunk hash), so re-ingesting an
+        unchanged document makes no completion requests. Misses run concurrently up
+        to contextual_summary_concurrency, and every request starts with the same
+        instructions + document messages so the provider can reuse the cached prefix.
+        
+        Returns:
+            Summaries in chunk order, with a basic fallback context where generation failed
+        """
+        # Truncate full document to avoid token limits
+        max_doc_length = self.settings.contextual_chunk_max_length
+        truncated_doc = full_document[:max_doc_length]
+        model = self.settings.contextual_summary_model
+        
+        # The document hash covers everything in the shared prefix, so a prompt or model change misses the cache
+        document_hash = self.summary_cache.hash_text(model, CONTEXT_INSTRUCTIONS, truncated_doc)
+        chunk_hashes = [self.summary_cache.hash_text(chunk_text) for chunk_text in chunk_texts]
+        
+        summaries = await self.summary_cache.get_many(document_hash, chunk_hashes)
+        
+        # Generate each distinct missing chunk once
+        missing = {}
+        for chunk_hash, chunk_text in zip(chunk_hashes, chunk_texts):
+            if chunk_hash not in summaries and chunk_hash not in missing:
+                missing[chunk_hash] = chunk_text
+        
+        if missing:
+            prefix_messages = [
+                {"role": "system", "content": CONTEXT_INSTRUCTIONS},
+                {"role": "user", "content": f"<document>\n{truncated_doc}\n</document>"}
+            ]
+            semaphore = asyncio.Semaphore(max(1, self.settings.contextual_summary_concurrency))
+            
+            async def generate(chunk_text: str) -> Optional[str]:
+                async with semaphore:
+                    return await self._generate_chunk_context(prefix_messages, chunk_text, model)
+            
+            generated = await asyncio.gather(*(generate(chunk_text) for chunk_text in missing.values()))
+            new_summaries = {
+                chunk_hash: summary
+                for chunk_hash, summary in zip(missing.keys(), generated)
+                if summary is not None
+            }
+            await self.summary_cache.set_many(document_hash, new_summaries)
+            summaries.update(new_summaries)
+            
+            logger.info(
+                f"Contextual summaries: {len(chunk_texts)} chunks, {len(chunk_texts) - len(missing)} cached, "
+                f"{len(new_summaries)} generated, {len(missing) - len(new_summaries)} failed"
+            )
+        
+        # Fallback to basic context; failures are not cached so the next ingest retries them
+        fallback = f"Content from {content.get('type', 'document')} - {content.get('title', 'Untitled')}"
+        return [summaries.get(chunk_hash, fallback) for chunk_hash in chunk_hashes]
+    
+    async def _generate_chunk_context(self, prefix_messages: List[Dict[str, str]], chunk_text: str,
+                                      model: str) -> Optional[str]:
+        """Generate contextual summary for one chunk after the shared document prefix."""
         try:
-            # Truncate full document to avoid token limits
-            max_doc_length = self.settings.contextual_chunk_max_length
-            truncated_doc = full_document[:max_doc_length] if len(full_document) > max_doc_length else full_document
-            
-            # Create context prompt
-            context_prompt = f"""
-<document>
-{truncated_doc}
-</document>
-
-Here is the chunk we want to situate within the whole document:
-<chunk>
-{chunk_text}
-</chunk>
-
-Please give a short, succinct context to situate this chunk within the overall document for the purposes of improving search retrieval. Focus on:
-- What project this relates to
-- What type of content this is (email, document, meeting)
-- Key people, dates, or entities mentioned
-- The purpose or context of this information
-
-Answer only with the succinct context and nothing else.
-"""
-            
-            # Use GPT-4o-mini for cost efficiency
             response = await self.openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": context_prompt}],
+                model=model,
+                messages=prefix_messages + [{
+                    "role": "user",
+                    "content": f"Here is the chunk we want to situate within the whole document:\n<chunk>\n{chunk_text}\n</chunk>"
+                }],
                 max_tokens=self.settings.contextual_summary_max_tokens,
                 temperature=self.settings.contextual_temperature
             )
@@ -130,8 +193,7 @@ Answer only with the succinct context and nothing else.
             
         except Exception as e:
             logger.error(f"Error generating chunk context: {e}")
-            # Fallback to basic context
-            return f"Content from {content.get('type', 'document')} - {content.get('title', 'Untitled')}"
+            return None
     
     def _extract_best_content(self, content: Dict[str, Any]) -> str:
         """Extract the best available content for chunking."""
@@ -217,13 +279,17 @@ Answer only with the succinct context and nothing else.
         """Calculate document frequencies for IDF calculation."""
         self.doc_freq = {}
         self.total_docs = len(documents)
+        total_length = 0
         
         for doc in documents:
             text = doc.get('text', '') or doc.get('original_text', '')
             if text:
-                words = set(re.findall(r'\b[a-zA-Z]+\b', text.lower()))
-                for word in words:
+                words = re.findall(r'\b[a-zA-Z]+\b', text.lower())
+                total_length += len(words)
+                for word in set(words):
                     self.doc_freq[word] = self.doc_freq.get(word, 0) + 1
+        
+        self.avg_doc_length = (total_length / self.total_docs) if self.total_docs and total_length else 100.0
     
     def _calculate_bm25_score(self, content: str, keywords: List[str]) -> float:
         """Calculate BM25 score for content against keywords."""
@@ -240,8 +306,7 @@ Answer only with the succinct context and nothing else.
             term_freq = Counter(content_words)
             doc_length = len(content_words)
             
-            # Calculate average document length
-            avg_doc_length = 100  # Simplified assumption
+            avg_doc_length = self.avg_doc_length
             
             # Calculate BM25 score
             score = 0.0
@@ -288,19 +353,23 @@ Answer only with the succinct context and nothing else.
         try:
             logger.info(f"Performing hybrid contextual search for query: {query[:100]}...")
             
-            # Step 1: Get contextual embeddings from Pinecone
-            semantic_results = await self._contextual_semantic_search(query, project_id, user_id)
+            # Step 1: Run the semantic (Pinecone) and BM25 (inverted index) legs concurrently
+            semantic_results, bm25_results = await asyncio.gather(
+                run_search_leg(
+                    "Contextual semantic search",
+                    self._contextual_semantic_search(query, project_id, user_id),
+                    self.settings.semantic_search_timeout
+                ),
+                run_search_leg(
+                    "Contextual BM25 search",
+                    self._indexed_bm25_search(query, project_id),
+                    self.settings.keyword_search_timeout
+                )
+            )
             logger.info(f"Contextual semantic search returned {len(semantic_results)} results")
-            
-            # Step 2: Get documents for contextual BM25 search
-            documents = await self._get_project_documents(project_id, user_id)
-            logger.info(f"Retrieved {len(documents)} documents for BM25 search")
-            
-            # Step 3: Perform contextual BM25 search
-            bm25_results = await self.contextual_bm25_search(query, documents)
             logger.info(f"Contextual BM25 search returned {len(bm25_results)} results")
             
-            # Step 4: Combine and rerank results
+            # Step 2: Combine and rerank results
             combined_results = self._combine_contextual_results(semantic_results, bm25_results)
             logger.info(f"Combined results: {len(combined_results)}")
             
@@ -313,21 +382,11 @@ Answer only with the succinct context and nothing else.
     async def _contextual_semantic_search(self, query: str, project_id: str, user_id: str) -> List[Dict[str, Any]]:
         """Perform semantic search on contextualized embeddings."""
         try:
-            # Generate query embedding
-            query_embedding = await self.openai_client.embeddings.create(
-                model=self.settings.embedding_model_choice,
-                input=query,
-                encoding_format="float"
-            )
-            
-            query_vector = query_embedding.data[0].embedding
+            # Generate query embedding (cached per normalized query)
+            query_vector = await self.embedding_cache.get_embedding(self.openai_client, query)
             
             # Search Pinecone
-            from pinecone import Pinecone
-            pinecone = Pinecone(api_key=self.settings.pinecone_api_key)
-            index = pinecone.Index(self.settings.pinecone_vector_store)
-            
-            search_results = index.query(
+            search_results = await self.vector_store.query(
                 vector=query_vector,
                 filter={
                     'user_id': user_id,
@@ -354,32 +413,38 @@ Answer only with the succinct context and nothing else.
             logger.error(f"Error in contextual semantic search: {e}")
             return []
     
-    async def _get_project_documents(self, project_id: str, user_id: str) -> List[Dict[str, Any]]:
-        """Get all documents for a project for BM25 search."""
+    async def _indexed_bm25_search(self, query: str, project_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Perform BM25 search using the persistent per-project keyword index."""
         try:
-            from ...core.supabase_config import get_supabase_service_client
-            supabase = get_supabase_service_client()
-            
-            # Query documents table
-            result = supabase.table('documents').select('*').eq('project_id', project_id).execute()
-            
-            documents = []
-            if result.data:
-                for doc in result.data:
-                    content_text = self._extract_best_content(doc)
-                    if content_text:
-                        documents.append({
-                            'id': doc['id'],
-                            'text': content_text,  # This will be contextualized
-                            'original_text': content_text,
-                            'metadata': doc,
-                            'type': doc.get('type', 'document')
-                        })
+            hits = await self.keyword_index.search(project_id, query, limit=limit)
+            if not hits:
+                return []
+            
+            # Only the top hits are fetched from Supabase
+            records = await self.keyword_index.fetch_records(hits)
             
-            return documents
+            results = []
+            for hit in hits:
+                record = records.get((hit['source_type'], hit['document_id']))
+                if not record:
+                    continue
+                
+                content_text = self.keyword_index.extract_content_text(record)
+                results.append({
+                    'id': hit['document_id'],
+                    'score': hit['score'],
+                    'content': content_text,
+                    'original_content': content_text,
+                    'context_summary': '',
+                    'metadata': record,
+                    'search_type': 'contextual_bm25',
+                    'keywords_matched': hit['keywords_matched']
+                })
+            
+            return results
             
         except Exception as e:
-            logger.error(f"Error getting project documents: {e}")
+            logger.error(f"Error in indexed BM25 search: {e}")
             return []
     
     def _combine_contextual_results(self, semantic_results: List[Dict[str, Any]], 
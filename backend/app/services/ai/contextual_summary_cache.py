@@ -0,0 +1,125 @@
+"""
+Contextual Summary Cache
+Caches contextual chunk summaries per (document hash, chunk hash) in process and in Supabase.
+"""
+
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional
+
+from ...core.config import get_settings
+from ...core.supabase_config import get_supabase_service_client, execute_async
+
+logger = logging.getLogger(__name__)
+
+class ContextualSummaryCache:
+    """LRU cache of chunk summaries backed by the contextual_chunk_summaries table."""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.supabase = get_supabase_service_client()
+        self.max_entries = self.settings.contextual_summary_cache_max_entries
+        self.lookup_batch_size = 200
+
+        # (document_hash, chunk_hash) -> summary
+        self._entries: "OrderedDict[tuple, str]" = OrderedDict()
+
+        self._metrics = {
+            'hits': 0,
+            'misses': 0,
+            'stored_hits': 0,
+            'evictions': 0,
+            'store_errors': 0
+        }
+
+    @staticmethod
+    def hash_text(*parts: str) -> str:
+        """Hash text parts joined with NUL separators."""
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    async def get_many(self, document_hash: str, chunk_hashes: Iterable[str]) -> Dict[str, str]:
+        """Get cached summaries for chunks of a document, keyed by chunk hash."""
+        found: Dict[str, str] = {}
+        missing: List[str] = []
+        for chunk_hash in dict.fromkeys(chunk_hashes):
+            summary = self._entries.get((document_hash, chunk_hash))
+            if summary is None:
+                missing.append(chunk_hash)
+            else:
+                self._entries.move_to_end((document_hash, chunk_hash))
+                found[chunk_hash] = summary
+
+        stored = await self._get_stored(document_hash, missing) if missing else {}
+        for chunk_hash, summary in stored.items():
+            self._set_local(document_hash, chunk_hash, summary)
+        found.update(stored)
+
+        self._metrics['stored_hits'] += len(stored)
+        self._metrics['hits'] += len(found)
+        self._metrics['misses'] += len(missing) - len(stored)
+        return found
+
+    async def set_many(self, document_hash: str, summaries: Dict[str, str]):
+        """Cache newly generated summaries for chunks of a document."""
+        if not summaries:
+            return
+
+        for chunk_hash, summary in summaries.items():
+            self._set_local(document_hash, chunk_hash, summary)
+
+        try:
+            await execute_async(
+                self.supabase.table('contextual_chunk_summaries').upsert(
+                    [
+                        {'document_hash': document_hash, 'chunk_hash': chunk_hash, 'summary': summary}
+                        for chunk_hash, summary in summaries.items()
+                    ],
+                    on_conflict='document_hash,chunk_hash'
+                )
+            )
+        except Exception as e:
+            self._metrics['store_errors'] += 1
+            logger.error(f"Error storing contextual summaries for document {document_hash[:12]}: {e}")
+
+    async def _get_stored(self, document_hash: str, chunk_hashes: List[str]) -> Dict[str, str]:
+        found = {}
+        try:
+            for i in range(0, len(chunk_hashes), self.lookup_batch_size):
+                result = await execute_async(
+                    self.supabase.table('contextual_chunk_summaries')
+                    .select('chunk_hash, summary')
+                    .eq('document_hash', document_hash)
+                    .in_('chunk_hash', chunk_hashes[i:i + self.lookup_batch_size])
+                )
+                for row in result.data or []:
+                    found[row['chunk_hash']] = row['summary']
+        except Exception as e:
+            logger.error(f"Error reading contextual summaries for document {document_hash[:12]}: {e}")
+        return found
+
+    def _set_local(self, document_hash: str, chunk_hash: str, summary: str):
+        key = (document_hash, chunk_hash)
+        self._entries[key] = summary
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._metrics['evictions'] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters."""
+        metrics = dict(self._metrics)
+        lookups = metrics['hits'] + metrics['misses']
+        metrics['hit_rate'] = metrics['hits'] / lookups if lookups else 0.0
+        metrics['entries'] = len(self._entries)
+        return metrics
+
+# Global contextual summary cache instance
+_contextual_summary_cache: Optional[ContextualSummaryCache] = None
+
+def get_contextual_summary_cache() -> ContextualSummaryCache:
+    """Get the global contextual summary cache instance."""
+    global _contextual_summary_cache
+    if _contextual_summary_cache is None:
+        _contextual_summary_cache = ContextualSummaryCache()
+    return _contextual_summary_cache
@@ -27,10 +27,12 @@ class SentenceTransformer:
         if isinstance(sentences, str):
             sentences = [sentences]
         return np.random.rand(len(sentences), self._dimension).tolist()
-import pinecone
 from pydantic import BaseModel
 
 from ...core.config import get_settings
+from ...core.supabase_config import get_supabase_service_client, execute_async
+from ...core.vector_store import get_vector_store
+from .retrieval_cache import get_retrieval_cache
 
 logger = logging.getLogger(__name__)
 
@@ -75,6 +77,8 @@ class EmbeddingService:
         self.model_name = "all-MiniLM-L6-v2"  # Default model
         self.model = None
         self.pinecone_index = None
+        self.vector_store = get_vector_store()
+        self.index_name = self.settings.pinecone_index_name
         self._initialized = False
         
         logger.info(f"Embedding Service initialized with model: {self.model_name}")
@@ -89,24 +93,12 @@ class EmbeddingService:
             logger.info("Loading sentence transformer model...")
             self.model = SentenceTransformer(self.model_name)
             
-            # Initialize Pinecone
+            # Get or create index through the shared Pinecone client
             logger.info("Initializing Pinecone...")
-            pinecone.init(
-                api_key=self.settings.pinecone_api_key,
-                environment=self.settings.pinecone_environment
+            self.pinecone_index = self.vector_store.ensure_index(
+                self.index_name,
+                dimension=self.model.get_sentence_embedding_dimension()
             )
-            
-            # Get or create index
-            index_name = self.settings.pinecone_index_name
-            if index_name not in pinecone.list_indexes():
-                logger.info(f"Creating Pinecone index: {index_name}")
-                pinecone.create_index(
-                    name=index_name,
-                    dimension=self.model.get_sentence_embedding_dimension(),
-                    metric="cosine"
-                )
-            
-            self.pinecone_index = pinecone.Index(index_name)
             self._initialized = True
             
             logger.info("Embedding service initialized successfully")
@@ -203,7 +195,11 @@ class EmbeddingService:
                 vectors.append(vector_data)
             
             # Upsert vectors to Pinecone
-            self.pinecone_index.upsert(vectors=vectors)
+            await self.vector_store.upsert(vectors, index_name=self.index_name)
+            
+            # Invalidate cached retrieval results for affected projects
+            for project_id in {chunk.project_id for chunk in chunks if chunk.project_id}:
+                await get_retrieval_cache().bump_corpus_version(project_id)
             
             logger.info(f"Stored {len(chunks)} document chunks in Pinecone")
             return True
@@ -254,11 +250,12 @@ class EmbeddingService:
                 filter_dict["project_id"] = project_id
             
             # Search in Pinecone
-            search_results = self.pinecone_index.query(
+            search_results = await self.vector_store.query(
                 vector=query_vector,
                 top_k=top_k,
                 include_metadata=True,
-                filter=filter_dict if filter_dict else None
+                filter=filter_dict if filter_dict else None,
+                index_name=self.index_name
             )
             
             # Process results
@@ -315,11 +312,12 @@ class EmbeddingService:
         
         try:
             # Search for similar chunks within the same document
-            search_results = self.pinecone_index.query(
+            search_results = await self.vector_store.query(
                 vector=chunk_embedding,
                 top_k=top_k,
                 include_metadata=True,
-                filter={"document_id": document_id}
+                filter={"document_id": document_id},
+                index_name=self.index_name
             )
             
             # Process results
@@ -369,7 +367,12 @@ class EmbeddingService:
         
         try:
             # Delete vectors by metadata filter
-            self.pinecone_index.delete(filter={"document_id": document_id})
+            await self.vector_store.delete(filter={"document_id": document_id}, index_name=self.index_name)
+            
+            # Clear the chunk manifest for the document as well
+            await execute_async(
+                get_supabase_service_client().table('vector_chunk_manifest').delete().eq('source_id', document_id)
+            )
             
             logger.info(f"Deleted vectors for document: {document_id}")
             return True
@@ -389,7 +392,7 @@ class EmbeddingService:
             await self.initialize()
         
         try:
-            stats = self.pinecone_index.describe_index_stats()
+            stats = await self.vector_store.describe_index_stats(index_name=self.index_name)
             return {
                 "total_vector_count": stats.total_vector_count,
                 "dimension": stats.dimension,
@@ -10,6 +10,7 @@ from datetime import datetime
 
 from ...core.config import get_settings
 from .semantic_chunking_service import SemanticChunkingService
+from .token_chunking import TokenizedText, LEVEL_BOUNDARY_PATTERNS
 
 logger = logging.getLogger(__name__)
 
@@ -46,17 +47,31 @@ class HierarchicalChunkingService:
         }
     
     async def create_hierarchical_chunks(self, text: str, content: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Create multiple levels of chunks for different retrieval needs."""
+        """
+        Create multiple levels of chunks for different retrieval needs.
+        
+        The text is tokenized once and boundary patterns are scanned once; each
+        level is then chunked within the spans of the level above it, so every
+        chunk records its parent_chunk_id and child_chunk_ids.
+        """
         try:
             logger.info(f"Creating hierarchical chunks for content type: {content.get('type', 'unknown')}")
             
+            tokenized = TokenizedText(text, self.tokenizer)
             all_chunks = []
             
-            # Create chunks at each level
+            # Create chunks at each level, nested inside the chunks of the previous level
+            parents: List[Optional[Dict[str, Any]]] = [None]
             for level_name, config in self.levels.items():
-                level_chunks = await self._create_level_chunks(text, content, level_name, config)
+                level_chunks = []
+                for parent in parents:
+                    level_chunks.extend(self._create_level_chunks(tokenized, content, level_name, config, parent))
                 all_chunks.extend(level_chunks)
                 logger.info(f"Created {len(level_chunks)} chunks at {level_name} level")
+                
+                if not level_chunks:
+                    break
+                parents = level_chunks
             
             # Post-process to remove duplicates and optimize
             optimized_chunks = self._optimize_hierarchical_chunks(all_chunks)
@@ -69,63 +84,67 @@ class HierarchicalChunkingService:
             # Fallback to semantic chunking
             return await self.semantic_chunker.create_semantic_chunks(text, content)
     
-    async def _create_level_chunks(self, text: str, content: Dict[str, Any], level: str, config: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Create chunks at a specific level."""
+    def _create_level_chunks(self, tokenized: TokenizedText, content: Dict[str, Any], level: str,
+                             config: Dict[str, Any], parent: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Create chunks at a specific level within a parent chunk's token span (or the whole text)."""
         try:
-            # Tokenize the content
-            tokens = self.tokenizer.encode(text)
+            span_start = parent['start_token'] if parent else 0
+            span_end = parent['end_token'] if parent else len(tokenized)
             
-            if len(tokens) <= config['max_tokens']:
+            if span_end - span_start <= config['max_tokens']:
                 # Content fits in one chunk at this level
-                return [self._create_single_level_chunk(text, content, level, config)]
+                chunk = self._create_level_chunk(
+                    tokenized.slice_text(span_start, span_end).strip(), content, level, config,
+                    span_start, span_end, span_end - span_start, parent
+                )
+                chunk['chunk_type'] = f'hierarchical_{level}_single'
+                return [chunk]
             
-            chunks = []
-            start = 0
+            windows = tokenized.iter_windows(
+                config['max_tokens'], config['overlap'], LEVEL_BOUNDARY_PATTERNS[level], span_start, span_end
+            )
+            spans = []
+            for start, end in windows:
+                if spans and start > spans[-1][1]:
+                    # A window that ended early on a boundary leaves a gap before the next; close it
+                    spans[-1] = (spans[-1][0], start)
+                if spans and end - start < config['max_tokens'] * 0.3:  # Under 30% of max size
+                    # Fold a short window into the previous one so its text is still covered at this level
+                    spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+                else:
+                    spans.append((start, end))
             
-            while start < len(tokens):
-                # Calculate chunk end position
-                end = min(start + config['max_tokens'], len(tokens))
-                
-                # Try to find a good semantic boundary
-                if end < len(tokens):
-                    end = self._find_level_boundary(tokens, start, end, level)
-                
-                # Extract chunk tokens
-                chunk_tokens = tokens[start:end]
-                chunk_text = self.tokenizer.decode(chunk_tokens).strip()
-                
-                # Skip chunks that are too small
-                if len(chunk_tokens) >= config['max_tokens'] * 0.3:  # At least 30% of max size
-                    chunk = self._create_level_chunk(
-                        chunk_text, content, level, config, 
-                        start, end, len(chunk_tokens)
-                    )
-                    chunks.append(chunk)
-                
-                # Move to next chunk with overlap
-                start = max(start + config['max_tokens'] - config['overlap'], end - config['overlap'])
-                
-                # Break if we've covered most of the content
-                if start >= len(tokens) - config['overlap']:
-                    break
+            # The window loop can stop short of the span end; the last chunk takes the tail
+            if spans and spans[-1][1] < span_end:
+                spans[-1] = (spans[-1][0], span_end)
             
-            return chunks
+            return [
+                self._create_level_chunk(
+                    tokenized.slice_text(start, end).strip(), content, level, config,
+                    start, end, end - start, parent
+                )
+                for start, end in spans
+            ]
             
         except Exception as e:
             logger.error(f"Error creating {level} level chunks: {e}")
             return []
     
     def _create_level_chunk(self, text: str, content: Dict[str, Any], level: str, config: Dict[str, Any], 
-                          start: int, end: int, token_count: int) -> Dict[str, Any]:
-        """Create a single chunk at a specific level."""
+                          start: int, end: int, token_count: int,
+                          parent: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Create a single chunk at a specific level, linked to its parent chunk."""
         
         # Add level-specific context enrichment
         enriched_text = self._enrich_level_context(text, content, level)
         
-        return {
+        chunk = {
             'text': enriched_text,
             'original_text': text,
             'level': level,
+            'chunk_id': f"{level}_{start}_{end}",
+            'parent_chunk_id': parent['chunk_id'] if parent else None,
+            'child_chunk_ids': [],
             'start_token': start,
             'end_token': end,
             'token_count': token_count,
@@ -136,83 +155,11 @@ class HierarchicalChunkingService:
             'chunk_quality': self._calculate_level_quality(text, token_count, level),
             'hierarchical_metadata': self._create_hierarchical_metadata(content, level)
         }
-    
-    def _create_single_level_chunk(self, text: str, content: Dict[str, Any], level: str, config: Dict[str, Any]) -> Dict[str, Any]:
-        """Create a single chunk when content fits at this level."""
-        token_count = len(self.tokenizer.encode(text))
-        enriched_text = self._enrich_level_context(text, content, level)
-        
-        return {
-            'text': enriched_text,
-            'original_text': text,
-            'level': level,
-            'start_token': 0,
-            'end_token': token_count,
-            'token_count': token_count,
-            'chunk_type': f'hierarchical_{level}_single',
-            'source_type': content.get('type', 'unknown'),
-            'description': config['description'],
-            'context_summary': self._generate_level_summary(text, level),
-            'chunk_quality': self._calculate_level_quality(text, token_count, level),
-            'hierarchical_metadata': self._create_hierarchical_metadata(content, level)
-        }
-    
-    def _find_level_boundary(self, tokens: List[int], start: int, max_end: int, level: str) -> int:
-        """Find the best boundary for a specific level."""
-        text = self.tokenizer.decode(tokens[start:max_end])
         
-        # Level-specific boundary patterns
-        if level == 'document':
-            patterns = [
-                r'\n\n+',  # Double newlines
-                r'\.\s*\n',  # Period + newline
-                r'!\s*\n',   # Exclamation + newline
-                r'\?\s*\n',  # Question + newline
-            ]
-        elif level == 'section':
-            patterns = [
-                r'\n+',      # Newlines
-                r'\.\s+',    # Period + space
-                r';\s+',     # Semicolon + space
-                r':\s+',     # Colon + space
-            ]
-        elif level == 'paragraph':
-            patterns = [
-                r'\.\s+',    # Period + space
-                r'!\s+',     # Exclamation + space
-                r'\?\s+',    # Question + space
-                r';\s+',     # Semicolon + space
-            ]
-        else:  # sentence level
-            patterns = [
-                r'\.\s+',    # Period + space
-                r'!\s+',     # Exclamation + space
-                r'\?\s+',    # Question + space
-            ]
+        if parent:
+            parent['child_chunk_ids'].append(chunk['chunk_id'])
         
-        best_boundary = max_end
-        best_position = 0
-        
-        for pattern in patterns:
-            import re
-            matches = list(re.finditer(pattern, text))
-            if matches:
-                # Find the last match that's not too close to the start
-                for match in reversed(matches):
-                    position = match.end()
-                    if position > len(text) * 0.3:  # At least 30% into the chunk
-                        # Convert character position back to token position
-                        char_start = 0
-                        for i, token in enumerate(tokens[start:max_end]):
-                            if char_start >= position:
-                                best_boundary = start + i
-                                break
-                            char_start += len(self.tokenizer.decode([token]))
-                        break
-                if best_boundary < max_end:
-                    break
-        
-        return best_boundary
+        return chunk
     
     def _enrich_level_context(self, text: str, content: Dict[str, Any], level: str) -> str:
         """Enrich chunk with level-specific context."""
@@ -323,15 +270,37 @@ class HierarchicalChunkingService:
         if not chunks:
             return chunks
         
-        # Remove exact duplicates
-        seen_texts = set()
+        # Remove exact duplicates, keeping the highest-level copy. A dropped chunk's
+        # links are redirected to the copy that was kept.
+        kept_by_text: Dict[str, Dict[str, Any]] = {}
+        replaced: Dict[str, str] = {}
         unique_chunks = []
         
         for chunk in chunks:
             chunk_text = chunk['original_text']
-            if chunk_text not in seen_texts:
-                seen_texts.add(chunk_text)
+            kept = kept_by_text.get(chunk_text)
+            if kept is None:
+                kept_by_text[chunk_text] = chunk
                 unique_chunks.append(chunk)
+            else:
+                replaced[chunk['chunk_id']] = kept['chunk_id']
+        
+        if replaced:
+            def resolve(chunk_id: Optional[str]) -> Optional[str]:
+                while chunk_id in replaced:
+                    chunk_id = replaced[chunk_id]
+                return chunk_id
+            
+            for chunk in unique_chunks:
+                parent_id = resolve(chunk.get('parent_chunk_id'))
+                chunk['parent_chunk_id'] = parent_id if parent_id != chunk['chunk_id'] else None
+            
+            children: Dict[str, List[str]] = {chunk['chunk_id']: [] for chunk in unique_chunks}
+            for chunk in unique_chunks:
+                if chunk['parent_chunk_id'] in children:
+                    children[chunk['parent_chunk_id']].append(chunk['chunk_id'])
+            for chunk in unique_chunks:
+                chunk['child_chunk_ids'] = children[chunk['chunk_id']]
         
         # Sort by level priority and quality
         level_priority = {'document': 1, 'section': 2, 'paragraph': 3, 'sentence': 4}
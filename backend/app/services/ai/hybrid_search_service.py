@@ -3,17 +3,18 @@ Hybrid Search Service
 Combines semantic and keyword search for better retrieval performance.
 """
 
+import asyncio
 import logging
-import re
-import math
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 import openai
-from collections import Counter
 
 from ...core.config import get_settings
+from ...core.vector_store import get_vector_store
 from .query_optimization_service import QueryOptimizationService
-from .contextual_retrieval_service import ContextualRetrievalService
+from .contextual_retrieval_service import ContextualRetrievalService, run_search_leg
+from .keyword_index_service import get_keyword_index_service
+from .query_embedding_cache import get_query_embedding_cache
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +29,9 @@ class HybridSearchService:
         )
         self.query_optimizer = QueryOptimizationService()
         self.contextual_retrieval = ContextualRetrievalService()
+        self.keyword_index = get_keyword_index_service()
+        self.vector_store = get_vector_store()
+        self.embedding_cache = get_query_embedding_cache()
         
         # Hybrid search weights
         self.semantic_weight = self.settings.semantic_weight
@@ -37,10 +41,6 @@ class HybridSearchService:
         self.max_semantic_results = 20
         self.max_keyword_results = 20
         self.final_max_results = 10
-        
-        # BM25 parameters for keyword search
-        self.k1 = 1.2
-        self.b = 0.75
     
     async def hybrid_search(self, query: str, project_id: str, user_id: str, 
                           max_results: int = 10, context: Dict[str, Any] = None) -> List[Dict[str, Any]]:
@@ -60,16 +60,20 @@ class HybridSearchService:
             # Fallback to original hybrid search if contextual retrieval fails
             logger.warning("Contextual retrieval failed, falling back to original hybrid search")
             
-            # Step 1: Optimize the query
-            query_optimization = await self.query_optimizer.optimize_query(query, context or {})
-            optimized_queries = query_optimization.get('optimized_queries', [query])
-            
-            # Step 2: Perform semantic search
-            semantic_results = await self._semantic_search(optimized_queries, project_id, user_id)
+            # Steps 1-3: Optimize the query and run semantic search, concurrently with keyword search
+            semantic_results, keyword_results = await asyncio.gather(
+                run_search_leg(
+                    "Semantic search",
+                    self._optimized_semantic_search(query, project_id, user_id, context),
+                    self.settings.semantic_search_timeout
+                ),
+                run_search_leg(
+                    "Keyword search",
+                    self._keyword_search(query, project_id, user_id),
+                    self.settings.keyword_search_timeout
+                )
+            )
             logger.info(f"Semantic search returned {len(semantic_results)} results")
-            
-            # Step 3: Perform keyword search
-            keyword_results = await self._keyword_search(query, project_id, user_id)
             logger.info(f"Keyword search returned {len(keyword_results)} results")
             
             # Step 4: Combine and rerank results
@@ -86,27 +90,26 @@ class HybridSearchService:
             # Fallback to semantic search only
             return await self._fallback_semantic_search(query, project_id, user_id, max_results)
     
+    async def _optimized_semantic_search(self, query: str, project_id: str, user_id: str,
+                                         context: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Optimize the query, then run semantic search over its variants."""
+        query_optimization = await self.query_optimizer.optimize_query(query, context or {})
+        optimized_queries = query_optimization.get('optimized_queries', [query])
+        return await self._semantic_search(optimized_queries, project_id, user_id)
+    
     async def _semantic_search(self, queries: List[str], project_id: str, user_id: str) -> List[Dict[str, Any]]:
         """Perform semantic search using multiple query variants."""
         try:
-            all_results = []
+            variants = queries[:3]  # Use top 3 optimized queries
+            if not variants:
+                return []
             
-            for query in queries[:3]:  # Use top 3 optimized queries
-                # Generate query embedding
-                query_embedding = await self.openai_client.embeddings.create(
-                    model=self.settings.embedding_model_choice,
-                    input=query,
-                    encoding_format="float"
-                )
-                
-                query_vector = query_embedding.data[0].embedding
-                
-                # Search Pinecone
-                from pinecone import Pinecone
-                pinecone = Pinecone(api_key=self.settings.pinecone_api_key)
-                index = pinecone.Index(self.settings.pinecone_vector_store)
-                
-                search_results = index.query(
+            # Embed uncached query variants in a single batched request
+            query_vectors = await self.embedding_cache.get_embeddings(self.openai_client, variants)
+            
+            # Query Pinecone for every variant concurrently over the shared index handle
+            search_responses = await asyncio.gather(*[
+                self.vector_store.query(
                     vector=query_vector,
                     filter={
                         'user_id': user_id,
@@ -115,6 +118,14 @@ class HybridSearchService:
                     top_k=self.max_semantic_results,
                     include_metadata=True
                 )
+                for query_vector in query_vectors
+            ], return_exceptions=True)
+            
+            all_results = []
+            for query, search_results in zip(variants, search_responses):
+                if isinstance(search_results, Exception):
+                    logger.error(f"Semantic search failed for query variant '{query[:50]}': {search_results}")
+                    continue
                 
                 # Process results
                 for match in search_results.matches:
@@ -137,176 +148,56 @@ class HybridSearchService:
             return []
     
     async def _keyword_search(self, query: str, project_id: str, user_id: str) -> List[Dict[str, Any]]:
-        """Perform keyword search using BM25-style scoring."""
+        """Perform keyword search using BM25 scoring over the project's inverted index."""
         try:
-            # Extract keywords from query
-            keywords = self._extract_keywords(query)
-            
-            if not keywords:
+            # Score only the postings of the query terms
+            hits = await self.keyword_index.search(project_id, query, limit=self.max_keyword_results)
+            if not hits:
                 return []
             
-            # Get all documents for the project
-            from ...core.supabase_config import get_supabase_service_client
-            supabase = get_supabase_service_client()
-            
-            # Query documents table (contains all content types: emails, documents, meetings)
-            documents_result = supabase.table('documents').select('*').eq('project_id', project_id).execute()
-            
-            # Query meetings table for additional metadata
-            meetings_result = supabase.table('meetings').select('*').eq('project_id', project_id).execute()
-            
-            # Combine all content
-            all_content = []
-            
-            # Process documents (contains all content types: emails, documents, meetings)
-            if documents_result.data:
-                for doc in documents_result.data:
-                    content_text = self._extract_content_text(doc)
-                    if content_text:
-                        # Determine content type and title based on document type
-                        doc_type = doc.get('type', 'document')
-                        if doc_type == 'email':
-                            title = doc.get('title', 'No Subject')  # For emails, title is the subject
-                        elif doc_type == 'meeting_transcript':
-                            title = doc.get('title', 'Untitled Meeting')
-                        else:
-                            title = doc.get('title', 'Untitled Document')
-                        
-                        all_content.append({
-                            'id': f"doc_{doc['id']}",
-                            'content': content_text,
-                            'title': title,
-                            'type': doc_type,
-                            'metadata': doc
-                        })
-            
-            # Process meetings table for additional metadata (if needed)
-            if meetings_result.data:
-                for meeting in meetings_result.data:
-                    # Only add if not already processed from documents table
-                    meeting_id = meeting.get('id')
-                    if not any(item['metadata'].get('meeting_id') == meeting_id for item in all_content):
-                        content_text = self._extract_content_text(meeting)
-                        if content_text:
-                            all_content.append({
-                                'id': f"meeting_{meeting['id']}",
-                                'content': content_text,
-                                'title': meeting.get('title', 'Untitled Meeting'),
-                                'type': 'meeting',
-                                'metadata': meeting
-                            })
-            
-            # Calculate BM25 scores
+            # Fetch content for the top hits only
+            records = await self.keyword_index.fetch_records(hits)
+            
             scored_results = []
-            for item in all_content:
-                score = self._calculate_bm25_score(item['content'], keywords)
-                if score > 0:
-                    scored_results.append({
-                        'id': item['id'],
-                        'score': score,
-                        'content': item['content'],
-                        'title': item['title'],
-                        'type': item['type'],
-                        'metadata': item['metadata'],
-                        'search_type': 'keyword',
-                        'keywords_matched': self._get_matched_keywords(item['content'], keywords)
-                    })
-            
-            # Sort by score and return top results
-            scored_results.sort(key=lambda x: x['score'], reverse=True)
-            return scored_results[:self.max_keyword_results]
+            for hit in hits:
+                record = records.get((hit['source_type'], hit['document_id']))
+                if not record:
+                    continue
+                
+                content_text = self.keyword_index.extract_content_text(record)
+                
+                if hit['source_type'] == 'meeting':
+                    result_id = f"meeting_{hit['document_id']}"
+                    doc_type = 'meeting'
+                    title = record.get('title', 'Untitled Meeting')
+                else:
+                    # Determine content type and title based on document type
+                    result_id = f"doc_{hit['document_id']}"
+                    doc_type = record.get('type', 'document')
+                    if doc_type == 'email':
+                        title = record.get('title', 'No Subject')  # For emails, title is the subject
+                    elif doc_type == 'meeting_transcript':
+                        title = record.get('title', 'Untitled Meeting')
+                    else:
+                        title = record.get('title', 'Untitled Document')
+                
+                scored_results.append({
+                    'id': result_id,
+                    'score': hit['score'],
+                    'content': content_text,
+                    'title': title,
+                    'type': doc_type,
+                    'metadata': record,
+                    'search_type': 'keyword',
+                    'keywords_matched': hit['keywords_matched']
+                })
+            
+            return scored_results
             
         except Exception as e:
             logger.error(f"Error in keyword search: {e}")
             return []
     
-    def _extract_keywords(self, query: str) -> List[str]:
-        """Extract keywords from query."""
-        # Remove common stop words
-        stop_words = {
-            'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
-            'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
-            'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
-            'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these',
-            'those', 'i', 'you', 'he', 'she', 'it', 'we', 'they', 'me', 'him',
-            'her', 'us', 'them', 'my', 'your', 'his', 'her', 'its', 'our', 'their'
-        }
-        
-        # Extract words
-        words = re.findall(r'\b[a-zA-Z]+\b', query.lower())
-        
-        # Filter out stop words and short words
-        keywords = [word for word in words if word not in stop_words and len(word) > 2]
-        
-        return keywords
-    
-    def _extract_content_text(self, item: Dict[str, Any]) -> str:
-        """Extract text content from different item types."""
-        # Try different content fields in order of preference
-        content_fields = [
-            'content', 'body', 'text', 'summary', 'description', 'notes',
-            'full_content', 'body_text', 'body_html', 'snippet'
-        ]
-        
-        for field in content_fields:
-            if field in item and item[field]:
-                content = str(item[field]).strip()
-                if len(content) > 10:  # Ensure meaningful content
-                    return content
-        
-        # If no direct content field found, try metadata
-        if 'metadata' in item and isinstance(item['metadata'], dict):
-            for field in content_fields:
-                if field in item['metadata'] and item['metadata'][field]:
-                    content = str(item['metadata'][field]).strip()
-                    if len(content) > 10:
-                        return content
-        
-        return ""
-    
-    def _calculate_bm25_score(self, content: str, keywords: List[str]) -> float:
-        """Calculate BM25 score for content against keywords."""
-        try:
-            if not content or not keywords:
-                return 0.0
-            
-            # Tokenize content
-            content_words = re.findall(r'\b[a-zA-Z]+\b', content.lower())
-            if not content_words:
-                return 0.0
-            
-            # Calculate term frequencies
-            term_freq = Counter(content_words)
-            doc_length = len(content_words)
-            
-            # Calculate average document length (simplified)
-            avg_doc_length = 100  # Simplified assumption
-            
-            # Calculate BM25 score
-            score = 0.0
-            for keyword in keywords:
-                if keyword in term_freq:
-                    tf = term_freq[keyword]
-                    idf = math.log(1.0)  # Simplified IDF calculation
-                    
-                    # BM25 formula
-                    numerator = tf * (self.k1 + 1)
-                    denominator = tf + self.k1 * (1 - self.b + self.b * (doc_length / avg_doc_length))
-                    
-                    score += idf * (numerator / denominator)
-            
-            return score
-            
-        except Exception as e:
-            logger.error(f"Error calculating BM25 score: {e}")
-            return 0.0
-    
-    def _get_matched_keywords(self, content: str, keywords: List[str]) -> List[str]:
-        """Get list of keywords that matched in content."""
-        content_lower = content.lower()
-        matched = [kw for kw in keywords if kw in content_lower]
-        return matched
-    
     def _combine_and_rerank(self, semantic_results: List[Dict[str, Any]], 
                           keyword_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Combine semantic and keyword results with weighted scoring."""
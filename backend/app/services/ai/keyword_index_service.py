@@ -0,0 +1,484 @@
+"""
+Keyword Index Service
+Maintains a persistent per-project inverted index for BM25 keyword retrieval.
+"""
+
+import asyncio
+import logging
+import math
+import re
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+
+from ...core.config import get_settings
+from ...core.supabase_config import get_supabase_service_client, execute_async
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS = {
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+    'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
+    'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
+    'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these',
+    'those', 'i', 'you', 'he', 'she', 'it', 'we', 'they', 'me', 'him',
+    'her', 'us', 'them', 'my', 'your', 'his', 'her', 'its', 'our', 'their'
+}
+
+CONTENT_FIELDS = [
+    'content', 'body', 'text', 'summary', 'description', 'notes',
+    'full_content', 'body_text', 'body_html', 'snippet', 'transcript_summary', 'transcript'
+]
+
+SOURCE_TABLES = {
+    'document': 'documents',
+    'meeting': 'meetings'
+}
+
+class KeywordIndexService:
+    """Service for incrementally maintained per-project inverted indexes."""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.supabase = get_supabase_service_client()
+
+        # BM25 parameters
+        self.k1 = 1.2
+        self.b = 0.75
+
+        # Batch sizes for Supabase round trips
+        self.page_size = 1000
+        self.insert_batch_size = 500
+        self.max_changes_per_sync = 500
+
+        # Seconds a rebuild may go without renewing its lease before another process can take over
+        self.build_lease_seconds = self.settings.keyword_index_build_lease_seconds
+
+        # Per-project background maintenance tasks, so concurrent queries share one
+        self._build_tasks: Dict[str, asyncio.Task] = {}
+        self._change_tasks: Dict[str, asyncio.Task] = {}
+
+    async def _execute(self, query):
+        """Run a blocking Supabase query off the event loop."""
+        return await execute_async(query)
+
+    def tokenize(self, text: str) -> List[str]:
+        """Tokenize text into index terms."""
+        words = re.findall(r'\b[a-zA-Z]+\b', text.lower())
+        return [word for word in words if word not in STOP_WORDS and len(word) > 2]
+
+    def extract_keywords(self, query: str) -> List[str]:
+        """Extract unique index terms from a query, preserving order."""
+        return list(dict.fromkeys(self.tokenize(query)))
+
+    def extract_content_text(self, item: Dict[str, Any]) -> str:
+        """Extract text content from different item types."""
+        for field in CONTENT_FIELDS:
+            if field in item and item[field]:
+                content = str(item[field]).strip()
+                if len(content) > 10:  # Ensure meaningful content
+                    return content
+
+        # If no direct content field found, try metadata
+        if 'metadata' in item and isinstance(item['metadata'], dict):
+            for field in CONTENT_FIELDS:
+                if field in item['metadata'] and item['metadata'][field]:
+                    content = str(item['metadata'][field]).strip()
+                    if len(content) > 10:
+                        return content
+
+        return ""
+
+    async def search(self, project_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Score a project's documents against a query using BM25.
+
+        Only the postings lists of the query terms are read; corpus statistics
+        come from keyword_index_stats.
+
+        Args:
+            project_id: Project to search within
+            query: Search query
+            limit: Maximum number of hits to return
+
+        Returns:
+            List of hits with document_id, source_type, score and keywords_matched
+        """
+        try:
+            keywords = self.extract_keywords(query)
+            if not keywords:
+                return []
+
+            stats = await self.ensure_project_index(project_id)
+            if stats is None:
+                logger.warning(f"Keyword index for project {project_id} is still being built, no keyword results yet")
+                return []
+            if not stats.get('document_count'):
+                return []
+
+            total_docs = stats['document_count']
+            avg_doc_length = (stats.get('total_length') or 0) / total_docs or 1.0
+
+            postings = await self._fetch_postings(project_id, keywords)
+
+            # Group postings by term to get document frequencies
+            term_postings: Dict[str, List[Dict[str, Any]]] = {}
+            for posting in postings:
+                term_postings.setdefault(posting['term'], []).append(posting)
+
+            scores: Dict[Tuple[str, str], float] = {}
+            matched: Dict[Tuple[str, str], List[str]] = {}
+            for term, rows in term_postings.items():
+                df = len(rows)
+                idf = math.log((total_docs - df + 0.5) / (df + 0.5) + 1.0)
+                for row in rows:
+                    key = (row['source_type'], row['document_id'])
+                    tf = row['term_frequency']
+                    norm = 1 - self.b + self.b * (row['doc_length'] / avg_doc_length)
+                    scores[key] = scores.get(key, 0.0) + idf * (tf * (self.k1 + 1)) / (tf + self.k1 * norm)
+                    matched.setdefault(key, []).append(term)
+
+            hits = [
+                {
+                    'document_id': document_id,
+                    'source_type': source_type,
+                    'score': score,
+                    'keywords_matched': matched[(source_type, document_id)]
+                }
+                for (source_type, document_id), score in scores.items()
+                if score > 0
+            ]
+            hits.sort(key=lambda x: x['score'], reverse=True)
+            return hits[:limit]
+
+        except Exception as e:
+            logger.error(f"Error searching keyword index for project {project_id}: {e}")
+            return []
+
+    async def fetch_records(self, hits: List[Dict[str, Any]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """Fetch the source rows for a set of search hits, keyed by (source_type, document_id)."""
+        records = {}
+        try:
+            for source_type, table in SOURCE_TABLES.items():
+                ids = [hit['document_id'] for hit in hits if hit['source_type'] == source_type]
+                if not ids:
+                    continue
+                result = await self._execute(self.supabase.table(table).select('*').in_('id', ids))
+                for row in result.data or []:
+                    records[(source_type, str(row['id']))] = row
+        except Exception as e:
+            logger.error(f"Error fetching keyword index records: {e}")
+        return records
+
+    async def ensure_project_index(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Apply pending changes to a built project index and return its corpus stats.
+
+        A missing index is built by a background task instead, and None is
+        returned until it is ready. Index maintenance runs in tasks that a
+        caller's timeout cannot cancel half way through.
+        """
+        stats = await self._get_project_stats(project_id)
+        if not stats or not stats.get('built_at'):
+            if not (stats and self._build_in_progress(stats)):
+                self.schedule_rebuild(project_id)
+            return None
+        if self._build_in_progress(stats):
+            # A rebuild covers the queued changes; applying them now would race its inserts
+            return stats
+
+        applied = await asyncio.shield(
+            self._start_task(self._change_tasks, project_id, self.apply_pending_changes)
+        )
+        if not applied:
+            return stats
+        return await self._get_project_stats(project_id)
+
+    def schedule_rebuild(self, project_id: str):
+        """Start a background rebuild of a project's index unless one is already running here."""
+        self._start_task(self._build_tasks, project_id, self.rebuild_project_index)
+
+    def is_building(self, project_id: str) -> bool:
+        """Check whether this process is building a project's index."""
+        task = self._build_tasks.get(project_id)
+        return task is not None and not task.done()
+
+    def _start_task(self, tasks: Dict[str, asyncio.Task], project_id: str, job) -> asyncio.Task:
+        """Get the running task for a project, or start job for it."""
+        task = tasks.get(project_id)
+        if task is None or task.done():
+            task = asyncio.create_task(job(project_id))
+            tasks[project_id] = task
+            task.add_done_callback(lambda done: tasks.pop(project_id, None) if tasks.get(project_id) is done else None)
+        return task
+
+    async def apply_pending_changes(self, project_id: str) -> int:
+        """Apply queued document/meeting changes for a project. Returns the number of documents reindexed."""
+        try:
+            result = await self._execute(self.supabase.table('keyword_index_changes').select('id, document_id, source_type').eq(
+                'project_id', project_id
+            ).order('id').limit(self.max_changes_per_sync))
+
+            changes = result.data or []
+            if not changes:
+                return 0
+
+            # Collapse repeated changes to the same document
+            changed = {(row['source_type'], str(row['document_id'])) for row in changes}
+
+            # Fetch current state of every changed row in one query per source table
+            current = await self.fetch_records([
+                {'source_type': source_type, 'document_id': document_id}
+                for source_type, document_id in changed
+            ])
+
+            for source_type, document_id in changed:
+                record = current.get((source_type, document_id))
+                if record and str(record.get('project_id')) == str(project_id):
+                    await self.index_document(project_id, record, source_type)
+                else:
+                    await self.remove_document(project_id, document_id, source_type)
+
+            max_id = changes[-1]['id']
+            await self._execute(self.supabase.table('keyword_index_changes').delete().eq('project_id', project_id).lte('id', max_id))
+
+            logger.info(f"Applied {len(changed)} keyword index changes for project {project_id}")
+            return len(changed)
+
+        except Exception as e:
+            logger.error(f"Error applying keyword index changes for project {project_id}: {e}")
+            return 0
+
+    async def index_document(self, project_id: str, record: Dict[str, Any], source_type: str = 'document') -> bool:
+        """Insert or replace a single document's postings in the project index."""
+        try:
+            document_id = str(record['id'])
+            await self.remove_document(project_id, document_id, source_type)
+
+            if source_type == 'document' and record.get('meeting_id'):
+                # The transcript document supersedes the bare meeting row
+                await self.remove_document(project_id, str(record['meeting_id']), 'meeting')
+            elif source_type == 'meeting' and await self._meeting_has_document(project_id, document_id):
+                return False
+
+            rows = self._build_index_rows(project_id, record, source_type)
+            if not rows:
+                return False
+
+            document, postings = rows
+            await self._insert_index_rows([document], postings)
+            return True
+
+        except Exception as e:
+            logger.error(f"Error indexing {source_type} {record.get('id')} for project {project_id}: {e}")
+            return False
+
+    def _build_index_rows(self, project_id: str, record: Dict[str, Any],
+                          source_type: str) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """Build a record's keyword_index_documents row and postings, or None if it has no terms."""
+        terms = self.tokenize(self.extract_content_text(record))
+        if not terms:
+            return None
+
+        document_id = str(record['id'])
+        term_freq = Counter(terms)
+        doc_length = len(terms)
+
+        document = {
+            'project_id': project_id,
+            'document_id': document_id,
+            'source_type': source_type,
+            'doc_type': record.get('type', source_type),
+            'title': record.get('title'),
+            'doc_length': doc_length,
+            'indexed_at': datetime.now().isoformat()
+        }
+        postings = [
+            {
+                'project_id': project_id,
+                'term': term,
+                'document_id': document_id,
+                'source_type': source_type,
+                'term_frequency': tf,
+                'doc_length': doc_length
+            }
+            for term, tf in term_freq.items()
+        ]
+        return document, postings
+
+    async def _insert_index_rows(self, documents: List[Dict[str, Any]], postings: List[Dict[str, Any]]):
+        """Insert document rows and postings in batches."""
+        for i in range(0, len(documents), self.insert_batch_size):
+            await self._execute(self.supabase.table('keyword_index_documents').insert(documents[i:i + self.insert_batch_size]))
+        for i in range(0, len(postings), self.insert_batch_size):
+            await self._execute(self.supabase.table('keyword_index_postings').insert(postings[i:i + self.insert_batch_size]))
+
+    async def remove_document(self, project_id: str, document_id: str, source_type: str = 'document') -> bool:
+        """Remove a single document's postings from the project index."""
+        try:
+            await self._execute(self.supabase.table('keyword_index_postings').delete().eq('project_id', project_id).eq(
+                'source_type', source_type
+            ).eq('document_id', document_id))
+            await self._execute(self.supabase.table('keyword_index_documents').delete().eq('project_id', project_id).eq(
+                'source_type', source_type
+            ).eq('document_id', document_id))
+            return True
+        except Exception as e:
+            logger.error(f"Error removing {source_type} {document_id} from keyword index: {e}")
+            return False
+
+    async def rebuild_project_index(self, project_id: str) -> int:
+        """
+        Rebuild a project's index from scratch. Returns the number of documents indexed.
+
+        The build holds a lease on the project's keyword_index_stats row, so a
+        project already being rebuilt by another task or process is skipped.
+        """
+        try:
+            if not await self._claim_build_lease(project_id):
+                logger.info(f"Keyword index for project {project_id} is already being built")
+                return 0
+
+            logger.info(f"Building keyword index for project {project_id}")
+
+            # Changes queued before the rebuild are covered by it
+            await self._execute(self.supabase.table('keyword_index_changes').delete().eq('project_id', project_id))
+            await self._execute(self.supabase.table('keyword_index_postings').delete().eq('project_id', project_id))
+            await self._execute(self.supabase.table('keyword_index_documents').delete().eq('project_id', project_id))
+
+            indexed = 0
+            documents: List[Dict[str, Any]] = []
+            postings: List[Dict[str, Any]] = []
+            transcript_meetings = set()
+
+            # Documents come first so transcript documents can supersede their meeting rows
+            for source_type in ('document', 'meeting'):
+                async for record in self._iter_project_rows(SOURCE_TABLES[source_type], project_id):
+                    if source_type == 'document' and record.get('meeting_id'):
+                        transcript_meetings.add(str(record['meeting_id']))
+                    elif source_type == 'meeting' and str(record['id']) in transcript_meetings:
+                        continue
+
+                    rows = self._build_index_rows(project_id, record, source_type)
+                    if not rows:
+                        continue
+                    documents.append(rows[0])
+                    postings.extend(rows[1])
+                    indexed += 1
+
+                    if len(documents) >= self.insert_batch_size or len(postings) >= self.insert_batch_size:
+                        await self._insert_index_rows(documents, postings)
+                        documents, postings = [], []
+                        await self._renew_build_lease(project_id)
+
+            await self._insert_index_rows(documents, postings)
+
+            await self._execute(self.supabase.table('keyword_index_stats').upsert({
+                'project_id': project_id,
+                'built_at': datetime.now().isoformat(),
+                'build_lease_until': None
+            }, on_conflict='project_id'))
+
+            logger.info(f"Keyword index for project {project_id} built with {indexed} documents")
+            return indexed
+
+        except Exception as e:
+            logger.error(f"Error rebuilding keyword index for project {project_id}: {e}")
+            await self._release_build_lease(project_id)
+            return 0
+
+    @staticmethod
+    def _build_in_progress(stats: Dict[str, Any]) -> bool:
+        """Check whether a rebuild currently holds the project's lease."""
+        lease_until = stats.get('build_lease_until')
+        if not lease_until:
+            return False
+        try:
+            return datetime.fromisoformat(lease_until.replace('Z', '+00:00')) > datetime.now(timezone.utc)
+        except ValueError:
+            return False
+
+    async def _claim_build_lease(self, project_id: str) -> bool:
+        """Claim the project's rebuild lease; False if another build holds it."""
+        result = await self._execute(self.supabase.rpc('claim_keyword_index_build', {
+            'p_project_id': project_id,
+            'p_lease_seconds': self.build_lease_seconds
+        }))
+        return bool(result.data)
+
+    async def _renew_build_lease(self, project_id: str):
+        lease_until = datetime.now(timezone.utc) + timedelta(seconds=self.build_lease_seconds)
+        await self._execute(self.supabase.table('keyword_index_stats').update({
+            'build_lease_until': lease_until.isoformat()
+        }).eq('project_id', project_id))
+
+    async def _release_build_lease(self, project_id: str):
+        try:
+            await self._execute(self.supabase.table('keyword_index_stats').update({
+                'build_lease_until': None
+            }).eq('project_id', project_id))
+        except Exception as e:
+            logger.error(f"Error releasing keyword index build lease for project {project_id}: {e}")
+
+    async def _get_project_stats(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Get corpus statistics for a project index."""
+        try:
+            result = await self._execute(self.supabase.table('keyword_index_stats').select('*').eq('project_id', project_id))
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error getting keyword index stats for project {project_id}: {e}")
+            return None
+
+    async def _fetch_postings(self, project_id: str, terms: List[str]) -> List[Dict[str, Any]]:
+        """Fetch the postings lists for the given terms."""
+        postings = []
+        offset = 0
+        while True:
+            result = await self._execute(self.supabase.table('keyword_index_postings').select(
+                'term, document_id, source_type, term_frequency, doc_length'
+            ).eq('project_id', project_id).in_('term', terms).range(offset, offset + self.page_size - 1))
+
+            rows = result.data or []
+            postings.extend(rows)
+            if len(rows) < self.page_size:
+                break
+            offset += self.page_size
+
+        for posting in postings:
+            posting['document_id'] = str(posting['document_id'])
+        return postings
+
+    async def _iter_project_rows(self, table: str, project_id: str):
+        """Page through every row of a table for a project."""
+        offset = 0
+        while True:
+            result = await self._execute(self.supabase.table(table).select('*').eq('project_id', project_id).range(
+                offset, offset + self.page_size - 1
+            ))
+
+            rows = result.data or []
+            for row in rows:
+                yield row
+            if len(rows) < self.page_size:
+                break
+            offset += self.page_size
+
+    async def _meeting_has_document(self, project_id: str, meeting_id: str) -> bool:
+        """Check whether a meeting is already represented by a transcript document."""
+        try:
+            result = await self._execute(self.supabase.table('documents').select('id').eq('project_id', project_id).eq(
+                'meeting_id', meeting_id
+            ).limit(1))
+            return bool(result.data)
+        except Exception:
+            return False
+
+# Global keyword index service instance
+_keyword_index_service: Optional[KeywordIndexService] = None
+
+def get_keyword_index_service() -> KeywordIndexService:
+    """Get the global keyword index service instance."""
+    global _keyword_index_service
+    if _keyword_index_service is None:
+        _keyword_index_service = KeywordIndexService()
+    return _keyword_index_service
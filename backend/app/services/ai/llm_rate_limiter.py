@@ -0,0 +1,116 @@
+"""
+LLM Rate Limiter
+Token-per-minute and request-per-minute aware limiter for OpenAI calls made from batch pipelines.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Any, Optional
+
+from ...core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+class LLMRateLimiter:
+    """
+    Two continuously refilling buckets, one of requests and one of tokens.
+
+    Callers reserve an estimated token count before a request and report the
+    actual usage afterwards, so the token bucket tracks what the provider counts.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = max(1, requests_per_minute)
+        self.tokens_per_minute = max(1, tokens_per_minute)
+
+        self._request_allowance = float(self.requests_per_minute)
+        self._token_allowance = float(self.tokens_per_minute)
+        self._updated_at = time.monotonic()
+
+        self._metrics = {
+            'acquired': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'tokens_reserved': 0,
+            'tokens_used': 0
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._request_allowance = min(self.requests_per_minute, self._request_allowance + elapsed * self.requests_per_minute / 60)
+        self._token_allowance = min(self.tokens_per_minute, self._token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, tokens: int) -> int:
+        """
+        Wait until one request and the estimated tokens fit within the limits, then reserve them.
+
+        Returns:
+            The number of tokens reserved, to pass back to record_usage
+        """
+        # A request larger than the whole budget would never fit; let it through once the bucket is full
+        tokens = min(max(tokens, 1), self.tokens_per_minute)
+        waited = 0.0
+
+        while True:
+            self._refill()
+            if self._request_allowance >= 1 and self._token_allowance >= tokens:
+                # Check and reserve happen without an await in between, so concurrent callers cannot overdraw
+                self._request_allowance -= 1
+                self._token_allowance -= tokens
+                break
+
+            wait = max(
+                (1 - self._request_allowance) * 60 / self.requests_per_minute,
+                (tokens - self._token_allowance) * 60 / self.tokens_per_minute,
+                0.05
+            )
+            waited += wait
+            await asyncio.sleep(wait)
+
+        self._metrics['acquired'] += 1
+        self._metrics['tokens_reserved'] += tokens
+        if waited:
+            self._metrics['waits'] += 1
+            self._metrics['wait_seconds'] += waited
+        return tokens
+
+    def record_usage(self, reserved_tokens: int, used_tokens: Optional[int]):
+        """Correct the token bucket with the actual usage reported for a request."""
+        if used_tokens is None:
+            return
+        self._refill()
+        self._token_allowance = min(self.tokens_per_minute, self._token_allowance + reserved_tokens - used_tokens)
+        self._metrics['tokens_used'] += used_tokens
+
+    def penalize(self, seconds: float):
+        """Drain both buckets after the provider returns a rate limit error."""
+        self._refill()
+        self._request_allowance = min(self._request_allowance, -seconds * self.requests_per_minute / 60)
+        self._token_allowance = min(self._token_allowance, -seconds * self.tokens_per_minute / 60)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get acquisition and wait counters."""
+        self._refill()
+        metrics = dict(self._metrics)
+        metrics['requests_per_minute'] = self.requests_per_minute
+        metrics['tokens_per_minute'] = self.tokens_per_minute
+        metrics['request_allowance'] = self._request_allowance
+        metrics['token_allowance'] = self._token_allowance
+        return metrics
+
+# Global classification rate limiter instance
+_classification_rate_limiter: Optional[LLMRateLimiter] = None
+
+def get_classification_rate_limiter() -> LLMRateLimiter:
+    """Get the global rate limiter for classification LLM calls."""
+    global _classification_rate_limiter
+    if _classification_rate_limiter is None:
+        settings = get_settings()
+        _classification_rate_limiter = LLMRateLimiter(
+            settings.classification_requests_per_minute,
+            settings.classification_tokens_per_minute
+        )
+    return _classification_rate_limiter
@@ -0,0 +1,105 @@
+"""
+Near-Duplicate Detector
+MinHash signatures over word shingles with LSH banding for sub-quadratic near-duplicate chunk detection.
+"""
+
+import base64
+import hashlib
+import logging
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from ...core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class NearDuplicateDetector:
+    """MinHash/LSH index of chunk texts; one instance per document or ingest batch."""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.num_perm = self.settings.minhash_num_perm
+        self.bands = self.settings.minhash_bands
+        self.rows = self.num_perm // self.bands
+        self.threshold = self.settings.near_duplicate_threshold
+        self.shingle_size = 5
+
+        # Fixed seed so signatures are comparable across processes and stored rows
+        generator = np.random.RandomState(1)
+        self._a = generator.randint(1, np.iinfo(np.int64).max, size=self.num_perm, dtype=np.int64).astype(np.uint64)
+        self._b = generator.randint(0, np.iinfo(np.int64).max, size=self.num_perm, dtype=np.int64).astype(np.uint64)
+
+        # band hash -> keys of indexed texts sharing that band
+        self._buckets: Dict[str, List[str]] = {}
+        self._signatures: Dict[str, np.ndarray] = {}
+
+    def shingles(self, text: str) -> List[str]:
+        """Split normalized text into overlapping word shingles."""
+        words = re.sub(r'\s+', ' ', (text or '').lower()).strip().split(' ')
+        if len(words) <= self.shingle_size:
+            return [' '.join(words)]
+        return [' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)]
+
+    def signature(self, text: str) -> np.ndarray:
+        """Compute the MinHash signature of a text."""
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'little')
+             for shingle in set(self.shingles(text))],
+            dtype=np.uint64
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def band_hashes(self, signature: np.ndarray) -> List[str]:
+        """Hash each LSH band of a signature; texts sharing any band hash are candidates."""
+        return [
+            f"{band}:{hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).hexdigest()}"
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def similarity(signature1: np.ndarray, signature2: np.ndarray) -> float:
+        """Estimate Jaccard similarity from two signatures."""
+        return float(np.mean(signature1 == signature2))
+
+    def add(self, key: str, signature: np.ndarray, band_hashes: Optional[List[str]] = None):
+        """Index a signature under a key."""
+        self._signatures[key] = signature
+        for band_hash in band_hashes or self.band_hashes(signature):
+            self._buckets.setdefault(band_hash, []).append(key)
+
+    def find_duplicate(self, signature: np.ndarray, band_hashes: Optional[List[str]] = None) -> Optional[Tuple[str, float]]:
+        """Return (key, similarity) of an indexed near-duplicate, or None."""
+        candidates = set()
+        for band_hash in band_hashes or self.band_hashes(signature):
+            candidates.update(self._buckets.get(band_hash, ()))
+
+        best = None
+        for key in candidates:
+            similarity = self.similarity(signature, self._signatures[key])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+    @staticmethod
+    def encode_signature(signature: np.ndarray) -> str:
+        return base64.b64encode(signature.astype(np.uint32).tobytes()).decode('ascii')
+
+    @staticmethod
+    def decode_signature(encoded: str) -> np.ndarray:
+        return np.frombuffer(base64.b64decode(encoded), dtype=np.uint32)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'indexed': len(self._signatures),
+            'buckets': len(self._buckets),
+            'num_perm': self.num_perm,
+            'bands': self.bands,
+            'threshold': self.threshold
+        }
@@ -0,0 +1,212 @@
+"""
+Project Prefilter
+Ranks a user's projects against incoming content with cached metadata embeddings and keyword overlap,
+so only the top candidates are sent to the LLM classifier.
+"""
+
+import logging
+import re
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import openai
+
+from ...core.config import get_settings
+from .query_embedding_cache import get_query_embedding_cache
+
+logger = logging.getLogger(__name__)
+
+# Project fields the classifier prompt uses, with character caps for free-text fields
+PROJECT_LLM_FIELDS = {
+    'name': None,
+    'overview': 600,
+    'categories': None,
+    'normalized_tags': None,
+    'reference_keywords': None,
+    'notes': 300,
+    'timezone': None,
+}
+
+class ProjectPrefilter:
+    """First-stage project ranking for content classification."""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.openai_client = openai.AsyncOpenAI(
+            api_key=self.settings.embedding_api_key or self.settings.openai_api_key,
+            base_url=self.settings.embedding_base_url
+        )
+        # Project metadata embeddings are cached by text, so they are only recomputed when a project changes
+        self.embedding_cache = get_query_embedding_cache()
+
+        self.top_k = self.settings.classification_prefilter_top_k
+        self.embedding_weight = 0.6
+        self.keyword_weight = 0.4
+        self.max_content_chars = 8000
+
+        self._metrics = {
+            'rankings': 0,
+            'projects_ranked': 0,
+            'candidates_sent': 0,
+            'fast_path_matches': 0,
+            'embedding_failures': 0
+        }
+
+    @staticmethod
+    def _as_list(value: Any) -> List[str]:
+        if not value:
+            return []
+        if isinstance(value, str):
+            return [value]
+        return [str(item) for item in value if item]
+
+    def project_text(self, project: Dict[str, Any]) -> str:
+        """Build the metadata text embedded for a project."""
+        parts = [
+            project.get('name') or '',
+            project.get('overview') or project.get('description') or '',
+            ', '.join(self._as_list(project.get('categories'))),
+            ', '.join(self._as_list(project.get('normalized_tags'))),
+            ', '.join(self._as_list(project.get('reference_keywords'))),
+            project.get('notes') or ''
+        ]
+        return '\n'.join(part for part in parts if part)
+
+    def content_text(self, content: Dict[str, Any]) -> str:
+        """Build the text a piece of content is ranked by."""
+        text = f"{content.get('subject') or ''}\n{content.get('content_text') or ''}".strip()
+        return text[:self.max_content_chars]
+
+    def trim_project(self, project: Dict[str, Any]) -> Dict[str, Any]:
+        """Reduce a project row to the fields the classifier prompt uses."""
+        trimmed = {'project_id': project.get('id') or project.get('project_id')}
+        for field, max_chars in PROJECT_LLM_FIELDS.items():
+            value = project.get(field)
+            if field == 'overview' and not value:
+                value = project.get('description')
+            if not value:
+                continue
+            if max_chars and isinstance(value, str) and len(value) > max_chars:
+                value = value[:max_chars] + '...'
+            trimmed[field] = value
+        return trimmed
+
+    def keyword_score(self, content_text: str, project: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Score literal overlap between content and project metadata.
+
+        A project name mention counts as a full match; otherwise the score is the
+        fraction of the project's tags and reference keywords found in the content.
+        """
+        lowered = content_text.lower()
+        name = (project.get('name') or '').strip().lower()
+        name_match = bool(name) and re.search(r'\b' + re.escape(name) + r'\b', lowered) is not None
+
+        terms = {term.strip().lower() for term in
+                 self._as_list(project.get('normalized_tags')) + self._as_list(project.get('reference_keywords'))
+                 if term.strip()}
+        matched = sorted(term for term in terms if re.search(r'\b' + re.escape(term) + r'\b', lowered))
+
+        score = 1.0 if name_match else (len(matched) / len(terms) if terms else 0.0)
+        return {'score': score, 'name_match': name_match, 'matched_terms': matched}
+
+    async def rank_projects(self, content: Dict[str, Any], projects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Rank projects against content, best first.
+
+        Returns:
+            List of {project, score, embedding_score, keyword_score, name_match, matched_terms}
+        """
+        text = self.content_text(content)
+        self._metrics['rankings'] += 1
+        self._metrics['projects_ranked'] += len(projects)
+
+        similarities = await self._embedding_similarities(text, projects)
+
+        ranked = []
+        for i, project in enumerate(projects):
+            keywords = self.keyword_score(text, project)
+            if similarities is None:
+                score = keywords['score']
+                embedding_score = None
+            else:
+                embedding_score = float(similarities[i])
+                score = self.embedding_weight * embedding_score + self.keyword_weight * keywords['score']
+            ranked.append({
+                'project': project,
+                'score': score,
+                'embedding_score': embedding_score,
+                'keyword_score': keywords['score'],
+                'name_match': keywords['name_match'],
+                'matched_terms': keywords['matched_terms']
+            })
+
+        ranked.sort(key=lambda candidate: candidate['score'], reverse=True)
+        return ranked
+
+    async def _embedding_similarities(self, text: str, projects: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Cosine similarity of the content to each project's metadata, or None if embedding fails."""
+        if not text:
+            return None
+        try:
+            vectors = await self.embedding_cache.get_embeddings(
+                self.openai_client,
+                [self.project_text(project) or (project.get('name') or '') for project in projects]
+            )
+            response = await self.openai_client.embeddings.create(
+                model=self.settings.embedding_model_choice,
+                input=text,
+                encoding_format="float"
+            )
+
+            matrix = np.asarray(vectors, dtype=np.float32)
+            query = np.asarray(response.data[0].embedding, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+            norms[norms == 0] = 1.0
+            return (matrix @ query) / norms
+        except Exception as e:
+            self._metrics['embedding_failures'] += 1
+            logger.error(f"Error embedding projects for classification prefilter: {e}")
+            return None
+
+    def select_candidates(self, ranked: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Get the project rows to send to the LLM."""
+        candidates = [candidate['project'] for candidate in ranked[:self.top_k]]
+        self._metrics['candidates_sent'] += len(candidates)
+        return candidates
+
+    def fast_path_match(self, ranked: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Return the top candidate if it clearly beats every other project.
+
+        Requires embedding and keyword evidence: a score at or above
+        classification_fast_path_score, a name mention or matched terms, and a
+        lead of at least classification_fast_path_margin over the runner-up.
+        """
+        if not ranked or ranked[0]['embedding_score'] is None:
+            return None
+
+        top = ranked[0]
+        runner_up = ranked[1]['score'] if len(ranked) > 1 else 0.0
+        if (top['score'] >= self.settings.classification_fast_path_score
+                and (top['name_match'] or top['matched_terms'])
+                and top['score'] - runner_up >= self.settings.classification_fast_path_margin):
+            self._metrics['fast_path_matches'] += 1
+            return top
+        return None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get ranking and fast-path counters."""
+        metrics = dict(self._metrics)
+        metrics['fast_path_rate'] = metrics['fast_path_matches'] / metrics['rankings'] if metrics['rankings'] else 0.0
+        return metrics
+
+# Global project prefilter instance
+_project_prefilter: Optional[ProjectPrefilter] = None
+
+def get_project_prefilter() -> ProjectPrefilter:
+    """Get the global project prefilter instance."""
+    global _project_prefilter
+    if _project_prefilter is None:
+        _project_prefilter = ProjectPrefilter()
+    return _project_prefilter
@@ -0,0 +1,205 @@
+"""
+Query Embedding Cache
+Bounded in-process LRU cache of query embeddings with TTL and an optional shared Redis tier.
+"""
+
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from ...core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+class QueryEmbeddingCache:
+    """LRU + TTL cache of embeddings keyed by normalized text and embedding model."""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.max_entries = self.settings.embedding_cache_max_entries
+        self.max_bytes = self.settings.embedding_cache_max_mb * 1024 * 1024
+        self.ttl_seconds = self.settings.embedding_cache_ttl_seconds
+        self.redis_prefix = "query_embedding:"
+
+        # key -> (expires_at, vector); vectors are stored as float32 arrays to bound memory
+        self._entries: "OrderedDict[str, Tuple[float, array]]" = OrderedDict()
+        self._bytes = 0
+        self._redis = None
+        self._redis_enabled = self.settings.embedding_cache_use_redis and bool(self.settings.redis_url)
+
+        self._metrics = {
+            'hits': 0,
+            'misses': 0,
+            'redis_hits': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'embedding_requests': 0,
+            'texts_embedded': 0
+        }
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize query text so trivially different strings share a cache entry."""
+        text = unicodedata.normalize('NFKC', text or '')
+        return re.sub(r'\s+', ' ', text).strip().casefold()
+
+    def make_key(self, text: str, model: str) -> str:
+        digest = hashlib.sha256(self.normalize(text).encode('utf-8')).hexdigest()
+        return f"{model}:{digest}"
+
+    async def get_embeddings(self, openai_client, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """
+        Return embeddings for texts, embedding only cache misses in a single batched request.
+
+        Args:
+            openai_client: Async OpenAI client used for misses
+            texts: Texts to embed
+            model: Embedding model (defaults to settings.embedding_model_choice)
+
+        Returns:
+            Embeddings in the same order as texts
+        """
+        model = model or self.settings.embedding_model_choice
+        keys = [self.make_key(text, model) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+
+        for key in keys:
+            vector = self._get_local(key)
+            if vector is not None:
+                vectors[key] = vector
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing and self._redis_enabled:
+            vectors.update(await self._get_redis(missing))
+            missing = [key for key in missing if key not in vectors]
+
+        self._metrics['hits'] += len(keys) - len(missing)
+        self._metrics['misses'] += len(missing)
+
+        if missing:
+            # Embed each missing key once, using the first original text that maps to it
+            to_embed = {}
+            for key, text in zip(keys, texts):
+                if key in missing and key not in to_embed:
+                    to_embed[key] = text
+
+            response = await openai_client.embeddings.create(
+                model=model,
+                input=list(to_embed.values()),
+                encoding_format="float"
+            )
+            self._metrics['embedding_requests'] += 1
+            self._metrics['texts_embedded'] += len(to_embed)
+
+            embedded = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            new_vectors = dict(zip(to_embed.keys(), embedded))
+            for key, vector in new_vectors.items():
+                self._set_local(key, vector)
+            if self._redis_enabled:
+                await self._set_redis(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key] for key in keys]
+
+    async def get_embedding(self, openai_client, text: str, model: Optional[str] = None) -> List[float]:
+        """Return the embedding for a single text."""
+        return (await self.get_embeddings(openai_client, [text], model))[0]
+
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, vector = entry
+        if expires_at < time.monotonic():
+            self._remove_local(key)
+            self._metrics['expirations'] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return vector.tolist()
+
+    def _set_local(self, key: str, vector: List[float]):
+        if key in self._entries:
+            self._remove_local(key)
+
+        packed = array('f', vector)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, packed)
+        self._bytes += self._entry_size(key, packed)
+
+        # Evict least recently used entries until within both caps
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest_key = next(iter(self._entries))
+            self._remove_local(oldest_key)
+            self._metrics['evictions'] += 1
+
+    def _remove_local(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= self._entry_size(key, entry[1])
+
+    @staticmethod
+    def _entry_size(key: str, vector: array) -> int:
+        return len(key) + vector.itemsize * len(vector)
+
+    def _get_redis_client(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.settings.redis_url)
+        return self._redis
+
+    async def _get_redis(self, keys: List[str]) -> Dict[str, List[float]]:
+        try:
+            values = await self._get_redis_client().mget([self.redis_prefix + key for key in keys])
+            found = {}
+            for key, value in zip(keys, values):
+                if value:
+                    vector = array('f')
+                    vector.frombytes(value)
+                    found[key] = vector.tolist()
+                    self._set_local(key, found[key])
+            self._metrics['redis_hits'] += len(found)
+            return found
+        except Exception as e:
+            logger.warning(f"Redis embedding cache lookup failed: {e}")
+            return {}
+
+    async def _set_redis(self, vectors: Dict[str, List[float]]):
+        try:
+            pipe = self._get_redis_client().pipeline()
+            for key, vector in vectors.items():
+                pipe.set(self.redis_prefix + key, array('f', vector).tobytes(), ex=self.ttl_seconds)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Redis embedding cache write failed: {e}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters and memory usage."""
+        metrics = dict(self._metrics)
+        lookups = metrics['hits'] + metrics['misses']
+        metrics['hit_rate'] = metrics['hits'] / lookups if lookups else 0.0
+        metrics['entries'] = len(self._entries)
+        metrics['memory_bytes'] = self._bytes
+        metrics['max_bytes'] = self.max_bytes
+        metrics['redis_enabled'] = self._redis_enabled
+        return metrics
+
+    def clear(self):
+        """Drop all in-process entries."""
+        self._entries.clear()
+        self._bytes = 0
+
+# Global query embedding cache instance
+_query_embedding_cache: Optional[QueryEmbeddingCache] = None
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    """Get the global query embedding cache instance."""
+    global _query_embedding_cache
+    if _query_embedding_cache is None:
+        _query_embedding_cache = QueryEmbeddingCache()
+    return _query_embedding_cache
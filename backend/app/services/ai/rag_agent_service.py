@@ -4,20 +4,54 @@ Conversational RAG agent that queries Supabase and Pinecone to answer user quest
 about project-specific data (emails, Drive files, meeting transcripts).
 """
 
+import asyncio
 import logging
 import json
+import time
+import uuid
+from collections import deque
 from typing import Dict, Any, List, Optional, AsyncGenerator
 from datetime import datetime
 import openai
-from pinecone import Pinecone
 
-from ...core.supabase_config import get_supabase_service_client
+from ...core.supabase_config import get_supabase_service_client, execute_async
 from ...core.config import get_settings
+from ...core.vector_store import get_vector_store
 from .hybrid_search_service import HybridSearchService
 from .query_optimization_service import QueryOptimizationService
+from .query_embedding_cache import get_query_embedding_cache
+from .retrieval_cache import get_retrieval_cache
 
 logger = logging.getLogger(__name__)
 
+# Recent time-to-first-token samples (milliseconds) across RAG queries in this process
+_rag_timings: Dict[str, deque] = {
+    'ttft_ms': deque(maxlen=500),
+    'pre_generation_ms': deque(maxlen=500)
+}
+
+def _record_rag_timing(ttft_ms: float, pre_generation_ms: float):
+    """Record time-to-first-token and pre-generation latency for a RAG query."""
+    _rag_timings['ttft_ms'].append(ttft_ms)
+    _rag_timings['pre_generation_ms'].append(pre_generation_ms)
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def get_rag_latency_metrics() -> Dict[str, Any]:
+    """Get time-to-first-token and pre-generation latency percentiles."""
+    metrics = {'samples': len(_rag_timings['ttft_ms'])}
+    for name, samples in _rag_timings.items():
+        values = list(samples)
+        if values:
+            metrics[name] = {
+                'p50': _percentile(values, 50),
+                'p95': _percentile(values, 95),
+                'last': values[-1]
+            }
+    return metrics
+
 class RAGAgentService:
     """RAG agent service for intelligent project data querying."""
     
@@ -31,8 +65,10 @@ class RAGAgentService:
             base_url=self.settings.openai_base_url if hasattr(self.settings, 'openai_base_url') else None
         )
         
-        # Initialize Pinecone client
-        self.pinecone = Pinecone(api_key=self.settings.pinecone_api_key)
+        # Shared Pinecone index handle
+        self.vector_store = get_vector_store()
+        self.embedding_cache = get_query_embedding_cache()
+        self.retrieval_cache = get_retrieval_cache()
         self.index_name = self.settings.pinecone_vector_store
         
         # Initialize advanced search services
@@ -93,64 +129,65 @@ Tone
             print("=" * 50)
             
             logger.info(f"RAG query for project {project_id}: {user_question}")
+            request_start = time.perf_counter()
             
-            # Step 1: Get project information
-            project_info = await self._get_project_info(project_id, user_id)
-            if not project_info:
-                yield "I couldn't find information about this project. Please check if the project exists and you have access to it."
-                return
-            
-            # Step 1.5: Create or get chat session if session_id is provided
-            conversation_history = []
-            actual_session_id = None
+            # Stage 1: The project lookup and conversation history read run concurrently. Session
+            # writes and context retrieval wait for the ownership check, then run concurrently
+            project_task = asyncio.create_task(self._get_project_info(project_id, user_id))
+            session_task = None
+            history_task = None
             if session_id:
-                # Ensure chat session exists
-                actual_session_id = await self.create_or_get_chat_session(session_id, user_id, project_id)
-                if not actual_session_id:
-                    yield "I encountered an error setting up the chat session. Please try again."
+                history_task = asyncio.create_task(
+                    self._get_conversation_history(self._session_uuid(session_id), user_id)
+                )
+            pending_tasks = [task for task in (project_task, history_task) if task]
+            
+            try:
+                # Step 1: Get project information
+                project_info = await project_task
+                if not project_info:
+                    yield "I couldn't find information about this project. Please check if the project exists and you have access to it."
                     return
                 
-                # Save user's question first
-                await self.save_user_message(actual_session_id, user_id, user_question)
-                print(f"=== SAVED USER MESSAGE ===")
-                print(f"Session ID: {actual_session_id}")
-                print(f"User question: {user_question[:100]}...")
-                print("=" * 50)
+                if session_id:
+                    session_task = asyncio.create_task(
+                        self._prepare_chat_session(session_id, user_id, project_id, user_question)
+                    )
+                    pending_tasks.append(session_task)
+                context_task = asyncio.create_task(
+                    self._retrieve_context(project_id, user_id, user_question, max_results, history_task)
+                )
+                pending_tasks.append(context_task)
                 
-                # Get conversation history
-                conversation_history = await self._get_conversation_history(actual_session_id, user_id)
-                print(f"=== CONVERSATION HISTORY DEBUG ===")
-                print(f"Session ID: {actual_session_id}")
-                print(f"History messages found: {len(conversation_history)}")
-                for i, msg in enumerate(conversation_history[-3:]):  # Show last 3 messages
-                    print(f"History {i+1}: {msg.get('role', 'unknown')} - {msg.get('message', '')[:50]}...")
-                print("=" * 50)
+                # Step 1.5: Ensure the chat session exists and the question is saved
+                conversation_history = []
+                actual_session_id = None
+                if session_task:
+                    actual_session_id = await session_task
+                    if not actual_session_id:
+                        yield "I encountered an error setting up the chat session. Please try again."
+                        return
+                    
+                    conversation_history = await history_task
+                    # History is read concurrently with saving the question; drop it if it raced in
+                    if conversation_history and conversation_history[-1].get('message') == user_question:
+                        conversation_history = conversation_history[:-1]
+                    print(f"=== CONVERSATION HISTORY DEBUG ===")
+                    print(f"Session ID: {actual_session_id}")
+                    print(f"History messages found: {len(conversation_history)}")
+                    for i, msg in enumerate(conversation_history[-3:]):  # Show last 3 messages
+                        print(f"History {i+1}: {msg.get('role', 'unknown')} - {msg.get('message', '')[:50]}...")
+                    print("=" * 50)
                 
-                # Step 1.6: Extract entities and context from conversation history
-                conversation_context = self._extract_conversation_context(conversation_history, user_question)
-                print(f"=== CONVERSATION CONTEXT DEBUG ===")
-                print(f"Extracted context: {conversation_context}")
-                print("=" * 50)
-            
-            # Step 2: Retrieve relevant context from Supabase
-            supabase_context = await self._retrieve_supabase_context(
-                project_id, user_id, user_question, max_results
-            )
-            print(f"=== SUPABASE CONTEXT DEBUG ===")
-            print(f"Supabase context items found: {len(supabase_context)}")
-            for i, item in enumerate(supabase_context[:3]):  # Show first 3 items
-                print(f"Supabase item {i+1}: {item.get('type', 'unknown')} - {item.get('title', 'no title')[:50]}...")
-            print("=" * 50)
-            
-            # Step 3: Retrieve relevant context using hybrid search
-            pinecone_context = await self._retrieve_hybrid_context(
-                project_id, user_id, user_question, max_results, conversation_context
-            )
+                # Steps 2-4: Retrieved and ranked context
+                combined_context = await context_task
+            finally:
+                for task in pending_tasks:
+                    if not task.done():
+                        task.cancel()
             
-            # Step 4: Combine and rank context
-            combined_context = self._combine_and_rank_context(
-                supabase_context, pinecone_context, user_question
-            )
+            pre_generation_ms = (time.perf_counter() - request_start) * 1000
+            logger.info(f"RAG pre-generation stages completed in {pre_generation_ms:.0f}ms")
             
             if not combined_context:
                 yield "I couldn't find any relevant information in your project data to answer this question. "
@@ -158,19 +195,106 @@ Tone
                 return
             
             # Step 5: Generate streaming response using OpenAI
+            first_token = True
             async for chunk in self._generate_streaming_response(
                 user_question, project_info, combined_context, conversation_history, actual_session_id, user_id
             ):
+                if first_token:
+                    first_token = False
+                    ttft_ms = (time.perf_counter() - request_start) * 1000
+                    _record_rag_timing(ttft_ms, pre_generation_ms)
+                    logger.info(f"RAG time to first token: {ttft_ms:.0f}ms (pre-generation {pre_generation_ms:.0f}ms)")
                 yield chunk
                 
         except Exception as e:
             logger.error(f"Error in RAG query: {e}")
             yield f"I encountered an error while processing your question: {str(e)}. Please try again."
     
+    def _session_uuid(self, session_id: str) -> str:
+        """Map a frontend session ID to its deterministic chat_sessions UUID."""
+        # The same frontend session always gets the same UUID
+        return str(uuid.uuid5(uuid.NAMESPACE_DNS, f"chat_{session_id}"))
+    
+    async def _prepare_chat_session(self, session_id: str, user_id: str, project_id: str, user_question: str) -> Optional[str]:
+        """Create or get the chat session and save the user's question to it."""
+        actual_session_id = await self.create_or_get_chat_session(session_id, user_id, project_id)
+        if not actual_session_id:
+            return None
+        
+        # Save user's question first
+        await self.save_user_message(actual_session_id, user_id, user_question)
+        print(f"=== SAVED USER MESSAGE ===")
+        print(f"Session ID: {actual_session_id}")
+        print(f"User question: {user_question[:100]}...")
+        print("=" * 50)
+        return actual_session_id
+    
+    async def _retrieve_context(
+        self,
+        project_id: str,
+        user_id: str,
+        query: str,
+        max_results: int,
+        history_task: Optional["asyncio.Task"] = None
+    ) -> List[Dict[str, Any]]:
+        """Retrieve combined context, served from the retrieval cache when the corpus version matches."""
+        corpus_version = await self.retrieval_cache.get_corpus_version(project_id)
+        cache_key = self.retrieval_cache.make_key(
+            project_id, user_id, query, corpus_version, max_results=max_results
+        )
+        
+        cached_context = self.retrieval_cache.get(cache_key)
+        if cached_context is not None:
+            logger.info(f"Retrieval cache hit for project {project_id} (corpus version {corpus_version})")
+            return cached_context
+        
+        # Steps 2 and 3: Supabase and hybrid retrieval run concurrently
+        supabase_context, pinecone_context = await asyncio.gather(
+            self._retrieve_supabase_context(project_id, user_id, query, max_results),
+            self._retrieve_hybrid_context_with_history(project_id, user_id, query, max_results, history_task)
+        )
+        print(f"=== SUPABASE CONTEXT DEBUG ===")
+        print(f"Supabase context items found: {len(supabase_context)}")
+        for i, item in enumerate(supabase_context[:3]):  # Show first 3 items
+            print(f"Supabase item {i+1}: {item.get('type', 'unknown')} - {item.get('title', 'no title')[:50]}...")
+        print("=" * 50)
+        
+        # Step 4: Combine and rank context
+        combined_context = self._combine_and_rank_context(
+            supabase_context, pinecone_context, query
+        )
+        
+        if combined_context:
+            self.retrieval_cache.set(cache_key, combined_context)
+        
+        return combined_context
+    
+    async def _retrieve_hybrid_context_with_history(
+        self,
+        project_id: str,
+        user_id: str,
+        query: str,
+        max_results: int,
+        history_task: Optional["asyncio.Task"] = None
+    ) -> List[Dict[str, Any]]:
+        """Wait for conversation history (if any), extract its context, then run hybrid retrieval."""
+        conversation_context = {}
+        if history_task is not None:
+            conversation_history = await asyncio.shield(history_task)
+            # Step 1.6: Extract entities and context from conversation history
+            conversation_context = self._extract_conversation_context(conversation_history, query)
+            print(f"=== CONVERSATION CONTEXT DEBUG ===")
+            print(f"Extracted context: {conversation_context}")
+            print("=" * 50)
+        
+        return await self._retrieve_hybrid_context(
+            project_id, user_id, query, max_results, conversation_context
+        )
+    
     async def _get_project_info(self, project_id: str, user_id: str) -> Optional[Dict[str, Any]]:
         """Get basic project information."""
         try:
-            result = self.supabase.table('projects').select('*').eq('id', project_id).eq('created_by', user_id).single().execute()
+            result = await execute_async(self.supabase.table('projects').select('*').eq('id', project_id).eq('created_by', user_id).single())
             return result.data if result.data else None
         except Exception as e:
             logger.error(f"Error getting project info: {e}")
@@ -180,7 +304,7 @@ Tone
         """Get conversation history for a session."""
         try:
             # Get recent messages from the session, ordered by timestamp
-            result = self.supabase.table('chat_messages').select('*').eq('bot_id', session_id).eq('user_id', user_id).order('created_at', desc=True).limit(limit).execute()
+            result = await execute_async(self.supabase.table('chat_messages').select('*').eq('bot_id', session_id).eq('user_id', user_id).order('created_at', desc=True).limit(limit))
             
             if not result.data:
                 return []
@@ -269,15 +393,12 @@ Tone
     async def create_or_get_chat_session(self, session_id: str, user_id: str, project_id: str) -> str:
         """Create or get existing chat session."""
         try:
-            import uuid
-            
             # Generate a proper UUID for the session using the frontend session_id as seed
-            # This ensures the same frontend session always gets the same UUID
-            session_uuid = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"chat_{session_id}"))
+            session_uuid = self._session_uuid(session_id)
             
             # First, try to get existing session
             try:
-                existing_session = self.supabase.table('chat_sessions').select('id').eq('id', session_uuid).single().execute()
+                existing_session = await execute_async(self.supabase.table('chat_sessions').select('id').eq('id', session_uuid).single())
                 if existing_session.data:
                     logger.info(f"Using existing chat session {session_uuid}")
                     return session_uuid
@@ -294,7 +415,7 @@ Tone
                 'name': f"Project Chat - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
             }
             
-            result = self.supabase.table('chat_sessions').insert(session_data).execute()
+            result = await execute_async(self.supabase.table('chat_sessions').insert(session_data))
             
             if result.data:
                 logger.info(f"Created new chat session {session_uuid}")
@@ -321,7 +442,7 @@ Tone
                 'created_at': datetime.now().isoformat()
             }
             
-            result = self.supabase.table('chat_messages').insert(message_data).execute()
+            result = await execute_async(self.supabase.table('chat_messages').insert(message_data))
             
             if result.data:
                 logger.info(f"Saved assistant response to session {session_id}")
@@ -348,7 +469,7 @@ Tone
                 'created_at': datetime.now().isoformat()
             }
             
-            result = self.supabase.table('chat_messages').insert(message_data).execute()
+            result = await execute_async(self.supabase.table('chat_messages').insert(message_data))
             
             if result.data:
                 logger.info(f"Saved user message to session {session_id}")
@@ -364,9 +485,9 @@ Tone
     async def update_session_end_time(self, session_id: str) -> bool:
         """Update the session end time."""
         try:
-            result = self.supabase.table('chat_sessions').update({
+            result = await execute_async(self.supabase.table('chat_sessions').update({
                 'ended_at': datetime.now().isoformat()
-            }).eq('id', session_id).execute()
+            }).eq('id', session_id))
             
             if result.data:
                 logger.info(f"Updated session end time for {session_id}")
@@ -390,8 +511,19 @@ Tone
         try:
             context_items = []
             
+            # Documents, email logs and meetings are independent queries, so run them concurrently
+            docs_result, emails_result, meetings_result = await asyncio.gather(
+                execute_async(self.supabase.table('documents').select('*').eq('project_id', project_id).eq('created_by', user_id).order('created_at', desc=True).limit(max_results)),
+                execute_async(self.supabase.table('email_processing_logs').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(max_results)),
+                execute_async(self.supabase.table('meetings').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(max_results)),
+                return_exceptions=True
+            )
+            if isinstance(docs_result, Exception):
+                raise docs_result
+            if isinstance(meetings_result, Exception):
+                raise meetings_result
+            
             # Query documents table
-            docs_result = self.supabase.table('documents').select('*').eq('project_id', project_id).eq('created_by', user_id).order('created_at', desc=True).limit(max_results).execute()
             if docs_result.data:
                 for doc in docs_result.data:
                     # Extract content from various possible fields
@@ -414,7 +546,8 @@ Tone
             
             # Query email_processing_logs table (if it has data)
             try:
-                emails_result = self.supabase.table('email_processing_logs').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(max_results).execute()
+                if isinstance(emails_result, Exception):
+                    raise emails_result
                 if emails_result.data:
                     for email in emails_result.data:
                         context_items.append({
@@ -436,7 +569,6 @@ Tone
                 pass
             
             # Query meetings table
-            meetings_result = self.supabase.table('meetings').select('*').eq('project_id', project_id).order('created_at', desc=True).limit(max_results).execute()
             if meetings_result.data:
                 for meeting in meetings_result.data:
                     context_items.append({
@@ -529,14 +661,8 @@ Tone
     ) -> List[Dict[str, Any]]:
         """Retrieve relevant context from Pinecone vector database."""
         try:
-            # Generate query embedding
-            query_embedding = await self.openai_client.embeddings.create(
-                model=self.settings.embedding_model_choice,
-                input=query,
-                encoding_format="float"
-            )
-            
-            query_vector = query_embedding.data[0].embedding
+            # Generate query embedding (cached per normalized query)
+            query_vector = await self.embedding_cache.get_embedding(self.openai_client, query)
             
             # Search Pinecone with project filter
             filter_dict = {
@@ -552,7 +678,7 @@ Tone
             
             # First, let's try a search without filters to see if there's any data at all
             print("=== TESTING PINECONE WITHOUT FILTERS ===")
-            test_results = self.pinecone.Index(self.index_name).query(
+            test_results = await self.vector_store.query(
                 vector=query_vector,
                 top_k=5,
                 include_metadata=True
@@ -565,7 +691,7 @@ Tone
             print("=" * 50)
             
             # Now try with filters
-            search_results = self.pinecone.Index(self.index_name).query(
+            search_results = await self.vector_store.query(
                 vector=query_vector,
                 filter=filter_dict,
                 top_k=max_results,
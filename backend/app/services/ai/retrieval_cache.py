@@ -0,0 +1,131 @@
+"""
+Retrieval Cache
+Caches RAG retrieval results per (project, user, normalized query, corpus version).
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from ...core.config import get_settings
+from ...core.supabase_config import get_supabase_service_client, execute_async
+from .query_embedding_cache import QueryEmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+class RetrievalResultCache:
+    """LRU + TTL cache of retrieval results, invalidated by project corpus version."""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.supabase = get_supabase_service_client()
+        self.max_entries = self.settings.retrieval_cache_max_entries
+        self.ttl_seconds = self.settings.retrieval_cache_ttl_seconds
+        self.version_ttl_seconds = self.settings.retrieval_cache_version_ttl_seconds
+
+        # key -> (expires_at, results)
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        # project_id -> (checked_at, version)
+        self._versions: Dict[str, Tuple[float, int]] = {}
+
+        self._metrics = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'version_lookups': 0,
+            'version_bumps': 0
+        }
+
+    def make_key(self, project_id: str, user_id: str, query: str, version: int, **params) -> str:
+        """Build a cache key from the project, user, normalized query, corpus version and retrieval params."""
+        params_digest = hashlib.sha256(
+            json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()[:16]
+        query_digest = hashlib.sha256(QueryEmbeddingCache.normalize(query).encode('utf-8')).hexdigest()
+        return f"{project_id}:{user_id}:{version}:{query_digest}:{params_digest}"
+
+    async def get_corpus_version(self, project_id: str) -> int:
+        """Get a project's corpus version, re-reading it from Supabase at most every version_ttl_seconds."""
+        cached = self._versions.get(project_id)
+        if cached and time.monotonic() - cached[0] < self.version_ttl_seconds:
+            return cached[1]
+
+        try:
+            self._metrics['version_lookups'] += 1
+            result = await execute_async(
+                self.supabase.table('project_corpus_versions').select('version').eq('project_id', project_id)
+            )
+            version = result.data[0]['version'] if result.data else 0
+        except Exception as e:
+            logger.error(f"Error getting corpus version for project {project_id}: {e}")
+            # Unknown version: use a value that cannot match any cached entry
+            return -int(time.time())
+
+        self._versions[project_id] = (time.monotonic(), version)
+        return version
+
+    async def bump_corpus_version(self, project_id: str) -> Optional[int]:
+        """Bump a project's corpus version after its vectors change."""
+        self._metrics['version_bumps'] += 1
+        self._invalidate_project(project_id)
+        try:
+            result = await execute_async(
+                self.supabase.rpc('bump_project_corpus_version', {'p_project_id': project_id})
+            )
+            version = result.data
+            if isinstance(version, int):
+                self._versions[project_id] = (time.monotonic(), version)
+            return version
+        except Exception as e:
+            logger.error(f"Error bumping corpus version for project {project_id}: {e}")
+            return None
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Get cached results for a key."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._entries.pop(key, None)
+            self._metrics['misses'] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._metrics['hits'] += 1
+        return copy.deepcopy(entry[1])
+
+    def set(self, key: str, results: List[Dict[str, Any]]):
+        """Cache results for a key."""
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(results))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._metrics['evictions'] += 1
+
+    def _invalidate_project(self, project_id: str):
+        """Drop this process's cached results and version for a project."""
+        self._versions.pop(project_id, None)
+        prefix = f"{project_id}:"
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            self._entries.pop(key, None)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters."""
+        metrics = dict(self._metrics)
+        lookups = metrics['hits'] + metrics['misses']
+        metrics['hit_rate'] = metrics['hits'] / lookups if lookups else 0.0
+        metrics['entries'] = len(self._entries)
+        return metrics
+
+# Global retrieval cache instance
+_retrieval_cache: Optional[RetrievalResultCache] = None
+
+def get_retrieval_cache() -> RetrievalResultCache:
+    """Get the global retrieval cache instance."""
+    global _retrieval_cache
+    if _retrieval_cache is None:
+        _retrieval_cache = RetrievalResultCache()
+    return _retrieval_cache
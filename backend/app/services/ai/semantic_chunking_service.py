@@ -3,6 +3,7 @@ Semantic Chunking Service
 Advanced chunking using similarity-based splitting and context enrichment.
 """
 
+import asyncio
 import logging
 import re
 import numpy as np
@@ -33,6 +34,8 @@ class SemanticChunkingService:
         self.min_chunk_tokens = self.settings.min_chunk_tokens
         self.chunk_overlap = self.settings.chunk_overlap
         self.similarity_threshold = self.settings.similarity_threshold
+        self.smoothing_window = self.settings.semantic_smoothing_window
+        self.embedding_batch_size = self.settings.semantic_embedding_batch_size
     
     async def create_semantic_chunks(self, text: str, content: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Create chunks using similarity-based splitting."""
@@ -48,6 +51,8 @@ class SemanticChunkingService:
             
             # Step 2: Generate embeddings for each sentence
             sentence_embeddings = await self._generate_sentence_embeddings(sentences)
+            if sentence_embeddings is None:
+                return self._create_basic_chunks(text, content)
             logger.info(f"Generated {len(sentence_embeddings)} sentence embeddings")
             
             # Step 3: Find semantic boundaries
@@ -90,73 +95,91 @@ class SemanticChunkingService:
         
         return sentences
     
-    async def _generate_sentence_embeddings(self, sentences: List[str]) -> List[List[float]]:
-        """Generate embeddings for each sentence."""
-        try:
-            # Batch process sentences for efficiency
-            batch_size = 50
-            all_embeddings = []
-            
-            for i in range(0, len(sentences), batch_size):
-                batch = sentences[i:i + batch_size]
-                
+    async def _generate_sentence_embeddings(self, sentences: List[str]) -> Optional[np.ndarray]:
+        """
+        Embed sentences in concurrent batched requests.
+        
+        Returns:
+            float32 matrix of shape (len(sentences), dim) with unit-length rows,
+            or None if any batch failed
+        """
+        batch_size = self.embedding_batch_size
+        batches = [sentences[i:i + batch_size] for i in range(0, len(sentences), batch_size)]
+        semaphore = asyncio.Semaphore(max(1, self.settings.embedding_batch_concurrency))
+        
+        async def embed_batch(batch: List[str]) -> np.ndarray:
+            async with semaphore:
                 response = await self.openai_client.embeddings.create(
                     model=self.settings.embedding_model_choice,
                     input=batch,
                     encoding_format="float"
                 )
-                
-                batch_embeddings = [item.embedding for item in response.data]
-                all_embeddings.extend(batch_embeddings)
-            
-            return all_embeddings
-            
+                return np.asarray([item.embedding for item in response.data], dtype=np.float32)
+        
+        try:
+            matrices = await asyncio.gather(*(embed_batch(batch) for batch in batches))
         except Exception as e:
             logger.error(f"Error generating sentence embeddings: {e}")
-            # Return zero vectors as fallback
-            return [[0.0] * 1536 for _ in sentences]
+            return None
+        
+        embeddings = np.vstack(matrices)
+        
+        # Normalize once so adjacent cosine similarity is a row-wise dot product
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embeddings /= norms
+        return embeddings
+    
+    def _adjacent_similarities(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Similarity across each gap between consecutive sentences, in one vectorized pass.
+        
+        Entry i compares the rolling window of up to smoothing_window sentences ending
+        at sentence i with the window starting at sentence i + 1. A window of 1 is the
+        plain cosine similarity of adjacent sentences; wider windows damp single-sentence
+        noise while keeping a sharp drop at real topic shifts.
+        """
+        count = len(embeddings)
+        window = max(1, self.smoothing_window)
+        if window == 1:
+            return np.einsum('ij,ij->i', embeddings[:-1], embeddings[1:])
+        
+        # Window sums from prefix sums over the rows; cosine ignores the 1/window scale
+        prefix = np.zeros((count + 1, embeddings.shape[1]), dtype=np.float32)
+        np.cumsum(embeddings, axis=0, out=prefix[1:])
+        gaps = np.arange(1, count)
+        before = prefix[gaps] - prefix[np.maximum(gaps - window, 0)]
+        after = prefix[np.minimum(gaps + window, count)] - prefix[gaps]
+        
+        norms = np.linalg.norm(before, axis=1) * np.linalg.norm(after, axis=1)
+        norms[norms == 0] = 1.0
+        return np.einsum('ij,ij->i', before, after) / norms
     
-    def _find_semantic_boundaries(self, sentences: List[str], embeddings: List[List[float]]) -> List[int]:
-        """Find boundaries where semantic similarity drops significantly."""
+    def _find_semantic_boundaries(self, sentences: List[str], embeddings: np.ndarray) -> List[int]:
+        """
+        Find boundaries where windowed semantic similarity drops below the threshold.
+        
+        With smoothing enabled, only local minima of the similarity curve become
+        boundaries, so one topic shift yields one boundary instead of a run of them.
+        """
         if len(embeddings) < 2:
             return [0, len(sentences)]
         
-        boundaries = [0]  # Start with first sentence
+        similarities = self._adjacent_similarities(embeddings)
         
-        for i in range(1, len(embeddings)):
-            # Calculate similarity between adjacent sentences
-            similarity = self._cosine_similarity(embeddings[i-1], embeddings[i])
-            
-            # If similarity drops below threshold, it's a boundary
-            if similarity < self.similarity_threshold:
-                boundaries.append(i)
-                logger.debug(f"Semantic boundary found at sentence {i}, similarity: {similarity:.3f}")
+        is_boundary = similarities < self.similarity_threshold
+        if self.smoothing_window > 1 and len(similarities) > 2:
+            padded = np.concatenate(([np.inf], similarities, [np.inf]))
+            is_boundary &= (similarities <= padded[:-2]) & (similarities <= padded[2:])
         
-        boundaries.append(len(sentences))  # End boundary
+        # Similarity i is between sentences i and i + 1, so the boundary starts sentence i + 1
+        boundaries = [0] + (np.flatnonzero(is_boundary) + 1).tolist() + [len(sentences)]
         
         # Ensure we don't have too many small chunks
         boundaries = self._merge_small_chunks(sentences, boundaries)
         
         return boundaries
     
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """Calculate cosine similarity between two vectors."""
-        try:
-            vec1 = np.array(vec1)
-            vec2 = np.array(vec2)
-            
-            dot_product = np.dot(vec1, vec2)
-            norm1 = np.linalg.norm(vec1)
-            norm2 = np.linalg.norm(vec2)
-            
-            if norm1 == 0 or norm2 == 0:
-                return 0.0
-            
-            return dot_product / (norm1 * norm2)
-        except Exception as e:
-            logger.error(f"Error calculating cosine similarity: {e}")
-            return 0.0
-    
     def _merge_small_chunks(self, sentences: List[str], boundaries: List[int]) -> List[int]:
         """Merge chunks that are too small."""
         merged_boundaries = [boundaries[0]]
@@ -0,0 +1,258 @@
+"""
+Token Chunking Engine
+Tokenizes text once and finds chunk boundaries using a precomputed token-to-character offset table.
+"""
+
+import logging
+import re
+import time
+from bisect import bisect_left, bisect_right
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Boundary patterns in priority order
+SENTENCE_BOUNDARY_PATTERNS = (
+    r'\.\s+',  # Period followed by space
+    r'!\s+',   # Exclamation followed by space
+    r'\?\s+',  # Question mark followed by space
+    r'\.\n',   # Period followed by newline
+    r';\s+',   # Semicolon followed by space
+    r':\s+',   # Colon followed by space
+    r',\s+',   # Comma followed by space
+)
+
+LEVEL_BOUNDARY_PATTERNS = {
+    'document': (
+        r'\n\n+',    # Double newlines
+        r'\.\s*\n',  # Period + newline
+        r'!\s*\n',   # Exclamation + newline
+        r'\?\s*\n',  # Question + newline
+    ),
+    'section': (
+        r'\n+',      # Newlines
+        r'\.\s+',    # Period + space
+        r';\s+',     # Semicolon + space
+        r':\s+',     # Colon + space
+    ),
+    'paragraph': (
+        r'\.\s+',    # Period + space
+        r'!\s+',     # Exclamation + space
+        r'\?\s+',    # Question + space
+        r';\s+',     # Semicolon + space
+    ),
+    'sentence': (
+        r'\.\s+',    # Period + space
+        r'!\s+',     # Exclamation + space
+        r'\?\s+',    # Question + space
+    ),
+}
+
+
+# encoding name -> byte length of every token ID
+_token_byte_lengths: Dict[str, np.ndarray] = {}
+
+
+def token_byte_lengths(tokenizer) -> np.ndarray:
+    """Get a lookup table of token ID -> byte length for a tiktoken encoding, built once per process."""
+    lengths = _token_byte_lengths.get(tokenizer.name)
+    if lengths is None:
+        lengths = np.zeros(tokenizer.max_token_value + 1, dtype=np.int64)
+        for token in range(tokenizer.max_token_value + 1):
+            try:
+                lengths[token] = len(tokenizer.decode_single_token_bytes(token))
+            except KeyError:
+                continue
+        _token_byte_lengths[tokenizer.name] = lengths
+    return lengths
+
+
+class TokenizedText:
+    """Text tokenized once, with character offsets for every token."""
+
+    def __init__(self, text: str, tokenizer):
+        self.tokenizer = tokenizer
+        self.text = text
+        self.tokens = tokenizer.encode(text)
+        # offsets[i] is the character where token i starts; offsets[len(tokens)] is the end of text
+        self.offsets = self._char_offsets()
+
+        # pattern -> sorted character positions where a match of the pattern ends
+        self._match_ends: Dict[str, List[int]] = {}
+
+    def _char_offsets(self) -> List[int]:
+        """Build the token-to-character offset table from token byte lengths."""
+        data = self.text.encode('utf-8')
+        byte_offsets = np.zeros(len(self.tokens) + 1, dtype=np.int64)
+        np.cumsum(token_byte_lengths(self.tokenizer)[np.asarray(self.tokens, dtype=np.int64)], out=byte_offsets[1:])
+
+        if byte_offsets[-1] != len(data):
+            # Tokens do not round-trip to the input bytes; fall back to tiktoken's offsets
+            self.text, offsets = self.tokenizer.decode_with_offsets(self.tokens)
+            return list(offsets) + [len(self.text)]
+
+        if self.text.isascii():
+            return byte_offsets.tolist()
+
+        # Character index of a byte = number of UTF-8 lead bytes before it; a token that
+        # starts inside a multi-byte character maps to that character
+        raw = np.frombuffer(data, dtype=np.uint8)
+        is_continuation = (raw & 0xC0) == 0x80
+        chars_before = np.concatenate(([0], np.cumsum(~is_continuation)))
+        starts_inside = np.append(is_continuation, False)[byte_offsets]
+        return (chars_before[byte_offsets] - starts_inside).tolist()
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def slice_text(self, start: int, end: int) -> str:
+        """Get the text covered by tokens[start:end] without decoding."""
+        return self.text[self.offsets[start]:self.offsets[end]]
+
+    def token_at_char(self, position: int, lo: int = 0, hi: Optional[int] = None) -> int:
+        """Get the first token that starts at or after a character position."""
+        return bisect_left(self.offsets, position, lo, len(self.tokens) if hi is None else hi)
+
+    def _pattern_ends(self, pattern: str) -> List[int]:
+        ends = self._match_ends.get(pattern)
+        if ends is None:
+            # Each pattern is scanned over the whole text once and reused for every window
+            ends = [match.end() for match in re.finditer(pattern, self.text)]
+            self._match_ends[pattern] = ends
+        return ends
+
+    def find_boundary(self, start: int, max_end: int, patterns: Sequence[str], min_fraction: float = 0.3) -> int:
+        """
+        Find the best token boundary in tokens[start:max_end].
+
+        Patterns are tried in priority order; for the first one with a match ending
+        past min_fraction of the window, the boundary is the first token starting at
+        or after the last such match. Returns max_end if no boundary is found.
+        """
+        char_start = self.offsets[start]
+        char_end = self.offsets[max_end]
+        threshold = char_start + (char_end - char_start) * min_fraction
+
+        for pattern in patterns:
+            ends = self._pattern_ends(pattern)
+            i = bisect_right(ends, char_end) - 1
+            if i < 0 or ends[i] <= threshold:
+                continue
+
+            boundary = self.token_at_char(ends[i], start, max_end)
+            if start < boundary < max_end:
+                return boundary
+
+        return max_end
+
+    def iter_windows(self, max_tokens: int, overlap: int, patterns: Sequence[str],
+                     span_start: int = 0, span_end: Optional[int] = None) -> Iterator[Tuple[int, int]]:
+        """Yield (start, end) token windows of at most max_tokens within a span, ending on semantic boundaries."""
+        total = len(self.tokens) if span_end is None else span_end
+        start = span_start
+
+        while start < total:
+            # Calculate chunk end position
+            end = min(start + max_tokens, total)
+
+            # Try to find a good semantic boundary
+            if end < total:
+                end = self.find_boundary(start, end, patterns)
+
+            yield start, end
+
+            # Move to next chunk with overlap
+            start = max(start + max_tokens - overlap, end - overlap)
+
+            # Break if we've covered most of the content
+            if start >= total - overlap:
+                break
+
+
+def benchmark_boundary_finder(text: str, tokenizer, max_tokens: int = 500, overlap: int = 50,
+                              patterns: Sequence[str] = SENTENCE_BOUNDARY_PATTERNS) -> Dict[str, Any]:
+    """
+    Compare chunking a text with TokenizedText against per-window decoding.
+
+    The reference path decodes each window, runs every pattern over it and maps
+    characters back to tokens by decoding tokens one at a time. Windows can differ
+    where a token splits a multi-byte character, which the reference miscounts.
+
+    Returns:
+        Timings in milliseconds, chunk counts and whether both produced the same windows
+    """
+    def reference_windows() -> List[Tuple[int, int]]:
+        tokens = tokenizer.encode(text)
+        windows = []
+        start = 0
+        while start < len(tokens):
+            end = min(start + max_tokens, len(tokens))
+            if end < len(tokens):
+                window_text = tokenizer.decode(tokens[start:end])
+                boundary = end
+                for pattern in patterns:
+                    matches = [m for m in re.finditer(pattern, window_text) if m.end() > len(window_text) * 0.3]
+                    if matches:
+                        position = matches[-1].end()
+                        char_pos = 0
+                        for i, token in enumerate(tokens[start:end]):
+                            if char_pos >= position:
+                                boundary = start + i
+                                break
+                            char_pos += len(tokenizer.decode([token]))
+                    if boundary < end:
+                        break
+                end = boundary
+            windows.append((start, end))
+            start = max(start + max_tokens - overlap, end - overlap)
+            if start >= len(tokens) - overlap:
+                break
+        return windows
+
+    reference_start = time.perf_counter()
+    expected = reference_windows()
+    reference_ms = (time.perf_counter() - reference_start) * 1000
+
+    engine_start = time.perf_counter()
+    tokenized = TokenizedText(text, tokenizer)
+    windows = list(tokenized.iter_windows(max_tokens, overlap, patterns))
+    engine_ms = (time.perf_counter() - engine_start) * 1000
+
+    return {
+        'tokens': len(tokenized),
+        'chunks': len(windows),
+        'reference_ms': round(reference_ms, 2),
+        'engine_ms': round(engine_ms, 2),
+        'speedup': round(reference_ms / engine_ms, 1) if engine_ms else None,
+        'windows_match': windows == expected
+    }
+
+
+if __name__ == "__main__":
+    # Micro-benchmark on a synthetic long meeting transcript:
+    #   python -m app.services.ai.token_chunking
+    import random
+    import tiktoken
+
+    speakers = ['Alex', 'Jordan', 'Sam', 'Taylor']
+    phrases = [
+        "we need to lock the shooting schedule for next week",
+        "the client wants a second pass on the color grade",
+        "can we move the location scout to Thursday",
+        "budget for the drone crew is still pending approval",
+        "let's review the rough cut before Friday",
+        "the talent contracts went out yesterday",
+    ]
+    rng = random.Random(0)
+    lines = []
+    for minute in range(2000):
+        sentence = ", ".join(rng.sample(phrases, 2))
+        lines.append(f"[{minute // 60:02d}:{minute % 60:02d}] {rng.choice(speakers)}: {sentence.capitalize()}{rng.choice(['.', '?', '!'])}")
+    transcript = "\n".join(lines)
+
+    encoding = tiktoken.get_encoding("cl100k_base")
+    token_byte_lengths(encoding)  # One-time table build, excluded from timings
+    for window in (200, 500, 2000):
+        print(window, benchmark_boundary_finder(transcript, encoding, max_tokens=window, overlap=window // 10))
@@ -4,19 +4,25 @@ Handles chunking, embedding, and storing content in Pinecone vector database.
 Integrates with classification results to store project-specific metadata.
 """
 
+import asyncio
+import hashlib
 import logging
-import uuid
-from typing import Dict, Any, List, Optional
+import time
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 import tiktoken
 import openai
-from pinecone import Pinecone, ServerlessSpec
 
-from ...core.supabase_config import get_supabase_service_client
+from ...core.supabase_config import get_supabase_service_client, execute_async
 from ...core.config import get_settings
+from ...core.vector_store import get_vector_store
 from .semantic_chunking_service import SemanticChunkingService
 from .hierarchical_chunking_service import HierarchicalChunkingService
 from .contextual_retrieval_service import ContextualRetrievalService
+from .query_embedding_cache import get_query_embedding_cache
+from .retrieval_cache import get_retrieval_cache
+from .token_chunking import TokenizedText, SENTENCE_BOUNDARY_PATTERNS
+from .near_duplicate_detector import NearDuplicateDetector
 
 logger = logging.getLogger(__name__)
 
@@ -33,12 +39,11 @@ class VectorEmbeddingService:
             base_url=self.settings.embedding_base_url
         )
         
-        # Initialize Pinecone client
-        self.pinecone = Pinecone(api_key=self.settings.pinecone_api_key)
+        # Shared Pinecone client; the index is created on first use if missing
+        self.vector_store = get_vector_store()
         self.index_name = self.settings.pinecone_vector_store
-        
-        # Get or create Pinecone index
-        self.index = self._get_or_create_index()
+        self.index = self.vector_store.ensure_index(self.index_name, dimension=1536)
+        self.embedding_cache = get_query_embedding_cache()
         
         # Tokenizer for chunking
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
@@ -54,39 +59,6 @@ class VectorEmbeddingService:
         self.chunk_overlap = self.settings.chunk_overlap
         self.max_chunk_characters = 2000  # Character limit as fallback
     
-    def _get_or_create_index(self):
-        """Get existing index or create new one if it doesn't exist."""
-        try:
-            # Check if index exists
-            if self.index_name not in self.pinecone.list_indexes().names():
-                logger.info(f"Creating new Pinecone index: {self.index_name}")
-                
-                # Create index with serverless spec
-                self.pinecone.create_index(
-                    name=self.index_name,
-                    dimension=1536,  # OpenAI embedding model dimension
-                    metric="cosine",
-                    spec=ServerlessSpec(
-                        cloud="aws",
-                        region="us-east-1"
-                    )
-                )
-                
-                # Wait for index to be ready
-                while not self.pinecone.describe_index(self.index_name).status['ready']:
-                    import time
-                    time.sleep(1)
-                
-                logger.info(f"Pinecone index {self.index_name} created successfully")
-            else:
-                logger.info(f"Using existing Pinecone index: {self.index_name}")
-            
-            return self.pinecone.Index(self.index_name)
-            
-        except Exception as e:
-            logger.error(f"Error setting up Pinecone index: {e}")
-            raise
-    
     async def embed_classified_content(
         self,
         content: Dict[str, Any],
@@ -127,71 +99,115 @@ class VectorEmbeddingService:
             chunks = await self._create_content_chunks(content)
             logger.info(f"Created {len(chunks)} chunks for content: {content.get('source_id', 'unknown')}")
             
-            # Generate embeddings for each chunk
+            # Deterministic IDs let re-ingests skip chunks that are already stored
+            source_key = content.get('source_id') or self._content_source_key(chunks)
+            
+            # Reject near-duplicates of other sources' chunks before any embedding call
+            chunks = await self._drop_project_duplicates(chunks, project_id, source_key)
+            chunk_ids = [self._chunk_vector_id(source_key, chunk) for chunk in chunks]
+            # Hierarchical chunks link to their parent by vector ID so retrieval can expand a match
+            hierarchy_ids = {chunk['chunk_id']: chunk_ids[i] for i, chunk in enumerate(chunks) if chunk.get('chunk_id')}
+            manifest = await self._get_chunk_manifest(source_key)
+            
+            pending_indexes = []
+            current_ids = set()
+            for i, vector_id in enumerate(chunk_ids):
+                if vector_id in current_ids:
+                    continue
+                current_ids.add(vector_id)
+                entry = manifest.get(vector_id)
+                if entry and str(entry.get('project_id')) == str(project_id):
+                    continue
+                pending_indexes.append(i)
+            
+            stale_ids = [vector_id for vector_id in manifest if vector_id not in current_ids]
+            unchanged_count = len(current_ids) - len(pending_indexes)
+            affected_projects = {project_id} | {
+                str(manifest[vector_id]['project_id'])
+                for vector_id in stale_ids + [chunk_ids[i] for i in pending_indexes]
+                if vector_id in manifest and manifest[vector_id].get('project_id')
+            }
+            
+            if not pending_indexes and not stale_ids:
+                logger.info(f"All {unchanged_count} chunks unchanged for content: {source_key}")
+                return {
+                    'embedded': True,
+                    'chunks_created': 0,
+                    'chunks_unchanged': unchanged_count,
+                    'chunks_deleted': 0,
+                    'project_id': project_id,
+                    'confidence': classification_result.get('confidence', 0.0),
+                    'embedding_ids': []
+                }
+            
+            # Generate embeddings for new or changed chunks in token-budgeted batch requests
+            embed_start = time.perf_counter()
+            chunk_vectors, total_tokens = await self._embed_texts([chunks[i]['text'] for i in pending_indexes])
+            
             embeddings = []
-            for i, chunk in enumerate(chunks):
-                try:
-                    # Generate embedding
-                    embedding_response = await self.openai_client.embeddings.create(
-                        model=self.settings.embedding_model_choice,
-                        input=chunk['text'],
-                        encoding_format="float"
-                    )
-                    
-                    embedding_vector = embedding_response.data[0].embedding
-                    
-                    # Create metadata for the chunk
-                    metadata = {
-                        'user_id': user_id,
-                        'project_id': project_id,
-                        'content_type': content.get('type', 'unknown'),
-                        'source_id': content.get('source_id', ''),
-                        'chunk_index': i,
-                        'total_chunks': len(chunks),
-                        'author': content.get('author', ''),
-                        'date': content.get('date', ''),
-                        'subject': content.get('subject', ''),
-                        'chunk_text': chunks[i]['text'],  # Add the actual chunk text content
-                        'confidence': classification_result.get('confidence', 0.0),
-                        'matched_tags': classification_result.get('document', {}).get('matched_tags', []),
-                        'inferred_tags': classification_result.get('document', {}).get('inferred_tags', []),
-                        'classification_notes': classification_result.get('document', {}).get('classification_notes', ''),
-                        'embedded_at': datetime.now().isoformat()
-                    }
-                    
-                    # Add source-specific metadata
-                    if content.get('type') == 'email':
-                        metadata.update({
-                            'email_id': content.get('metadata', {}).get('email_id', ''),
-                            'inbound_address': content.get('metadata', {}).get('inbound_address', ''),
-                            'attachments': content.get('attachments', [])
-                        })
-                    elif content.get('type') == 'drive_file':
-                        metadata.update({
-                            'drive_file_id': content.get('metadata', {}).get('drive_file_id', ''),
-                            'drive_url': content.get('metadata', {}).get('drive_url', ''),
-                            'file_type': content.get('metadata', {}).get('file_type', ''),
-                            'file_size': content.get('metadata', {}).get('file_size', 0)
-                        })
-                    elif content.get('type') == 'transcript':
-                        metadata.update({
-                            'meeting_id': content.get('metadata', {}).get('meeting_id', ''),
-                            'meeting_url': content.get('metadata', {}).get('meeting_url', ''),
-                            'duration_minutes': content.get('metadata', {}).get('duration_minutes', 0),
-                            'attendees': content.get('metadata', {}).get('attendees', [])
-                        })
-                    
-                    embeddings.append({
-                        'id': f"{content.get('source_id', '')}_chunk_{i}_{uuid.uuid4().hex[:8]}",
-                        'values': embedding_vector,
-                        'metadata': metadata
-                    })
-                    
-                except Exception as e:
-                    logger.error(f"Error generating embedding for chunk {i}: {e}")
+            for i, embedding_vector in zip(pending_indexes, chunk_vectors):
+                if embedding_vector is None:
                     continue
+                chunk = chunks[i]
+                
+                # Create metadata for the chunk
+                metadata = {
+                    'user_id': user_id,
+                    'project_id': project_id,
+                    'content_type': content.get('type', 'unknown'),
+                    'source_id': content.get('source_id', ''),
+                    'chunk_index': i,
+                    'total_chunks': len(chunks),
+                    'author': content.get('author', ''),
+                    'date': content.get('date', ''),
+                    'subject': content.get('subject', ''),
+                    'chunk_text': chunk['text'],  # Add the actual chunk text content
+                    'confidence': classification_result.get('confidence', 0.0),
+                    'matched_tags': classification_result.get('document', {}).get('matched_tags', []),
+                    'inferred_tags': classification_result.get('document', {}).get('inferred_tags', []),
+                    'classification_notes': classification_result.get('document', {}).get('classification_notes', ''),
+                    'embedded_at': datetime.now().isoformat()
+                }
+                
+                if 'parent_chunk_id' in chunk:
+                    metadata.update({
+                        'level': chunk.get('level', ''),
+                        'parent_id': hierarchy_ids.get(chunk.get('parent_chunk_id'), '')
+                    })
+                
+                # Add source-specific metadata
+                if content.get('type') == 'email':
+                    metadata.update({
+                        'email_id': content.get('metadata', {}).get('email_id', ''),
+                        'inbound_address': content.get('metadata', {}).get('inbound_address', ''),
+                        'attachments': content.get('attachments', [])
+                    })
+                elif content.get('type') == 'drive_file':
+                    metadata.update({
+                        'drive_file_id': content.get('metadata', {}).get('drive_file_id', ''),
+                        'drive_url': content.get('metadata', {}).get('drive_url', ''),
+                        'file_type': content.get('metadata', {}).get('file_type', ''),
+                        'file_size': content.get('metadata', {}).get('file_size', 0)
+                    })
+                elif content.get('type') == 'transcript':
+                    metadata.update({
+                        'meeting_id': content.get('metadata', {}).get('meeting_id', ''),
+                        'meeting_url': content.get('metadata', {}).get('meeting_url', ''),
+                        'duration_minutes': content.get('metadata', {}).get('duration_minutes', 0),
+                        'attendees': content.get('metadata', {}).get('attendees', [])
+                    })
+                
+                embeddings.append({
+                    'id': chunk_ids[i],
+                    'values': embedding_vector,
+                    'metadata': metadata,
+                    'minhash': chunk.get('minhash'),
+                    'minhash_bands': chunk.get('minhash_bands')
+                })
             
-            if not embeddings:
+            embed_seconds = time.perf_counter() - embed_start
+            
+            if pending_indexes and not embeddings:
                 logger.error("No embeddings generated for any chunks")
                 return {
                     'embedded': False,
@@ -199,18 +215,36 @@ class VectorEmbeddingService:
                     'chunks_created': 0
                 }
             
-            # Store embeddings in Pinecone
-            self.index.upsert(vectors=embeddings)
-            logger.info(f"Successfully stored {len(embeddings)} embeddings in Pinecone")
-            
-            # Debug: Log what content was embedded
-            for i, emb in enumerate(embeddings):
-                chunk_text = emb['metadata'].get('chunk_text', '')
-                print(f"=== EMBEDDED CHUNK {i+1}/{len(embeddings)} ===")
-                print(f"Length: {len(chunk_text)}")
-                print(f"Preview: {chunk_text[:200]}...")
-                print(f"Full content: {chunk_text}")
-                print("=" * 50)
+            # Store embeddings in Pinecone (the vector store upserts in size-capped batches)
+            if embeddings:
+                await self.vector_store.upsert(
+                    [{key: emb[key] for key in ('id', 'values', 'metadata')} for emb in embeddings],
+                    index_name=self.index_name
+                )
+                await self._record_chunk_manifest(source_key, embeddings, project_id, user_id)
+                logger.info(f"Successfully stored {len(embeddings)} embeddings in Pinecone")
+            
+            # Remove chunks that no longer exist in the content
+            if stale_ids:
+                await self.vector_store.delete(ids=stale_ids, index_name=self.index_name)
+                await self._delete_chunk_manifest(source_key, stale_ids)
+                logger.info(f"Deleted {len(stale_ids)} stale chunks for content: {source_key}")
+            
+            # Invalidate cached retrieval results for the affected projects
+            for affected_project_id in affected_projects:
+                await get_retrieval_cache().bump_corpus_version(affected_project_id)
+            
+            throughput = {
+                'embedding_time_ms': int(embed_seconds * 1000),
+                'total_tokens': total_tokens,
+                'chunks_per_second': round(len(embeddings) / embed_seconds, 2) if embed_seconds > 0 else None,
+                'tokens_per_second': round(total_tokens / embed_seconds, 2) if embed_seconds > 0 else None
+            }
+            logger.info(
+                f"Embedded {len(embeddings)}/{len(chunks)} chunks ({total_tokens} tokens) in "
+                f"{throughput['embedding_time_ms']}ms: {throughput['chunks_per_second']} chunks/s, "
+                f"{throughput['tokens_per_second']} tokens/s"
+            )
             
             # Log embedding activity
             await self._log_embedding_activity(content, classification_result, user_id, len(embeddings))
@@ -220,7 +254,10 @@ class VectorEmbeddingService:
                 'chunks_created': len(embeddings),
                 'project_id': project_id,
                 'confidence': classification_result.get('confidence', 0.0),
-                'embedding_ids': [emb['id'] for emb in embeddings]
+                'chunks_unchanged': unchanged_count,
+                'chunks_deleted': len(stale_ids),
+                'embedding_ids': [emb['id'] for emb in embeddings],
+                'throughput': throughput
             }
             
         except Exception as e:
@@ -231,6 +268,114 @@ class VectorEmbeddingService:
                 'chunks_created': 0
             }
     
+    async def _embed_texts(self, texts: List[str]) -> Tuple[List[Optional[List[float]]], int]:
+        """
+        Embed texts in batched requests, each within a token and input budget.
+        
+        Batches run concurrently up to embedding_batch_concurrency. A failed batch
+        leaves None for its texts rather than failing the whole document.
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            Tuple of (vectors in input order, total tokens embedded)
+        """
+        max_tokens = self.settings.embedding_batch_max_tokens
+        max_inputs = self.settings.embedding_batch_max_inputs
+        
+        # Pack consecutive texts into batches under the token and input caps
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        token_counts = [len(self.tokenizer.encode(text)) for text in texts]
+        for i, token_count in enumerate(token_counts):
+            if current and (current_tokens + token_count > max_tokens or len(current) >= max_inputs):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += token_count
+        if current:
+            batches.append(current)
+        
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        semaphore = asyncio.Semaphore(max(1, self.settings.embedding_batch_concurrency))
+        
+        async def embed_batch(batch: List[int]) -> int:
+            async with semaphore:
+                try:
+                    response = await self.openai_client.embeddings.create(
+                        model=self.settings.embedding_model_choice,
+                        input=[texts[i] for i in batch],
+                        encoding_format="float"
+                    )
+                    for item in response.data:
+                        vectors[batch[item.index]] = item.embedding
+                    return sum(token_counts[i] for i in batch)
+                except Exception as e:
+                    logger.error(f"Error generating embeddings for batch of {len(batch)} chunks: {e}")
+                    return 0
+        
+        embedded_tokens = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        logger.info(f"Embedded {len(texts)} chunks in {len(batches)} batch requests")
+        return vectors, sum(embedded_tokens)
+    
+    def _chunk_vector_id(self, source_key: str, chunk: Dict[str, Any]) -> str:
+        """Build a deterministic vector ID from the source, embedding model and chunk content."""
+        # Contextual chunks prepend a generated summary; hash the underlying chunk text
+        chunk_text = chunk.get('original_text') or chunk['text']
+        digest = hashlib.sha256(
+            f"{self.settings.embedding_model_choice}\0{source_key}\0{chunk_text}".encode('utf-8')
+        ).hexdigest()
+        return f"{source_key}_chunk_{digest[:32]}"
+    
+    def _content_source_key(self, chunks: List[Dict[str, Any]]) -> str:
+        """Derive a stable source key for content without a source_id."""
+        digest = hashlib.sha256()
+        for chunk in chunks:
+            digest.update((chunk.get('original_text') or chunk['text']).encode('utf-8'))
+        return f"content_{digest.hexdigest()[:16]}"
+    
+    async def _get_chunk_manifest(self, source_key: str) -> Dict[str, Dict[str, Any]]:
+        """Get the stored chunks for a source, keyed by vector ID."""
+        try:
+            result = await execute_async(
+                self.supabase.table('vector_chunk_manifest').select('vector_id, project_id').eq('source_id', source_key)
+            )
+            return {row['vector_id']: row for row in result.data or []}
+        except Exception as e:
+            logger.error(f"Error getting chunk manifest for {source_key}: {e}")
+            return {}
+    
+    async def _record_chunk_manifest(self, source_key: str, embeddings: List[Dict[str, Any]], project_id: str, user_id: str):
+        """Record embedded chunks in the manifest."""
+        try:
+            rows = [
+                {
+                    'source_id': source_key,
+                    'vector_id': emb['id'],
+                    'project_id': project_id,
+                    'user_id': user_id,
+                    'embedded_at': emb['metadata']['embedded_at'],
+                    'minhash': NearDuplicateDetector.encode_signature(emb['minhash']) if emb.get('minhash') is not None else None,
+                    'band_hashes': emb.get('minhash_bands')
+                }
+                for emb in embeddings
+            ]
+            await execute_async(self.supabase.table('vector_chunk_manifest').upsert(rows, on_conflict='source_id,vector_id'))
+        except Exception as e:
+            logger.error(f"Error recording chunk manifest for {source_key}: {e}")
+    
+    async def _delete_chunk_manifest(self, source_key: str, vector_ids: Optional[List[str]] = None):
+        """Remove deleted chunks from the manifest, or every chunk of the source when no IDs are given."""
+        try:
+            query = self.supabase.table('vector_chunk_manifest').delete().eq('source_id', source_key)
+            if vector_ids is not None:
+                query = query.in_('vector_id', vector_ids)
+            await execute_async(query)
+        except Exception as e:
+            logger.error(f"Error deleting chunk manifest entries for {source_key}: {e}")
+    
     async def delete_document_vectors(self, document_id: str, user_id: str) -> bool:
         """
         Delete all vectors associated with a document from Pinecone.
@@ -246,18 +391,21 @@ class VectorEmbeddingService:
             logger.info(f"Deleting vectors for document {document_id}")
             
             # Query Pinecone to find all vectors with this document_id
-            query_response = self.index.query(
+            query_response = await self.vector_store.query(
                 vector=[0] * 1536,  # Dummy vector for querying by metadata
                 top_k=10000,  # Large number to get all matches
                 include_metadata=True,
                 filter={
                     "document_id": document_id,
                     "user_id": user_id
-                }
+                },
+                index_name=self.index_name
             )
             
             if not query_response.matches:
                 logger.info(f"No vectors found for document {document_id}")
+                # Still clear the manifest so a later re-ingest embeds every chunk again
+                await self._delete_chunk_manifest(document_id)
                 return True
             
             # Extract vector IDs to delete
@@ -266,8 +414,19 @@ class VectorEmbeddingService:
             
             # Delete vectors from Pinecone
             if vector_ids:
-                self.index.delete(ids=vector_ids)
+                await self.vector_store.delete(ids=vector_ids, index_name=self.index_name)
                 logger.info(f"Successfully deleted {len(vector_ids)} vectors for document {document_id}")
+                
+                # Drop the manifest rows too, or a re-ingest would skip chunks that no longer exist
+                source_keys = {document_id}
+                source_keys.update(match.metadata.get('source_id') for match in query_response.matches if match.metadata)
+                for source_key in filter(None, source_keys):
+                    await self._delete_chunk_manifest(source_key)
+                
+                # Invalidate cached retrieval results for affected projects
+                project_ids = {match.metadata.get('project_id') for match in query_response.matches if match.metadata}
+                for project_id in filter(None, project_ids):
+                    await get_retrieval_cache().bump_corpus_version(project_id)
             
             return True
             
@@ -290,8 +449,12 @@ class VectorEmbeddingService:
             # Clean and preprocess content
             cleaned_text = self._preprocess_content(content_text)
             
+            # Hierarchical chunks embed every level, each vector linked to its parent's
+            if self.settings.use_hierarchical_chunking:
+                chunks = await self.hierarchical_chunker.create_hierarchical_chunks(cleaned_text, content)
+                optimized_chunks = self._optimize_chunks(chunks)
             # Use contextual retrieval if enabled
-            if self.settings.use_contextual_retrieval:
+            elif self.settings.use_contextual_retrieval:
                 contextual_chunks = await self.contextual_retrieval.create_contextual_chunks({
                     **content,
                     'content_text': cleaned_text
@@ -360,144 +523,102 @@ class VectorEmbeddingService:
     
     def _create_semantic_chunks(self, text: str, content: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Create chunks with semantic boundary detection."""
-        # Tokenize the content
-        tokens = self.tokenizer.encode(text)
+        # Tokenize the content once
+        tokenized = TokenizedText(text, self.tokenizer)
         
-        if len(tokens) <= self.max_chunk_tokens:
+        if len(tokenized) <= self.max_chunk_tokens:
             return [{
                 'text': text,
                 'start_token': 0,
-                'end_token': len(tokens),
-                'token_count': len(tokens),
+                'end_token': len(tokenized),
+                'token_count': len(tokenized),
                 'chunk_type': 'single',
                 'source_type': content.get('type', 'unknown')
             }]
         
         chunks = []
-        start = 0
-        
-        while start < len(tokens):
-            # Calculate chunk end position
-            end = min(start + self.max_chunk_tokens, len(tokens))
-            
-            # Try to find a good semantic boundary
-            if end < len(tokens):
-                end = self._find_semantic_boundary(tokens, start, end)
-            
-            # Extract chunk tokens
-            chunk_tokens = tokens[start:end]
-            chunk_text = self.tokenizer.decode(chunk_tokens).strip()
-            
+        for start, end in tokenized.iter_windows(self.max_chunk_tokens, self.chunk_overlap, SENTENCE_BOUNDARY_PATTERNS):
             # Skip chunks that are too small
-            if len(chunk_tokens) >= self.min_chunk_tokens:
+            if end - start >= self.min_chunk_tokens:
                 chunks.append({
-                    'text': chunk_text,
+                    'text': tokenized.slice_text(start, end).strip(),
                     'start_token': start,
                     'end_token': end,
-                    'token_count': len(chunk_tokens),
+                    'token_count': end - start,
                     'chunk_type': 'semantic',
                     'source_type': content.get('type', 'unknown')
                 })
-            
-            # Move to next chunk with minimal overlap
-            # Use the actual end position to calculate next start, ensuring minimal overlap
-            start = max(start + self.max_chunk_tokens - self.chunk_overlap, end - self.chunk_overlap)
-            
-            # Break if we've covered most of the content
-            if start >= len(tokens) - self.chunk_overlap:
-                break
         
         return chunks
     
-    def _find_semantic_boundary(self, tokens: List[int], start: int, max_end: int) -> int:
-        """Find the best semantic boundary for chunking."""
-        # Look for sentence boundaries within the chunk
-        text = self.tokenizer.decode(tokens[start:max_end])
-        
-        # Priority order for boundary detection
-        boundary_patterns = [
-            r'\.\s+',  # Period followed by space
-            r'!\s+',   # Exclamation followed by space
-            r'\?\s+',  # Question mark followed by space
-            r'\.\n',   # Period followed by newline
-            r';\s+',   # Semicolon followed by space
-            r':\s+',   # Colon followed by space
-            r',\s+',   # Comma followed by space
-        ]
-        
-        best_boundary = max_end
-        best_position = 0
-        
-        for pattern in boundary_patterns:
-            import re
-            matches = list(re.finditer(pattern, text))
-            if matches:
-                # Find the last match that's not too close to the start
-                for match in reversed(matches):
-                    position = match.end()
-                    if position > len(text) * 0.3:  # At least 30% into the chunk
-                        # Convert character position back to token position
-                        char_start = start
-                        for i, token in enumerate(tokens[start:max_end]):
-                            if char_start >= position:
-                                best_boundary = start + i
-                                break
-                            char_start += len(self.tokenizer.decode([token]))
-                        break
-                if best_boundary < max_end:
-                    break
-        
-        return best_boundary
-    
     def _optimize_chunks(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Post-process chunks to ensure quality and remove redundancy."""
         if not chunks:
             return chunks
         
         optimized = []
-        seen_texts = set()
+        detector = NearDuplicateDetector()
         
         for i, chunk in enumerate(chunks):
-            # Skip if chunk is too similar to previous chunks
+            # Skip if chunk is a near-duplicate of an earlier chunk (whole-chunk shingles)
             chunk_text = chunk['text']
-            if self._is_duplicate_chunk(chunk_text, seen_texts):
+            signature = detector.signature(chunk.get('original_text') or chunk_text)
+            band_hashes = detector.band_hashes(signature)
+            if detector.find_duplicate(signature, band_hashes):
                 continue
             
             # Add chunk metadata
-            chunk['chunk_id'] = f"chunk_{i}_{hash(chunk_text) % 10000}"
+            chunk.setdefault('chunk_id', f"chunk_{i}_{hash(chunk_text) % 10000}")
             chunk['quality_score'] = self._calculate_chunk_quality(chunk)
             
             # Only include high-quality chunks
             if chunk['quality_score'] > 0.3:
+                chunk['minhash'] = signature
+                chunk['minhash_bands'] = band_hashes
                 optimized.append(chunk)
-                seen_texts.add(chunk_text[:100])  # Store first 100 chars for deduplication
+                detector.add(str(i), signature, band_hashes)
         
         return optimized
     
-    def _is_duplicate_chunk(self, text: str, seen_texts: set) -> bool:
-        """Check if chunk is too similar to previously seen chunks."""
-        text_preview = text[:100]
-        for seen in seen_texts:
-            if self._calculate_similarity(text_preview, seen) > 0.8:
-                return True
-        return False
-    
-    def _calculate_similarity(self, text1: str, text2: str) -> float:
-        """Calculate simple text similarity for deduplication."""
-        if not text1 or not text2:
-            return 0.0
-        
-        # Simple Jaccard similarity
-        words1 = set(text1.lower().split())
-        words2 = set(text2.lower().split())
-        
-        if not words1 or not words2:
-            return 0.0
-        
-        intersection = len(words1.intersection(words2))
-        union = len(words1.union(words2))
-        
-        return intersection / union if union > 0 else 0.0
+    async def _drop_project_duplicates(self, chunks: List[Dict[str, Any]], project_id: str, source_key: str) -> List[Dict[str, Any]]:
+        """Drop chunks that near-duplicate chunks already stored for other sources in the project."""
+        try:
+            detector = NearDuplicateDetector()
+            for chunk in chunks:
+                if 'minhash' not in chunk:
+                    chunk['minhash'] = detector.signature(chunk.get('original_text') or chunk['text'])
+                    chunk['minhash_bands'] = detector.band_hashes(chunk['minhash'])
+            
+            # One query finds every stored chunk sharing an LSH band with any new chunk
+            all_bands = sorted({band for chunk in chunks for band in chunk['minhash_bands']})
+            candidates = []
+            for i in range(0, len(all_bands), 500):
+                result = await execute_async(
+                    self.supabase.table('vector_chunk_manifest').select('vector_id, minhash, band_hashes').eq(
+                        'project_id', project_id
+                    ).neq('source_id', source_key).overlaps('band_hashes', all_bands[i:i + 500])
+                )
+                candidates.extend(result.data or [])
+            
+            for row in candidates:
+                if row.get('minhash'):
+                    detector.add(row['vector_id'], detector.decode_signature(row['minhash']), row.get('band_hashes'))
+            
+            kept = []
+            for chunk in chunks:
+                duplicate = detector.find_duplicate(chunk['minhash'], chunk['minhash_bands'])
+                if duplicate:
+                    logger.debug(f"Skipping chunk duplicating {duplicate[0]} (similarity {duplicate[1]:.2f})")
+                    continue
+                kept.append(chunk)
+            
+            if len(kept) < len(chunks):
+                logger.info(f"Dropped {len(chunks) - len(kept)} near-duplicate chunks already in project {project_id}")
+            return kept
+            
+        except Exception as e:
+            logger.error(f"Error checking project near-duplicates: {e}")
+            return chunks
     
     def _calculate_chunk_quality(self, chunk: Dict[str, Any]) -> float:
         """Calculate quality score for a chunk."""
@@ -590,14 +711,8 @@ class VectorEmbeddingService:
             List of similar content with metadata
         """
         try:
-            # Generate embedding for the query
-            query_embedding = await self.openai_client.embeddings.create(
-                model=self.settings.embedding_model_choice,
-                input=query,
-                encoding_format="float"
-            )
-            
-            query_vector = query_embedding.data[0].embedding
+            # Generate embedding for the query (cached per normalized query)
+            query_vector = await self.embedding_cache.get_embedding(self.openai_client, query)
             
             # Build filter for search
             filter_dict = {'user_id': user_id}
@@ -605,11 +720,12 @@ class VectorEmbeddingService:
                 filter_dict['project_id'] = project_id
             
             # Search Pinecone
-            search_results = self.index.query(
+            search_results = await self.vector_store.query(
                 vector=query_vector,
                 filter=filter_dict,
                 top_k=limit,
-                include_metadata=True
+                include_metadata=True,
+                index_name=self.index_name
             )
             
             # Process and return results
@@ -674,7 +790,7 @@ class VectorEmbeddingService:
             filter_dict = {'user_id': user_id}
             
             # Get index stats
-            index_stats = self.index.describe_index_stats(filter=filter_dict)
+            index_stats = await self.vector_store.describe_index_stats(filter=filter_dict, index_name=self.index_name)
             
             return {
                 'total_vectors': index_stats.total_vector_count,
@@ -4,16 +4,20 @@ Processes incoming webhook notifications from Attendee.dev API.
 """
 
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Awaitable, Callable, Optional, List
 from datetime import datetime
 import json
 
 from ...core.database import get_supabase
 from ...models.schemas.calendar import Meeting
 from .transcript_service import TranscriptService
+from .bot_state_service import map_bot_state
 
 logger = logging.getLogger(__name__)
 
+# Called with (bot_id, user_id) to hand transcript processing to a separate worker lane
+TranscriptLane = Callable[[str, str], Awaitable[None]]
+
 
 class AttendeeWebhookHandler:
     """Handles incoming Attendee webhook notifications."""
@@ -25,27 +29,16 @@ class AttendeeWebhookHandler:
         self.retry_delay = 1  # seconds
     
     async def process_webhook(self, webhook_data: Dict[str, Any], user_id: str) -> bool:
-        """Process incoming Attendee webhook data."""
+        """Process incoming Attendee webhook data inline."""
         try:
             # Extract webhook metadata
             webhook_id = webhook_data.get('idempotency_key')
-            trigger = webhook_data.get('trigger')
-            bot_id = webhook_data.get('bot_id')
             
             # Log webhook receipt
-            await self._log_webhook_receipt(webhook_id, trigger, bot_id, user_id, webhook_data)
+            await self.record_webhook(webhook_data, user_id)
             
             # Process based on trigger type
-            if trigger == 'bot.state_change':
-                await self._handle_bot_state_change(webhook_data, user_id)
-            elif trigger == 'transcript.update':
-                await self._handle_transcript_update(webhook_data, user_id)
-            elif trigger == 'chat_messages.update':
-                await self._handle_chat_message_update(webhook_data, user_id)
-            elif trigger == 'participant_events.join_leave':
-                await self._handle_participant_event(webhook_data, user_id)
-            else:
-                logger.info(f"Unhandled webhook trigger: {trigger}")
+            await self.handle_webhook(webhook_data, user_id)
             
             # Mark webhook as processed
             await self._mark_webhook_processed(webhook_id, user_id)
@@ -56,7 +49,61 @@ class AttendeeWebhookHandler:
             logger.error(f"Failed to process Attendee webhook: {e}")
             return False
     
-    async def _handle_bot_state_change(self, webhook_data: Dict[str, Any], user_id: str):
+    async def record_webhook(self, webhook_data: Dict[str, Any], user_id: str) -> Optional[str]:
+        """
+        Log webhook receipt in attendee_webhook_logs.
+        
+        Returns:
+            ID of the log row, or None if it could not be written
+        """
+        return await self._log_webhook_receipt(
+            webhook_data.get('idempotency_key'),
+            webhook_data.get('trigger'),
+            webhook_data.get('bot_id'),
+            user_id,
+            webhook_data
+        )
+    
+    async def handle_webhook(self, webhook_data: Dict[str, Any], user_id: str,
+                             transcript_lane: Optional[TranscriptLane] = None):
+        """
+        Apply a webhook based on its trigger type.
+        
+        Args:
+            webhook_data: Webhook payload
+            user_id: Owner of the bot
+            transcript_lane: If given, ended-meeting transcript processing is handed to it
+                instead of running inline
+        """
+        trigger = webhook_data.get('trigger')
+        
+        if trigger == 'bot.state_change':
+            await self._handle_bot_state_change(webhook_data, user_id, transcript_lane)
+        elif trigger == 'transcript.update':
+            await self._handle_transcript_update(webhook_data, user_id)
+        elif trigger == 'chat_messages.update':
+            await self._handle_chat_message_update(webhook_data, user_id)
+        elif trigger == 'participant_events.join_leave':
+            await self._handle_participant_event(webhook_data, user_id)
+        else:
+            logger.info(f"Unhandled webhook trigger: {trigger}")
+    
+    async def process_ended_bot_transcript(self, bot_id: str, user_id: str) -> bool:
+        """Fetch and store the transcript of an ended bot, then classify it. Returns whether the transcript was stored."""
+        # Process ended bot: fetch and store transcript
+        success = await self.transcript_service.process_ended_bot(self.supabase, bot_id)
+        if success:
+            # Update meeting status to completed
+            await self._update_meeting_status(bot_id, 'completed')
+            
+            # Trigger classification workflow
+            await self._trigger_classification_workflow(bot_id, user_id)
+        else:
+            logger.error(f"Failed to process transcript for ended bot {bot_id}")
+        return bool(success)
+    
+    async def _handle_bot_state_change(self, webhook_data: Dict[str, Any], user_id: str,
+                                       transcript_lane: Optional[TranscriptLane] = None):
         """Handle bot state change webhook."""
         try:
             data = webhook_data.get('data', {})
@@ -75,16 +122,10 @@ class AttendeeWebhookHandler:
                 
                 logger.info(f"Meeting ended and recording available for bot {bot_id}")
                 
-                # Process ended bot: fetch and store transcript
-                success = await self.transcript_service.process_ended_bot(self.supabase, bot_id)
-                if success:
-                    # Update meeting status to completed
-                    await self._update_meeting_status(bot_id, 'completed')
-                    
-                    # Trigger classification workflow
-                    await self._trigger_classification_workflow(bot_id, user_id)
+                if transcript_lane:
+                    await transcript_lane(bot_id, user_id)
                 else:
-                    logger.error(f"Failed to process transcript for ended bot {bot_id}")
+                    await self.process_ended_bot_transcript(bot_id, user_id)
                 
             # Handle other state changes
             elif new_state == 'joined':
@@ -485,8 +526,9 @@ class AttendeeWebhookHandler:
     
     # Private helper methods
     
-    async def _log_webhook_receipt(self, webhook_id: str, trigger: str, bot_id: str, user_id: str, webhook_data: Dict[str, Any]):
-        """Log webhook receipt in database."""
+    async def _log_webhook_receipt(self, webhook_id: str, trigger: str, bot_id: str, user_id: str,
+                                   webhook_data: Dict[str, Any]) -> Optional[str]:
+        """Log webhook receipt in database, returning the log row ID."""
         try:
             log_record = {
                 "webhook_id": webhook_id,
@@ -498,10 +540,12 @@ class AttendeeWebhookHandler:
                 "processed": False
             }
             
-            self.supabase.table("attendee_webhook_logs").insert(log_record).execute()
+            result = self.supabase.table("attendee_webhook_logs").insert(log_record).execute()
+            return result.data[0].get('id') if result.data else None
             
         except Exception as e:
             logger.error(f"Failed to log webhook receipt: {e}")
+            return None
     
     async def _mark_webhook_processed(self, webhook_id: str, user_id: str):
         """Mark webhook as processed in database."""
@@ -518,7 +562,7 @@ class AttendeeWebhookHandler:
         """Update bot status in database."""
         try:
             update_data = {
-                "status": status_data.get('status'),
+                "status": map_bot_state(status_data.get('status')),
                 "last_state_change": status_data.get('last_state_change'),
                 "event_type": status_data.get('event_type'),
                 "updated_at": datetime.now().isoformat()
@@ -10,9 +10,34 @@ import httpx
 
 from ...core.database import get_supabase
 from ...core.config import get_settings
+from ...core.supabase_config import execute_async
 
 logger = logging.getLogger(__name__)
 
+# Attendee.dev bot states -> internal meeting_bots statuses
+BOT_STATE_MAPPING = {
+    "scheduled": "scheduled",
+    "ready": "scheduled",
+    "joining": "scheduled",
+    "joined_not_recording": "bot_joined",
+    "joined_recording": "transcribing",
+    "joined_recording_paused": "transcribing",
+    "leaving": "transcribing",
+    "post_processing": "post_processing",
+    "ended": "completed",
+    "fatal_error": "error",
+    "waiting_room": "scheduled",
+    "data_deleted": "completed",
+    "joining_breakout_room": "transcribing",
+    "leaving_breakout_room": "transcribing"
+}
+
+
+def map_bot_state(attendee_state: Optional[str]) -> str:
+    """Map an Attendee.dev bot state to our internal state."""
+    return BOT_STATE_MAPPING.get(attendee_state, "scheduled")
+
+
 class BotStateService:
     """Service for managing bot states and webhook processing."""
     
@@ -115,24 +140,7 @@ class BotStateService:
         Returns:
             Mapped internal state
         """
-        state_mapping = {
-            "scheduled": "scheduled",
-            "ready": "scheduled",
-            "joining": "scheduled",
-            "joined_not_recording": "bot_joined",
-            "joined_recording": "transcribing",
-            "joined_recording_paused": "transcribing",
-            "leaving": "transcribing",
-            "post_processing": "post_processing",
-            "ended": "completed",
-            "fatal_error": "error",
-            "waiting_room": "scheduled",
-            "data_deleted": "completed",
-            "joining_breakout_room": "transcribing",
-            "leaving_breakout_room": "transcribing"
-        }
-        
-        return state_mapping.get(attendee_state, "scheduled")
+        return map_bot_state(attendee_state)
     
     async def process_webhook_logs(self) -> int:
         """
@@ -148,21 +156,22 @@ class BotStateService:
             if not result.data:
                 return 0
             
-            processed_count = 0
+            processed_ids = []
             
             for webhook_log in result.data:
                 try:
                     success = await self._process_webhook_log(webhook_log)
                     if success:
-                        processed_count += 1
-                        # Mark as processed
-                        await self._mark_webhook_processed(webhook_log['id'])
+                        processed_ids.append(webhook_log['id'])
                 except Exception as e:
                     logger.error(f"Error processing webhook log {webhook_log['id']}: {e}")
                     continue
             
-            logger.info(f"Processed {processed_count} webhook logs")
-            return processed_count
+            # Mark as processed in one update
+            await self.mark_webhooks_processed(processed_ids)
+            
+            logger.info(f"Processed {len(processed_ids)} webhook logs")
+            return len(processed_ids)
             
         except Exception as e:
             logger.error(f"Error processing webhook logs: {e}")
@@ -248,16 +257,22 @@ class BotStateService:
         except Exception as e:
             logger.error(f"Error triggering transcript processing for bot {bot_id}: {e}")
     
-    async def _mark_webhook_processed(self, webhook_log_id: str):
-        """Mark webhook log as processed."""
+    async def mark_webhooks_processed(self, webhook_log_ids: List[str]) -> bool:
+        """Mark webhook logs as processed with a single update."""
+        if not webhook_log_ids:
+            return True
         try:
-            self.supabase.table('attendee_webhook_logs').update({
-                'processed': True,
-                'processed_at': datetime.now().isoformat()
-            }).eq('id', webhook_log_id).execute()
+            await execute_async(
+                self.supabase.table('attendee_webhook_logs').update({
+                    'processed': True,
+                    'processed_at': datetime.now().isoformat()
+                }).in_('id', webhook_log_ids)
+            )
+            return True
             
         except Exception as e:
-            logger.error(f"Error marking webhook log {webhook_log_id} as processed: {e}")
+            logger.error(f"Error marking {len(webhook_log_ids)} webhook logs as processed: {e}")
+            return False
     
     async def get_bot_status_summary(self, user_id: str) -> Dict[str, int]:
         """
@@ -0,0 +1,150 @@
+"""
+Attendee webhook event queue for BeSunny.ai Python backend.
+Shards webhook events by bot_id onto in-process queues, or Redis lists for multi-worker deployments.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+import zlib
+from typing import Dict, Any, List, Optional
+
+from ...core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Extend a shard lease only if this process still owns it
+RENEW_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Give up a shard lease only if this process still owns it
+RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class WebhookEventQueue:
+    """
+    Sharded queue of webhook events.
+
+    Every event for a bot lands on the same shard, and each shard has a single
+    consumer, so a bot's events are applied in arrival order while different
+    bots are processed in parallel. With Redis, a shard's consumer must hold the
+    shard's lease, so only one process pops from it at a time.
+    """
+
+    def __init__(self, shards: int):
+        self.settings = get_settings()
+        self.shards = max(1, shards)
+        self.redis_prefix = "attendee_webhooks:"
+        self.use_redis = self.settings.attendee_webhook_queue_backend == "redis" and bool(self.settings.redis_url)
+
+        self._queues: List[asyncio.Queue] = []
+        self._redis = None
+        self._owner_id = uuid.uuid4().hex
+        # Local expiry of the shard leases this process holds
+        self._shard_leases: Dict[int, float] = {}
+
+    def shard_for(self, bot_id: Optional[str]) -> int:
+        # crc32 rather than hash() so every process picks the same shard for a bot
+        return zlib.crc32((bot_id or '').encode('utf-8')) % self.shards
+
+    def _get_queue(self, shard: int) -> asyncio.Queue:
+        # Created on first use so they bind to the running event loop
+        if not self._queues:
+            self._queues = [asyncio.Queue() for _ in range(self.shards)]
+        return self._queues[shard]
+
+    def _get_redis_client(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.settings.redis_url)
+        return self._redis
+
+    async def put(self, event: Dict[str, Any]):
+        """Add an event to its bot's shard."""
+        shard = self.shard_for(event.get('bot_id'))
+        if self.use_redis:
+            await self._get_redis_client().lpush(f"{self.redis_prefix}{shard}", json.dumps(event, default=str))
+        else:
+            self._get_queue(shard).put_nowait(event)
+
+    async def get(self, shard: int, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        """Wait up to timeout seconds for the next event on a shard."""
+        if self.use_redis:
+            item = await self._get_redis_client().brpop(f"{self.redis_prefix}{shard}", timeout=max(1, int(timeout)))
+            return json.loads(item[1]) if item else None
+        try:
+            return await asyncio.wait_for(self._get_queue(shard).get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def claim_shard(self, shard: int, lease_seconds: int) -> bool:
+        """
+        Claim or renew this process's lease on a shard.
+        
+        In-process queues are never shared, so they are always owned. Redis leases
+        are renewed once a third of the lease has passed rather than on every pop.
+        """
+        if not self.use_redis:
+            return True
+        now = time.monotonic()
+        if self._shard_leases.get(shard, 0) - now > lease_seconds * 2 / 3:
+            return True
+        
+        client = self._get_redis_client()
+        key = f"{self.redis_prefix}{shard}:owner"
+        owned = await client.set(key, self._owner_id, nx=True, ex=lease_seconds)
+        if not owned:
+            owned = await client.eval(RENEW_LEASE_SCRIPT, 1, key, self._owner_id, lease_seconds)
+        
+        if owned:
+            self._shard_leases[shard] = now + lease_seconds
+            return True
+        self._shard_leases.pop(shard, None)
+        return False
+
+    async def release_shard(self, shard: int):
+        """Give up this process's lease on a shard so another process can take it over."""
+        if not self.use_redis or self._shard_leases.pop(shard, None) is None:
+            return
+        try:
+            await self._get_redis_client().eval(RELEASE_LEASE_SCRIPT, 1, f"{self.redis_prefix}{shard}:owner", self._owner_id)
+        except Exception as e:
+            logger.error(f"Error releasing webhook queue shard {shard}: {e}")
+
+    async def claim_sweep(self, lease_seconds: int) -> bool:
+        """
+        Claim the webhook log sweep for the next lease_seconds.
+
+        The lease is left to expire rather than released, so across processes the
+        log table is swept at most once per lease.
+        """
+        if not self.use_redis:
+            return True
+        return bool(await self._get_redis_client().set(f"{self.redis_prefix}sweep:owner", self._owner_id, nx=True, ex=lease_seconds))
+
+    async def depth(self) -> int:
+        """Get the number of queued events across all shards."""
+        try:
+            if self.use_redis:
+                client = self._get_redis_client()
+                return sum([await client.llen(f"{self.redis_prefix}{shard}") for shard in range(self.shards)])
+            return sum(queue.qsize() for queue in self._queues)
+        except Exception as e:
+            logger.error(f"Error reading webhook queue depth: {e}")
+            return -1
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
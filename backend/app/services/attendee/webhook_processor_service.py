@@ -1,81 +1,295 @@
 """
 Webhook processor service for processing attendee webhook logs.
-Runs as a background service to process webhook notifications and update bot states.
+Consumes webhook events from a queue sharded by bot_id, with a separate lane for transcript processing
+and a periodic sweep of the webhook log table as a backstop.
 """
 
 import logging
 import asyncio
-from typing import Dict, Any
+import time
+from typing import Dict, Any, List, Optional, Set
 from datetime import datetime, timedelta
 
+from ...core.config import get_settings
+from ...core.database import get_supabase
+from ...core.supabase_config import execute_async
+from .webhook_event_queue import WebhookEventQueue
+
 logger = logging.getLogger(__name__)
 
 class WebhookProcessorService:
-    """Background service for processing webhook logs."""
+    """Background service for processing webhook events."""
     
     def __init__(self):
+        self.settings = get_settings()
         self.bot_state_service = None
+        self.webhook_handler = None
         self.is_running = False
-        self.process_interval = 30  # seconds
+        self.process_interval = self.settings.attendee_webhook_sweep_interval_seconds  # seconds between sweeps
         self.max_retries = 3
         self.retry_delay = 5  # seconds
+        
+        self.consumer_count = max(1, self.settings.attendee_webhook_consumers)
+        self.transcript_worker_count = max(1, self.settings.attendee_transcript_workers)
+        self.marker_flush_size = self.settings.attendee_webhook_marker_flush_size
+        self.marker_flush_seconds = self.settings.attendee_webhook_marker_flush_seconds
+        self.shard_lease_seconds = self.settings.attendee_webhook_shard_lease_seconds
+        self.sweep_claim_seconds = self.settings.attendee_webhook_sweep_claim_seconds
+        
+        self.queue = WebhookEventQueue(self.consumer_count)
+        self._transcript_queue: Optional[asyncio.Queue] = None
+        # Bots with transcript work queued or running, mapped to the webhook log rows waiting on it.
+        # Those rows are marked processed only once the transcript is stored, so the sweep re-drives
+        # a transcript that failed or was lost in a restart.
+        self._transcript_jobs: Dict[str, List[str]] = {}
+        # Log rows waiting on this process's in-process queue, which the sweep leaves alone.
+        # Redis-queued rows may be consumed by another process, so they rely on the sweep's min age.
+        self._queued_log_ids: Set[str] = set()
+        self._processed_ids: List[str] = []
+        self._tasks: List[asyncio.Task] = []
+        
+        self._metrics = {
+            'enqueued': 0,
+            'processed': 0,
+            'failed': 0,
+            'transcripts_queued': 0,
+            'transcripts_processed': 0,
+            'markers_flushed': 0,
+            'swept': 0,
+            'last_latency_ms': None
+        }
+    
+    def _ensure_services(self):
+        # Initialize services lazily
+        if self.bot_state_service is None:
+            from .bot_state_service import BotStateService
+            self.bot_state_service = BotStateService()
+        if self.webhook_handler is None:
+            from .attendee_webhook_handler import AttendeeWebhookHandler
+            self.webhook_handler = AttendeeWebhookHandler()
     
     async def start(self):
-        """Start the webhook processor service."""
+        """Start the webhook consumers, transcript workers, marker flusher and sweep."""
         if self.is_running:
             logger.warning("Webhook processor service is already running")
             return
         
-        # Initialize bot state service lazily
-        if self.bot_state_service is None:
-            from .bot_state_service import BotStateService
-            self.bot_state_service = BotStateService()
+        self._ensure_services()
+        self._transcript_queue = asyncio.Queue()
         
         self.is_running = True
-        logger.info("Starting webhook processor service")
+        logger.info(
+            f"Starting webhook processor service with {self.consumer_count} consumers, "
+            f"{self.transcript_worker_count} transcript workers ({'redis' if self.queue.use_redis else 'in-process'} queue)"
+        )
+        
+        self._tasks = (
+            [asyncio.create_task(self._consume(shard)) for shard in range(self.consumer_count)]
+            + [asyncio.create_task(self._transcript_worker()) for _ in range(self.transcript_worker_count)]
+            + [asyncio.create_task(self._flush_markers_loop()), asyncio.create_task(self._sweep_loop())]
+        )
         
         try:
-            while self.is_running:
-                try:
-                    # Process webhook logs
-                    processed_count = await self.bot_state_service.process_webhook_logs()
-                    
-                    if processed_count > 0:
-                        logger.info(f"Processed {processed_count} webhook logs")
-                    
-                    # Wait before next processing cycle
-                    await asyncio.sleep(self.process_interval)
-                    
-                except Exception as e:
-                    logger.error(f"Error in webhook processor cycle: {e}")
-                    await asyncio.sleep(self.retry_delay)
-                    
+            await asyncio.gather(*self._tasks)
         except asyncio.CancelledError:
             logger.info("Webhook processor service cancelled")
         except Exception as e:
             logger.error(f"Fatal error in webhook processor service: {e}")
         finally:
             self.is_running = False
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+            # Record anything handled since the last flush
+            await self._flush_markers()
+            await self.queue.close()
             logger.info("Webhook processor service stopped")
     
     async def stop(self):
         """Stop the webhook processor service."""
         logger.info("Stopping webhook processor service")
         self.is_running = False
+        for task in self._tasks:
+            task.cancel()
+    
+    async def enqueue(self, webhook_data: Dict[str, Any], user_id: str, log_id: Optional[str]):
+        """Queue a received webhook for its bot's consumer."""
+        await self.queue.put({
+            'log_id': log_id,
+            'user_id': user_id,
+            'bot_id': webhook_data.get('bot_id'),
+            'webhook_data': webhook_data,
+            'enqueued_at': time.time()
+        })
+        if log_id and not self.queue.use_redis:
+            self._queued_log_ids.add(log_id)
+        self._metrics['enqueued'] += 1
+    
+    async def _consume(self, shard: int):
+        """Apply events from one shard in order."""
+        try:
+            while self.is_running:
+                try:
+                    if not await self.queue.claim_shard(shard, self.shard_lease_seconds):
+                        # Another process owns this shard and applies its events in order
+                        await asyncio.sleep(self.retry_delay)
+                        continue
+                    event = await self.queue.get(shard)
+                except Exception as e:
+                    logger.error(f"Error reading webhook queue shard {shard}: {e}")
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+                if event is None:
+                    continue
+                
+                log_id = event.get('log_id')
+                self._queued_log_ids.discard(log_id)
+                transcript_queued = False
+                
+                async def transcript_lane(bot_id: str, user_id: str):
+                    nonlocal transcript_queued
+                    transcript_queued = True
+                    await self._queue_transcript(bot_id, user_id, log_id)
+                
+                try:
+                    await self.webhook_handler.handle_webhook(
+                        event['webhook_data'],
+                        event['user_id'],
+                        transcript_lane=transcript_lane
+                    )
+                    self._metrics['processed'] += 1
+                    self._metrics['last_latency_ms'] = int((time.time() - event.get('enqueued_at', time.time())) * 1000)
+                    # An ended bot's row is marked by the transcript worker once the transcript is stored
+                    if log_id and not transcript_queued:
+                        await self._mark_processed([log_id])
+                except Exception as e:
+                    # Left unprocessed in the log table for the sweep to retry
+                    self._metrics['failed'] += 1
+                    logger.error(f"Error processing webhook for bot {event.get('bot_id')}: {e}")
+        finally:
+            await self.queue.release_shard(shard)
+    
+    async def _queue_transcript(self, bot_id: str, user_id: str, log_id: Optional[str] = None):
+        """Hand ended-bot transcript processing to the transcript lane."""
+        if log_id:
+            await self._extend_sweep_claims([log_id])
+        if bot_id in self._transcript_jobs:
+            logger.info(f"Transcript processing already queued for bot {bot_id}")
+            if log_id and log_id not in self._transcript_jobs[bot_id]:
+                self._transcript_jobs[bot_id].append(log_id)
+            return
+        self._transcript_jobs[bot_id] = [log_id] if log_id else []
+        self._transcript_queue.put_nowait((bot_id, user_id))
+        self._metrics['transcripts_queued'] += 1
+    
+    async def _extend_sweep_claims(self, log_ids: List[str]):
+        """Keep the sweep off log rows whose transcript is still being processed."""
+        try:
+            await execute_async(get_supabase().rpc('extend_attendee_webhook_log_claims', {
+                'p_ids': log_ids,
+                'p_claim_seconds': self.sweep_claim_seconds
+            }))
+        except Exception as e:
+            logger.error(f"Error extending sweep claims on webhook logs {log_ids}: {e}")
+    
+    async def _transcript_worker(self):
+        """Fetch, store and classify transcripts without blocking state updates."""
+        while self.is_running:
+            try:
+                bot_id, user_id = await asyncio.wait_for(self._transcript_queue.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+            
+            stored = False
+            try:
+                stored = await self.webhook_handler.process_ended_bot_transcript(bot_id, user_id)
+                if stored:
+                    self._metrics['transcripts_processed'] += 1
+            except Exception as e:
+                logger.error(f"Error processing transcript for bot {bot_id}: {e}")
+            finally:
+                log_ids = self._transcript_jobs.pop(bot_id, [])
+            
+            # Otherwise the rows stay unprocessed and the sweep queues the ended webhook again
+            if stored:
+                await self._mark_processed(log_ids)
+    
+    async def _mark_processed(self, log_ids: List[str]):
+        """Buffer handled webhook log rows for the next marker flush."""
+        self._processed_ids.extend(log_ids)
+        if len(self._processed_ids) >= self.marker_flush_size:
+            await self._flush_markers()
+    
+    async def _flush_markers(self):
+        """Mark handled webhook log rows processed in one update."""
+        if not self._processed_ids:
+            return
+        ids, self._processed_ids = self._processed_ids, []
+        if await self.bot_state_service.mark_webhooks_processed(ids):
+            self._metrics['markers_flushed'] += len(ids)
+        else:
+            # Keep them for the next flush rather than leaving them for the sweep to re-apply
+            self._processed_ids = ids + self._processed_ids
+    
+    async def _flush_markers_loop(self):
+        while self.is_running:
+            await asyncio.sleep(self.marker_flush_seconds)
+            await self._flush_markers()
+    
+    async def _sweep_loop(self):
+        while self.is_running:
+            await asyncio.sleep(self.process_interval)
+            try:
+                swept = await self.sweep_unprocessed_logs()
+                if swept > 0:
+                    logger.info(f"Re-queued {swept} unprocessed webhook logs")
+            except Exception as e:
+                logger.error(f"Error in webhook processor sweep: {e}")
+    
+    async def sweep_unprocessed_logs(self) -> int:
+        """
+        Queue webhook log rows that were never processed, e.g. after a failure or restart.
+        
+        One process sweeps per interval, under a lease on the queue. Only rows older than
+        attendee_webhook_sweep_min_age_seconds are picked up, and each is claimed for
+        attendee_webhook_sweep_claim_seconds when queued, so rows that are still queued,
+        waiting on their transcript or awaiting their processed marker are left alone.
+        
+        Returns:
+            Number of webhook logs queued
+        """
+        if not await self.queue.claim_sweep(max(1, self.process_interval - 1)):
+            return 0
+        
+        pending = self._queued_log_ids.union(*self._transcript_jobs.values())
+        cutoff = datetime.now() - timedelta(seconds=self.settings.attendee_webhook_sweep_min_age_seconds)
+        result = await execute_async(get_supabase().rpc('claim_unprocessed_attendee_webhook_logs', {
+            'p_received_before': cutoff.astimezone().isoformat(),
+            'p_claim_seconds': self.sweep_claim_seconds,
+            'p_limit': 500,
+            'p_exclude_ids': list(pending)
+        }))
+        
+        for row in result.data or []:
+            await self.enqueue(row.get('webhook_data') or {}, row.get('user_id'), row.get('id'))
+        
+        self._metrics['swept'] += len(result.data or [])
+        return len(result.data or [])
     
     async def process_webhook_logs_once(self) -> int:
         """
         Process webhook logs once (for manual triggering).
         
+        Queues unprocessed logs when the consumers are running, otherwise processes them inline.
+        
         Returns:
-            Number of webhook logs processed
+            Number of webhook logs processed or queued
         """
         try:
-            # Initialize bot state service lazily
-            if self.bot_state_service is None:
-                from .bot_state_service import BotStateService
-                self.bot_state_service = BotStateService()
-            
+            self._ensure_services()
+            if self.is_running:
+                return await self.sweep_unprocessed_logs()
             return await self.bot_state_service.process_webhook_logs()
         except Exception as e:
             logger.error(f"Error processing webhook logs: {e}")
@@ -93,6 +307,13 @@ class WebhookProcessorService:
             "process_interval": self.process_interval,
             "max_retries": self.max_retries,
             "retry_delay": self.retry_delay,
+            "queue_backend": "redis" if self.queue.use_redis else "memory",
+            "consumers": self.consumer_count,
+            "transcript_workers": self.transcript_worker_count,
+            "queue_depth": await self.queue.depth(),
+            "transcript_queue_depth": self._transcript_queue.qsize() if self._transcript_queue else 0,
+            "pending_markers": len(self._processed_ids),
+            "metrics": dict(self._metrics),
             "last_check": datetime.now().isoformat()
         }
     
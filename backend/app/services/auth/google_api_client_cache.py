@@ -0,0 +1,239 @@
+"""
+Google API client cache for BeSunny.ai Python backend.
+Keeps built googleapiclient service objects per (user, API) so pollers reuse discovery
+documents, HTTP connections and credentials across cron ticks.
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from ...core.config import get_settings
+from ...core.supabase_config import get_supabase_service_client, execute_async
+
+logger = logging.getLogger(__name__)
+
+# google-auth treats credentials as expired a few minutes early; a stored token
+# that outlives this margin was refreshed elsewhere and is used as is
+REFRESH_MARGIN_SECONDS = 300
+
+
+class CachedGoogleClient:
+    """
+    A built Google API service and the credentials it is authorized with.
+
+    The service's httplib2 transport is not thread-safe, so callers hold
+    `lock` while making requests through `service`.
+    """
+
+    def __init__(self, user_id: str, api: str, version: str, service, credentials: Credentials):
+        self.user_id = user_id
+        self.api = api
+        self.version = version
+        self.service = service
+        self.credentials = credentials
+        self.lock = asyncio.Lock()
+
+
+class GoogleAPIClientCache:
+    """
+    LRU cache of Google API clients keyed by (user_id, api, version).
+
+    All of a user's clients share one Credentials object, so a refresh updates
+    every client in place. Credential rows are re-read at most every
+    google_client_cache_revalidate_seconds: an access token rotated elsewhere is
+    applied in place, while a new refresh token or a disconnected account evicts
+    the user's clients.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.supabase = get_supabase_service_client()
+        self.max_entries = self.settings.google_client_cache_max_entries
+        self.revalidate_seconds = self.settings.google_client_cache_revalidate_seconds
+
+        self._clients: "OrderedDict[Tuple[str, str, str], CachedGoogleClient]" = OrderedDict()
+        # user_id -> {'credentials', 'refresh_token', 'loaded_at'}
+        self._credentials: Dict[str, Dict[str, Any]] = {}
+        self._user_locks: Dict[str, asyncio.Lock] = {}
+
+        self._metrics = {
+            'hits': 0,
+            'builds': 0,
+            'refreshes': 0,
+            'refresh_failures': 0,
+            'revalidations': 0,
+            'evictions': 0
+        }
+
+    async def get_client(self, user_id: str, api: str, version: str) -> Optional[CachedGoogleClient]:
+        """
+        Get a ready-to-use client for a user's Google API.
+
+        Returns:
+            The cached or newly built client, or None if the user has no usable credentials
+        """
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            credentials = await self._get_credentials(user_id)
+            if credentials is None:
+                return None
+
+            key = (user_id, api, version)
+            client = self._clients.get(key)
+            if client is not None and client.credentials is credentials:
+                self._clients.move_to_end(key)
+                self._metrics['hits'] += 1
+                return client
+
+            try:
+                # Bundled discovery documents avoid fetching and caching them per build
+                service = await self._run_blocking(
+                    build, api, version, credentials=credentials, cache_discovery=False, static_discovery=True
+                )
+            except Exception as e:
+                logger.error(f"Failed to build Google {api} {version} client for user {user_id}: {e}")
+                return None
+
+            client = CachedGoogleClient(user_id, api, version, service, credentials)
+            self._clients[key] = client
+            self._metrics['builds'] += 1
+            self._evict_lru()
+            return client
+
+    def apply_refreshed_token(self, user_id: str, access_token: str, expires_at: Optional[str] = None):
+        """Update a cached user's credentials in place after their access token was refreshed elsewhere."""
+        entry = self._credentials.get(user_id)
+        if entry is not None:
+            entry['credentials'].token = access_token
+            entry['credentials'].expiry = self._parse_expiry(expires_at)
+
+    def invalidate_user(self, user_id: str):
+        """Drop a user's clients and credentials, e.g. after token rotation or disconnect."""
+        self._credentials.pop(user_id, None)
+        for key in [key for key in self._clients if key[0] == user_id]:
+            del self._clients[key]
+            self._metrics['evictions'] += 1
+
+    async def _get_credentials(self, user_id: str) -> Optional[Credentials]:
+        entry = self._credentials.get(user_id)
+        now = time.monotonic()
+
+        if entry is None or now - entry['loaded_at'] >= self.revalidate_seconds:
+            row = await self._load_credentials_row(user_id)
+            if entry is not None:
+                self._metrics['revalidations'] += 1
+
+            if not row or row.get('status') == 'disconnected' or not (row.get('access_token') or row.get('refresh_token')):
+                self.invalidate_user(user_id)
+                return None
+
+            if entry is not None and entry['refresh_token'] == row.get('refresh_token'):
+                # Same grant: pick up an access token refreshed by another process in place
+                credentials = entry['credentials']
+                if row.get('access_token') and row['access_token'] != credentials.token:
+                    credentials.token = row['access_token']
+                    credentials.expiry = self._parse_expiry(row.get('expires_at'))
+                entry['loaded_at'] = now
+            else:
+                self.invalidate_user(user_id)
+                entry = {
+                    'credentials': self._build_credentials(row),
+                    'refresh_token': row.get('refresh_token'),
+                    'loaded_at': now
+                }
+                self._credentials[user_id] = entry
+
+        credentials = entry['credentials']
+        if credentials.expired and credentials.refresh_token:
+            # Refresh through the engine so this joins any exchange already in flight for the user,
+            # here or in another process, instead of spending the refresh token again
+            from .token_refresh_engine import get_token_refresh_engine
+            result = await get_token_refresh_engine().refresh_user(user_id, due_before=time.time() + REFRESH_MARGIN_SECONDS)
+            if not result.get('success'):
+                self._metrics['refresh_failures'] += 1
+                logger.error(f"Failed to refresh Google credentials for user {user_id}: {result.get('error')}")
+                self.invalidate_user(user_id)
+                return None
+            self._metrics['refreshes'] += 1
+            self.apply_refreshed_token(user_id, result['access_token'], result.get('expires_at'))
+
+        return credentials
+
+    async def _load_credentials_row(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            # Workspace credentials (login_provider false) take precedence over login-only ones
+            result = await execute_async(
+                self.supabase.table("google_credentials")
+                .select("access_token, refresh_token, token_uri, client_id, client_secret, scope, expires_at, status")
+                .eq("user_id", user_id)
+                .order("login_provider")
+                .limit(1)
+            )
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Failed to get credentials for user {user_id}: {e}")
+            return None
+
+    def _build_credentials(self, row: Dict[str, Any]) -> Credentials:
+        return Credentials(
+            token=row.get('access_token'),
+            refresh_token=row.get('refresh_token'),
+            token_uri=row.get('token_uri') or 'https://oauth2.googleapis.com/token',
+            client_id=row.get('client_id') or self.settings.google_client_id,
+            client_secret=row.get('client_secret') or self.settings.google_client_secret,
+            scopes=row['scope'].split() if row.get('scope') else None,
+            expiry=self._parse_expiry(row.get('expires_at'))
+        )
+
+    @staticmethod
+    def _parse_expiry(expires_at: Optional[str]) -> Optional[datetime]:
+        """Convert a stored expires_at to the naive UTC datetime google-auth expects."""
+        if not expires_at:
+            return None
+        try:
+            # Naive timestamps are written with datetime.now(), i.e. local time
+            expiry = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
+            return expiry.astimezone(timezone.utc).replace(tzinfo=None)
+        except ValueError:
+            return None
+
+    def _evict_lru(self):
+        while len(self._clients) > self.max_entries:
+            (user_id, _, _), _ = self._clients.popitem(last=False)
+            self._metrics['evictions'] += 1
+            if not any(key[0] == user_id for key in self._clients):
+                self._credentials.pop(user_id, None)
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Run a blocking Google call off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get client reuse and refresh counters."""
+        metrics = dict(self._metrics)
+        lookups = metrics['hits'] + metrics['builds']
+        metrics['hit_rate'] = metrics['hits'] / lookups if lookups else 0.0
+        metrics['clients'] = len(self._clients)
+        metrics['users'] = len(self._credentials)
+        return metrics
+
+
+# Global Google API client cache instance
+_google_api_client_cache: Optional[GoogleAPIClientCache] = None
+
+
+def get_google_api_client_cache() -> GoogleAPIClientCache:
+    """Get the global Google API client cache instance."""
+    global _google_api_client_cache
+    if _google_api_client_cache is None:
+        _google_api_client_cache = GoogleAPIClientCache()
+    return _google_api_client_cache
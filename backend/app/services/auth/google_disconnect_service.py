@@ -10,6 +10,7 @@ from pydantic import BaseModel
 
 from ...core.database import get_supabase
 from ...core.config import get_settings
+from .google_api_client_cache import get_google_api_client_cache
 
 logger = logging.getLogger(__name__)
 
@@ -176,6 +177,8 @@ class GoogleDisconnectService:
                 .eq("user_id", user_id) \
                 .execute()
             
+            get_google_api_client_cache().invalidate_user(user_id)
+            
             if result.data:
                 logger.info(f"Google credentials soft deleted for user {user_id}")
                 return True
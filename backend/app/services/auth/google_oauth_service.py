@@ -12,6 +12,7 @@ from pydantic import BaseModel
 
 from ...core.supabase_config import get_supabase_client, get_supabase_service_client
 from ...core.config import get_settings
+from .google_api_client_cache import get_google_api_client_cache
 
 logger = logging.getLogger(__name__)
 
@@ -342,6 +343,9 @@ class GoogleOAuthService:
                 logger.info(f"🔍 OAuth Debug - Insert result: {insert_result}")
                 logger.info(f"Stored new Google credentials for user {user_id}")
             
+            # New tokens may carry a different grant or scopes; rebuild cached API clients
+            get_google_api_client_cache().invalidate_user(user_id)
+            
             # Verify the credentials were actually stored
             logger.info("🔍 OAuth Debug - Verifying storage...")
             verification = self.supabase.table("google_credentials").select("user_id, access_token, google_email").eq("user_id", user_id).execute()
@@ -418,6 +422,9 @@ class GoogleOAuthService:
                 logger.info(f"🔍 OAuth Debug - Credential Storage: Insert result: {insert_result}")
                 logger.info(f"Stored new Google workspace credentials for user {user_id}")
             
+            # New tokens may carry a different grant or scopes; rebuild cached API clients
+            get_google_api_client_cache().invalidate_user(user_id)
+            
             # Verify the credentials were actually stored
             logger.info("🔍 OAuth Debug - Credential Storage: Verifying storage...")
             verification = supabase_client.table("google_credentials").select("user_id, google_email, scope").eq("user_id", user_id).eq("login_provider", False).execute()
@@ -3,15 +3,14 @@ Google token refresh service for BeSunny.ai Python backend.
 Handles automated Google token refresh and management.
 """
 
-import asyncio
 import logging
 from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
-import httpx
+from datetime import datetime
 from pydantic import BaseModel
 
 from ...core.database import get_supabase
 from ...core.config import get_settings
+from .token_refresh_engine import get_token_refresh_engine
 
 logger = logging.getLogger(__name__)
 
@@ -41,11 +40,9 @@ class GoogleTokenRefreshService:
     def __init__(self):
         self.settings = get_settings()
         self.supabase = get_supabase()
-        self.client_id = self.settings.google_client_id
-        self.client_secret = self.settings.google_client_secret
         
-        # HTTP client for Google API calls
-        self.http_client = httpx.AsyncClient(timeout=30.0)
+        # Exchanges are deduplicated and bounded by the shared refresh engine
+        self.refresh_engine = get_token_refresh_engine()
         
         logger.info("Google Token Refresh Service initialized")
     
@@ -61,42 +58,11 @@ class GoogleTokenRefreshService:
         """
         try:
             logger.info(f"Refreshing tokens for user {user_id}")
+            result = await self.refresh_engine.refresh_user(user_id)
             
-            # Get user's stored refresh token
-            refresh_token = await self._get_user_refresh_token(user_id)
-            if not refresh_token:
-                return TokenRefreshResult(
-                    user_id=user_id,
-                    success=False,
-                    error_message="No refresh token found",
-                    timestamp=datetime.now()
-                )
-            
-            # Exchange refresh token for new access token
-            new_tokens = await self._exchange_refresh_token(refresh_token)
-            if not new_tokens:
-                return TokenRefreshResult(
-                    user_id=user_id,
-                    success=False,
-                    error_message="Failed to exchange refresh token",
-                    timestamp=datetime.now()
-                )
-            
-            # Update stored credentials
-            await self._update_user_credentials(user_id, new_tokens)
-            
-            # Update user sessions
-            await self._update_user_sessions(user_id, new_tokens['access_token'])
-            
-            logger.info(f"Successfully refreshed tokens for user {user_id}")
-            
-            return TokenRefreshResult(
-                user_id=user_id,
-                success=True,
-                new_access_token=new_tokens['access_token'],
-                expires_in=new_tokens['expires_in'],
-                timestamp=datetime.now()
-            )
+            if result['success']:
+                logger.info(f"Successfully refreshed tokens for user {user_id}")
+            return self._to_refresh_result(result)
             
         except Exception as e:
             logger.error(f"Failed to refresh tokens for user {user_id}: {e}")
@@ -109,56 +75,18 @@ class GoogleTokenRefreshService:
     
     async def refresh_expired_tokens(self) -> BatchRefreshResult:
         """
-        Refresh all expired Google OAuth tokens.
+        Refresh all expired Google OAuth tokens, and those expiring within the refresh lead time.
         
         Returns:
             Batch refresh result with summary
         """
         try:
             logger.info("Starting batch token refresh for expired tokens")
+            results = await self.refresh_engine.refresh_due()
+            batch_result = self._to_batch_result(results)
             
-            # Get all users with expired tokens
-            expired_tokens = await self._get_expired_tokens()
-            
-            if not expired_tokens:
-                logger.info("No expired tokens found")
-                return BatchRefreshResult(
-                    total_users=0,
-                    successful_refreshes=0,
-                    failed_refreshes=0,
-                    results=[],
-                    timestamp=datetime.now()
-                )
-            
-            logger.info(f"Found {len(expired_tokens)} users with expired tokens")
-            
-            # Refresh tokens for each user
-            results = []
-            successful = 0
-            failed = 0
-            
-            for token_info in expired_tokens:
-                user_id = token_info['user_id']
-                result = await self.refresh_user_token(user_id)
-                results.append(result)
-                
-                if result.success:
-                    successful += 1
-                else:
-                    failed += 1
-                
-                # Small delay to avoid overwhelming Google's API
-                await asyncio.sleep(0.1)
-            
-            logger.info(f"Batch token refresh completed: {successful} successful, {failed} failed")
-            
-            return BatchRefreshResult(
-                total_users=len(expired_tokens),
-                successful_refreshes=successful,
-                failed_refreshes=failed,
-                results=results,
-                timestamp=datetime.now()
-            )
+            logger.info(f"Batch token refresh completed: {batch_result.successful_refreshes} successful, {batch_result.failed_refreshes} failed")
+            return batch_result
             
         except Exception as e:
             logger.error(f"Batch token refresh failed: {e}")
@@ -182,74 +110,11 @@ class GoogleTokenRefreshService:
         """
         try:
             logger.info(f"Starting proactive token refresh for tokens expiring within {minutes_before_expiry} minutes")
+            results = await self.refresh_engine.refresh_due(minutes_before_expiry)
+            batch_result = self._to_batch_result(results)
             
-            # Get tokens that will expire soon
-            now = datetime.now()
-            soon_expiry = now + timedelta(minutes=minutes_before_expiry)
-            
-            result = self.supabase.table("google_credentials") \
-                .select("user_id, access_token, refresh_token, expires_at") \
-                .not_.is_("refresh_token", None) \
-                .not_.is_("access_token", None) \
-                .not_.is_("expires_at", None) \
-                .execute()
-            
-            expiring_tokens = []
-            for token in result.data:
-                try:
-                    expires_at = token['expires_at']
-                    if isinstance(expires_at, str):
-                        expires_datetime = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
-                    else:
-                        expires_datetime = expires_at
-                    
-                    # Check if token expires within the specified time
-                    if now < expires_datetime <= soon_expiry:
-                        expiring_tokens.append(token)
-                        logger.info(f"Token for user {token['user_id']} expires at {expires_at}, will refresh proactively")
-                        
-                except Exception as e:
-                    logger.warning(f"Failed to parse expiration time for user {token['user_id']}: {e}")
-            
-            if not expiring_tokens:
-                logger.info("No tokens need proactive refresh")
-                return BatchRefreshResult(
-                    total_users=0,
-                    successful_refreshes=0,
-                    failed_refreshes=0,
-                    results=[],
-                    timestamp=datetime.now()
-                )
-            
-            logger.info(f"Found {len(expiring_tokens)} tokens that need proactive refresh")
-            
-            # Refresh tokens for each user
-            results = []
-            successful = 0
-            failed = 0
-            
-            for token_info in expiring_tokens:
-                user_id = token_info['user_id']
-                result = await self.refresh_user_token(user_id)
-                results.append(result)
-                
-                if result.success:
-                    successful += 1
-                else:
-                    failed += 1
-                
-                # Small delay to avoid overwhelming Google's API
-                await asyncio.sleep(0.1)
-            
-            logger.info(f"Proactive token refresh completed: {successful} successful, {failed} failed")
-            
-            return BatchRefreshResult(
-                total_users=len(expiring_tokens),
-                successful_refreshes=successful,
-                failed_refreshes=failed,
-                results=results,
-                timestamp=datetime.now()
-            )
+            logger.info(f"Proactive token refresh completed: {batch_result.successful_refreshes} successful, {batch_result.failed_refreshes} failed")
+            return batch_result
             
         except Exception as e:
             logger.error(f"Proactive token refresh failed: {e}")
@@ -405,173 +270,28 @@ class GoogleTokenRefreshService:
                 'timestamp': datetime.now().isoformat()
             }
     
-    async def _get_user_refresh_token(self, user_id: str) -> Optional[str]:
-        """Get user's stored refresh token."""
-        try:
-            result = self.supabase.table("google_credentials") \
-                .select("refresh_token") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-            
-            return result.data.get('refresh_token') if result.data else None
-            
-        except Exception as e:
-            logger.error(f"Failed to get refresh token for user {user_id}: {e}")
-            return None
-    
-    async def _exchange_refresh_token(self, refresh_token: str) -> Optional[Dict[str, Any]]:
-        """Exchange refresh token for new access token."""
-        try:
-            token_data = {
-                'refresh_token': refresh_token,
-                'client_id': self.client_id,
-                'client_secret': self.client_secret,
-                'grant_type': 'refresh_token'
-            }
-            
-            response = await self.http_client.post(
-                'https://oauth2.googleapis.com/token',
-                data=token_data
-            )
-            response.raise_for_status()
-            
-            token_response = response.json()
-            
-            return {
-                'access_token': token_response['access_token'],
-                'expires_in': token_response['expires_in'],
-                'token_type': token_response['token_type'],
-                'scope': token_response.get('scope', '')
-            }
-            
-        except Exception as e:
-            logger.error(f"Failed to exchange refresh token: {e}")
-            return None
+    def _to_refresh_result(self, result: Dict[str, Any]) -> TokenRefreshResult:
+        """Convert a refresh engine result to a TokenRefreshResult."""
+        return TokenRefreshResult(
+            user_id=result['user_id'],
+            success=result['success'],
+            new_access_token=result.get('access_token'),
+            expires_in=result.get('expires_in'),
+            error_message=result.get('error'),
+            timestamp=datetime.now()
+        )
     
-    async def _update_user_credentials(self, user_id: str, new_tokens: Dict[str, Any]):
-        """Update user's stored Google credentials."""
-        try:
-            # Calculate new expiration time
-            expires_in = new_tokens.get('expires_in', 3600)  # Default to 1 hour
-            expires_at = datetime.now() + timedelta(seconds=expires_in)
-            
-            update_data = {
-                'access_token': new_tokens['access_token'],
-                'expires_in': expires_in,
-                'expires_at': expires_at.isoformat(),
-                'updated_at': datetime.now().isoformat()
-            }
-            
-            logger.info(f"Updating credentials for user {user_id} - expires at {expires_at.isoformat()}")
-            
-            result = self.supabase.table("google_credentials") \
-                .update(update_data) \
-                .eq("user_id", user_id) \
-                .execute()
-            
-            if result.data:
-                logger.info(f"Successfully updated credentials for user {user_id}")
-            else:
-                logger.warning(f"No rows updated for user {user_id}")
-            
-        except Exception as e:
-            logger.error(f"Failed to update credentials for user {user_id}: {e}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-    
-    async def _update_user_sessions(self, user_id: str, new_access_token: str):
-        """Update user sessions with new access token."""
-        try:
-            update_data = {
-                'access_token': new_access_token,
-                'updated_at': datetime.now().isoformat()
-            }
-            
-            self.supabase.table("user_sessions") \
-                .update(update_data) \
-                .eq("user_id", user_id) \
-                .execute()
-            
-        except Exception as e:
-            logger.error(f"Failed to update sessions for user {user_id}: {e}")
-    
-    async def _get_expired_tokens(self) -> List[Dict[str, Any]]:
-        """Get all expired tokens that need refresh."""
-        try:
-            # Get tokens that are expired or will expire soon
-            now = datetime.now()
-            soon_expiry = now + timedelta(minutes=15)  # Refresh tokens expiring within 15 minutes
-            
-            # Query for tokens that need refresh
-            result = self.supabase.table("google_credentials") \
-                .select("user_id, access_token, refresh_token, expires_at, expires_in, updated_at") \
-                .not_.is_("refresh_token", None) \
-                .not_.is_("access_token", None) \
-                .execute()
-            
-            expired_tokens = []
-            for token in result.data:
-                user_id = token['user_id']
-                expires_at = token.get('expires_at')
-                updated_at = token.get('updated_at')
-                
-                # Check if token needs refresh based on expires_at field
-                if expires_at:
-                    try:
-                        # Parse the expiration time
-                        if isinstance(expires_at, str):
-                            expires_datetime = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
-                        else:
-                            expires_datetime = expires_at
-                        
-                        # Check if token is expired or will expire soon
-                        if expires_datetime <= soon_expiry:
-                            expired_tokens.append({
-                                'user_id': user_id,
-                                'expires_at': expires_at,
-                                'updated_at': updated_at
-                            })
-                            logger.info(f"Token for user {user_id} expires at {expires_at}, will refresh")
-                            
-                    except Exception as e:
-                        logger.warning(f"Failed to parse expiration time for user {user_id}: {e}")
-                        # Fallback to time-based check
-                        if updated_at:
-                            try:
-                                updated_datetime = datetime.fromisoformat(updated_at.replace('Z', '+00:00'))
-                                # Assume 1 hour expiration if we can't parse expires_at
-                                if updated_datetime < now - timedelta(hours=1):
-                                    expired_tokens.append({
-                                        'user_id': user_id,
-                                        'expires_at': expires_at,
-                                        'updated_at': updated_at
-                                    })
-                                    logger.info(f"Token for user {user_id} marked for refresh (fallback method)")
-                            except Exception as parse_error:
-                                logger.error(f"Failed to parse updated_at for user {user_id}: {parse_error}")
-                
-                # Fallback: if no expires_at field, use updated_at with assumed expiration
-                elif updated_at:
-                    try:
-                        updated_datetime = datetime.fromisoformat(updated_at.replace('Z', '+00:00'))
-                        # Assume 1 hour expiration
-                        if updated_datetime < now - timedelta(hours=1):
-                            expired_tokens.append({
-                                'user_id': user_id,
-                                'expires_at': None,
-                                'updated_at': updated_at
-                            })
-                            logger.info(f"Token for user {user_id} marked for refresh (no expires_at field)")
-                    except Exception as parse_error:
-                        logger.error(f"Failed to parse updated_at for user {user_id}: {parse_error}")
-            
-            logger.info(f"Found {len(expired_tokens)} tokens that need refresh")
-            return expired_tokens
-            
-        except Exception as e:
-            logger.error(f"Failed to get expired tokens: {e}")
-            return []
+    def _to_batch_result(self, results: List[Dict[str, Any]]) -> BatchRefreshResult:
+        """Summarize refresh engine results as a BatchRefreshResult."""
+        refresh_results = [self._to_refresh_result(result) for result in results]
+        successful = sum(1 for result in refresh_results if result.success)
+        return BatchRefreshResult(
+            total_users=len(refresh_results),
+            successful_refreshes=successful,
+            failed_refreshes=len(refresh_results) - successful,
+            results=refresh_results,
+            timestamp=datetime.now()
+        )
     
     async def _update_refresh_metrics(self, successful: int, failed: int):
         """Update token refresh performance metrics."""
@@ -588,4 +308,4 @@ class GoogleTokenRefreshService:
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Async context manager exit."""
-        await self.http_client.aclose()
+        pass
@@ -12,6 +12,8 @@ from pydantic import BaseModel
 
 from ...core.supabase_config import get_supabase_service_client
 from ...core.config import get_settings
+from .google_api_client_cache import get_google_api_client_cache
+from .token_refresh_engine import get_token_refresh_engine
 
 logger = logging.getLogger(__name__)
 
@@ -134,6 +136,9 @@ class GoogleTokenService:
         """
         Refresh tokens for a specific user.
         
+        Concurrent refreshes for the same user share one exchange through the
+        token refresh engine.
+        
         Args:
             user_id: User ID to refresh tokens for
             
@@ -141,76 +146,18 @@ class GoogleTokenService:
             Token refresh result or None if failed
         """
         try:
-            logger.info(f"🔍 DEBUG: refresh_user_tokens called for user {user_id}")
-            
-            # Get user's refresh token
-            refresh_token = await self._get_user_refresh_token(user_id)
-            logger.info(f"🔍 DEBUG: _get_user_refresh_token returned: {bool(refresh_token)}")
-            
-            if not refresh_token:
-                logger.error(f"🔍 DEBUG: No refresh token found for user {user_id}")
-                return {
-                    'success': False,
-                    'error': 'No refresh token found for user',
-                    'error_code': 'NO_REFRESH_TOKEN'
-                }
-            
-            logger.info(f"🔍 DEBUG: Got refresh token for user {user_id}, length: {len(refresh_token) if refresh_token else 0}")
-            
-            # Exchange refresh token
-            logger.info(f"🔍 DEBUG: Calling exchange_token for user {user_id}")
-            new_tokens = await self.exchange_token(refresh_token)
-            logger.info(f"🔍 DEBUG: exchange_token returned: {new_tokens}")
-            
-            if not new_tokens:
-                logger.error(f"🔍 DEBUG: Failed to exchange refresh token for user {user_id}")
-                # Check if this was due to an expired/revoked token
-                return {
-                    'success': False,
-                    'error': 'Refresh token expired or revoked',
-                    'error_code': 'TOKEN_EXPIRED_OR_REVOKED',
-                    'needs_reauth': True
-                }
-            
-            logger.info(f"🔍 DEBUG: Token exchange successful for user {user_id}, new_tokens keys: {list(new_tokens.keys()) if new_tokens else 'None'}")
-            logger.info(f"🔍 DEBUG: New tokens for user {user_id}: expires_in={new_tokens.get('expires_in')}, token_type={new_tokens.get('token_type')}")
-            
-            # Update user's tokens in database
-            update_success = await self._update_user_tokens(
-                user_id, 
-                new_tokens['access_token'], 
-                refresh_token,
-                new_tokens['expires_in']
-            )
-            
-            if not update_success:
-                logger.error(f"🔍 DEBUG: Failed to update user tokens in database for user {user_id}")
-                return {
-                    'success': False,
-                    'error': 'Failed to update user tokens',
-                    'error_code': 'DATABASE_UPDATE_FAILED'
-                }
+            result = await get_token_refresh_engine().refresh_user(user_id)
             
-            # Update user sessions
-            await self._update_user_sessions(user_id, new_tokens['access_token'])
-            
-            logger.info(f"🔍 DEBUG: Successfully refreshed tokens for user {user_id}")
-            
-            result = {
-                'success': True,
-                'user_id': user_id,
-                'access_token': new_tokens['access_token'],
-                'expires_in': new_tokens['expires_in'],
-                'token_type': new_tokens['token_type']
-            }
-            
-            logger.info(f"🔍 DEBUG: Returning result for user {user_id}: {result}")
+            if result['success']:
+                logger.info(f"Successfully refreshed tokens for user {user_id}")
+            else:
+                logger.error(f"Failed to refresh tokens for user {user_id}: {result['error']} ({result['error_code']})")
             return result
             
         except Exception as e:
-            logger.error(f"🔍 DEBUG: Failed to refresh user tokens: {e}")
+            logger.error(f"Failed to refresh user tokens: {e}")
             import traceback
-            logger.error(f"🔍 DEBUG: Traceback: {traceback.format_exc()}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
             return {
                 'success': False,
                 'error': str(e),
@@ -405,16 +352,15 @@ class GoogleTokenService:
     
     async def batch_refresh_expired_tokens(self) -> Dict[str, Any]:
         """
-        Refresh all expired tokens in batch.
+        Refresh all expired tokens, and those expiring within the next hour, in batch.
         
         Returns:
             Batch refresh results
         """
         try:
-            # Get all expired tokens
-            expired_tokens = await self._get_expired_tokens()
+            results = await get_token_refresh_engine().refresh_due(lead_minutes=60)
             
-            if not expired_tokens:
+            if not results:
                 return {
                     'total_tokens': 0,
                     'refreshed_tokens': 0,
@@ -422,29 +368,16 @@ class GoogleTokenService:
                     'message': 'No expired tokens found'
                 }
             
-            refreshed_count = 0
-            failed_count = 0
-            
-            for token_info in expired_tokens:
-                try:
-                    result = await self.refresh_user_tokens(token_info['user_id'])
-                    if result and result.get('success'):
-                        refreshed_count += 1
-                    else:
-                        failed_count += 1
-                        
-                except Exception as e:
-                    logger.error(f"Failed to refresh token for user {token_info['user_id']}: {e}")
-                    failed_count += 1
-                    continue
+            refreshed_count = sum(1 for result in results if result['success'])
+            failed_count = len(results) - refreshed_count
             
             logger.info(f"Batch token refresh completed: {refreshed_count} refreshed, {failed_count} failed")
             
             return {
-                'total_tokens': len(expired_tokens),
+                'total_tokens': len(results),
                 'refreshed_tokens': refreshed_count,
                 'failed_tokens': failed_count,
-                'success_rate': refreshed_count / len(expired_tokens) if expired_tokens else 0
+                'success_rate': refreshed_count / len(results)
             }
             
         except Exception as e:
@@ -527,35 +460,6 @@ class GoogleTokenService:
             logger.error(f"Traceback: {traceback.format_exc()}")
             return None
     
-    async def _update_user_tokens(self, user_id: str, access_token: str, 
-                                refresh_token: str, expires_in: int) -> bool:
-        """Update user's tokens in database."""
-        try:
-            # Calculate the actual expiration timestamp
-            from datetime import datetime, timedelta
-            expires_at = (datetime.now() + timedelta(seconds=expires_in)).isoformat()
-            
-            update_data = {
-                'access_token': access_token,
-                'expires_in': expires_in,
-                'expires_at': expires_at,  # Add the missing expires_at field
-            }
-            
-            logger.info(f"Attempting to update tokens for user {user_id}")
-            logger.info(f"Update data: {update_data}")
-            
-            result = self.supabase.table("google_credentials") \
-                .update(update_data) \
-                .eq("user_id", user_id) \
-                .execute()
-            
-            logger.info(f"Updated tokens for user {user_id}, expires_at: {expires_at}")
-            return result.data is not None
-            
-        except Exception as e:
-            logger.error(f"Failed to update user tokens: {e}")
-            return False
-    
     async def refresh_expired_tokens(self) -> Dict[str, Any]:
         """Refresh all expired tokens."""
         return await self.batch_refresh_expired_tokens()
@@ -678,24 +582,10 @@ class GoogleTokenService:
                 .eq("user_id", user_id) \
                 .execute()
             
-        except Exception as e:
-            logger.error(f"Failed to mark token invalid for user {user_id}: {e}")
-    
-    async def _update_user_sessions(self, user_id: str, new_access_token: str):
-        """Update user sessions with new access token."""
-        try:
-            update_data = {
-                'access_token': new_access_token,
-                'updated_at': datetime.now().isoformat()
-            }
-            
-            self.supabase.table("user_sessions") \
-                .update(update_data) \
-                .eq("user_id", user_id) \
-                .execute()
+            get_google_api_client_cache().invalidate_user(user_id)
             
         except Exception as e:
-            logger.error(f"Failed to update user sessions: {e}")
+            logger.error(f"Failed to mark token invalid for user {user_id}: {e}")
     
     async def _clear_user_credentials(self, user_id: str):
         """Clear user's Google credentials."""
@@ -705,6 +595,8 @@ class GoogleTokenService:
                 .eq("user_id", user_id) \
                 .execute()
             
+            get_google_api_client_cache().invalidate_user(user_id)
+            
         except Exception as e:
             logger.error(f"Failed to clear user credentials: {e}")
     
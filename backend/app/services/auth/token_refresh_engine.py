@@ -0,0 +1,463 @@
+"""
+Google token refresh engine for BeSunny.ai Python backend.
+Refreshes Google access tokens ahead of expiry with bounded concurrency, one exchange
+in flight per user, and bulk write-back of the refreshed credentials.
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+import httpx
+
+from ...core.config import get_settings
+from ...core.supabase_config import get_supabase_service_client, execute_async
+from .google_api_client_cache import get_google_api_client_cache
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_TOKEN_URL = 'https://oauth2.googleapis.com/token'
+
+
+class TokenRefreshEngine:
+    """
+    Shared refresh path for every Google token refresh caller.
+
+    Due users are popped from a heap ordered by token expiry, which is filled by
+    an indexed range query on expires_at at most every
+    google_token_refresh_rescan_seconds. Within a process, concurrent callers for
+    the same user await one in-flight exchange; across processes, a lease on the
+    credential row stops Celery workers and the API from exchanging the same
+    refresh token at once.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.supabase = get_supabase_service_client()
+        self.client_id = self.settings.google_client_id
+        self.client_secret = self.settings.google_client_secret
+
+        self.concurrency = max(1, self.settings.google_token_refresh_concurrency)
+        self.lead_minutes = self.settings.google_token_refresh_lead_minutes
+        self.lease_seconds = self.settings.google_token_refresh_lease_seconds
+        self.rescan_seconds = self.settings.google_token_refresh_rescan_seconds
+        self.retry_seconds = self.settings.google_token_refresh_retry_seconds
+        self.scan_limit = self.settings.google_token_refresh_scan_limit
+        self.lookup_batch_size = 200
+
+        # (expires_at epoch, user_id); entries that no longer match _scheduled are skipped when popped
+        self._heap: List[Tuple[float, str]] = []
+        self._scheduled: Dict[str, float] = {}
+        self._scanned_at: Optional[float] = None
+        self._scan_horizon = 0.0
+
+        # Bound to the running event loop; Celery tasks run each job on a new one
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self._metrics = {
+            'scans': 0,
+            'exchanges': 0,
+            'joined': 0,
+            'refreshed': 0,
+            'failed': 0,
+            'invalid_grants': 0,
+            'lease_conflicts': 0,
+            'bulk_writes': 0,
+            'write_failures': 0
+        }
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._in_flight = {}
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def refresh_user(self, user_id: str, due_before: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Refresh a user's access token, joining an exchange already in flight for them.
+
+        With due_before, a stored token that outlives it is returned without an exchange.
+
+        Returns:
+            Dict with success, user_id and either access_token, expires_in, expires_at
+            and token_type, or error, error_code and needs_reauth
+        """
+        return (await self.refresh_users([user_id], due_before=due_before))[0]
+
+    async def refresh_due(self, lead_minutes: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Refresh every token that expires within lead_minutes, or has already expired.
+
+        Returns:
+            One refresh_user result per due user
+        """
+        lead = (self.lead_minutes if lead_minutes is None else lead_minutes) * 60
+        now = time.time()
+
+        if (self._scanned_at is None
+                or time.monotonic() - self._scanned_at >= self.rescan_seconds
+                or now + lead > self._scan_horizon):
+            await self._scan(now + lead + self.rescan_seconds)
+
+        due = []
+        while self._heap and self._heap[0][0] <= now + lead:
+            expires_at, user_id = heapq.heappop(self._heap)
+            if self._scheduled.get(user_id) == expires_at:
+                del self._scheduled[user_id]
+                due.append(user_id)
+
+        if not due:
+            return []
+
+        logger.info(f"Refreshing {len(due)} Google tokens expiring within {lead // 60} minutes")
+        return await self.refresh_users(due, due_before=now + lead)
+
+    async def refresh_users(self, user_ids: List[str], due_before: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Refresh several users' tokens concurrently, one result per user in input order.
+
+        With due_before, users whose stored token already outlives it (refreshed
+        elsewhere since the last scan) get their stored token instead of an exchange.
+        """
+        self._bind_loop()
+        user_ids = list(dict.fromkeys(user_ids))
+
+        joined = {user_id: self._in_flight[user_id] for user_id in user_ids if user_id in self._in_flight}
+        futures = {}
+        for user_id in user_ids:
+            if user_id not in joined:
+                futures[user_id] = self._loop.create_future()
+                self._in_flight[user_id] = futures[user_id]
+        self._metrics['joined'] += len(joined)
+
+        results: Dict[str, Dict[str, Any]] = {}
+        try:
+            if futures:
+                # One HTTP client per batch, closed with it; Celery runs each job on a new event loop
+                async with httpx.AsyncClient(timeout=30.0) as http_client:
+                    results = await self._refresh_batch(list(futures), due_before, http_client)
+        except Exception as e:
+            logger.error(f"Google token refresh batch failed: {e}")
+        finally:
+            # Waiters always get a result, so the shared futures never raise
+            for user_id, future in futures.items():
+                if self._in_flight.get(user_id) is future:
+                    del self._in_flight[user_id]
+                if user_id not in results:
+                    results[user_id] = self._failure(user_id, 'Token refresh did not complete', 'UNKNOWN_ERROR')
+                if not future.done():
+                    future.set_result(results[user_id])
+
+        for user_id, future in joined.items():
+            results[user_id] = await asyncio.shield(future)
+
+        return [results[user_id] for user_id in user_ids]
+
+    async def _refresh_batch(self, user_ids: List[str], due_before: Optional[float],
+                             http_client: httpx.AsyncClient) -> Dict[str, Dict[str, Any]]:
+        rows = await self._load_credential_rows(
+            user_ids, "user_id, access_token, refresh_token, expires_in, expires_at, login_provider"
+        )
+        results = {}
+        for user_id in user_ids:
+            row = rows.get(user_id) or {}
+            expires_at = self._expiry_timestamp(row.get('expires_at'))
+            if not row.get('refresh_token'):
+                results[user_id] = self._failure(user_id, 'No refresh token found for user', 'NO_REFRESH_TOKEN')
+            elif due_before is not None and row.get('access_token') and expires_at and expires_at > due_before:
+                results[user_id] = self._stored_result(user_id, row)
+
+        candidates = [user_id for user_id in user_ids if user_id not in results]
+        claimed = await self._claim_leases(candidates)
+        leased_elsewhere = [user_id for user_id in candidates if user_id not in claimed]
+        claimed = [user_id for user_id in candidates if user_id in claimed]
+
+        exchanges = asyncio.gather(*[self._exchange(user_id, rows[user_id]['refresh_token'], http_client) for user_id in claimed])
+        if leased_elsewhere:
+            self._metrics['lease_conflicts'] += len(leased_elsewhere)
+            exchanged, remote = await asyncio.gather(exchanges, self._await_remote_refreshes(leased_elsewhere))
+            results.update(remote)
+        else:
+            exchanged = await exchanges
+
+        unstored = await self._store_refreshed_tokens(exchanged) if exchanged else set()
+        exchanged = [
+            self._failure(result['user_id'], 'Failed to update user tokens', 'DATABASE_UPDATE_FAILED')
+            if result['user_id'] in unstored else result
+            for result in exchanged
+        ]
+
+        for result in exchanged:
+            results[result['user_id']] = result
+
+        refreshed = [result for result in exchanged if result['success']]
+        client_cache = get_google_api_client_cache()
+        for result in refreshed:
+            client_cache.apply_refreshed_token(result['user_id'], result['access_token'], result['expires_at'])
+        await asyncio.gather(*[
+            self._update_user_session(result['user_id'], result['access_token']) for result in refreshed
+        ])
+
+        for user_id in user_ids:
+            result = results[user_id]
+            if result['success']:
+                self.schedule(user_id, result.get('expires_at'))
+            elif not result.get('needs_reauth') and result['error_code'] != 'NO_REFRESH_TOKEN':
+                self._schedule_at(user_id, time.time() + self.retry_seconds)
+
+        self._metrics['refreshed'] += len(refreshed)
+        self._metrics['failed'] += sum(1 for result in results.values() if not result['success'])
+        return results
+
+    async def _exchange(self, user_id: str, refresh_token: str, http_client: httpx.AsyncClient) -> Dict[str, Any]:
+        """Exchange a refresh token for a new access token."""
+        async with self._semaphore:
+            self._metrics['exchanges'] += 1
+            try:
+                response = await http_client.post(GOOGLE_TOKEN_URL, data={
+                    'refresh_token': refresh_token,
+                    'client_id': self.client_id,
+                    'client_secret': self.client_secret,
+                    'grant_type': 'refresh_token'
+                })
+            except Exception as e:
+                logger.error(f"Failed to exchange refresh token for user {user_id}: {e}")
+                return self._failure(user_id, str(e), 'EXCHANGE_FAILED')
+
+        if response.status_code != 200:
+            try:
+                error = response.json().get('error')
+            except ValueError:
+                error = None
+            if error == 'invalid_grant':
+                self._metrics['invalid_grants'] += 1
+                logger.error(f"Refresh token for user {user_id} is expired or revoked - user needs to re-authenticate")
+                return self._failure(user_id, 'Refresh token expired or revoked', 'TOKEN_EXPIRED_OR_REVOKED', needs_reauth=True)
+            logger.error(f"Google OAuth error for user {user_id}: {response.status_code} {response.text}")
+            return self._failure(user_id, f"Google token endpoint returned {response.status_code}", 'EXCHANGE_FAILED')
+
+        token_response = response.json()
+        expires_in = int(token_response.get('expires_in', 3600))
+        return {
+            'success': True,
+            'user_id': user_id,
+            'access_token': token_response['access_token'],
+            'expires_in': expires_in,
+            'expires_at': (datetime.now() + timedelta(seconds=expires_in)).isoformat(),
+            'token_type': token_response.get('token_type', 'Bearer')
+        }
+
+    async def _scan(self, horizon: float):
+        """Rebuild the expiry heap from credentials expiring before horizon."""
+        try:
+            result = await execute_async(
+                self.supabase.table("google_credentials")
+                .select("user_id, expires_at")
+                .not_.is_("refresh_token", None)
+                .or_(f"expires_at.is.null,expires_at.lte.{datetime.fromtimestamp(horizon).isoformat()}")
+                .order("expires_at")
+                .limit(self.scan_limit)
+            )
+        except Exception as e:
+            logger.error(f"Failed to scan expiring Google tokens: {e}")
+            return
+
+        rows = result.data or []
+        self._metrics['scans'] += 1
+        self._scanned_at = time.monotonic()
+        self._scan_horizon = horizon
+        if len(rows) >= self.scan_limit:
+            # Rows past the last one returned are picked up by a later scan
+            self._scan_horizon = min(horizon, self._expiry_timestamp(rows[-1].get('expires_at')) or horizon)
+
+        self._heap = []
+        self._scheduled = {}
+        for row in rows:
+            expires_at = self._expiry_timestamp(row.get('expires_at')) or 0.0
+            if row['user_id'] not in self._scheduled or expires_at < self._scheduled[row['user_id']]:
+                self._scheduled[row['user_id']] = expires_at
+        self._heap = [(expires_at, user_id) for user_id, expires_at in self._scheduled.items()]
+        heapq.heapify(self._heap)
+
+    def schedule(self, user_id: str, expires_at: Optional[str]):
+        """Record a user's new token expiry so the token is refreshed ahead of it."""
+        self._schedule_at(user_id, self._expiry_timestamp(expires_at) or time.time())
+
+    def _schedule_at(self, user_id: str, due: float):
+        self._scheduled.pop(user_id, None)
+        # Expiries past the scanned window are picked up by the next scan
+        if due <= self._scan_horizon:
+            self._scheduled[user_id] = due
+            heapq.heappush(self._heap, (due, user_id))
+
+    async def _load_credential_rows(self, user_ids: List[str], columns: str) -> Dict[str, Dict[str, Any]]:
+        """Get each user's preferred credential row, keyed by user_id."""
+        rows: Dict[str, Dict[str, Any]] = {}
+        try:
+            for i in range(0, len(user_ids), self.lookup_batch_size):
+                # Workspace credentials (login_provider false) take precedence over login-only ones
+                result = await execute_async(
+                    self.supabase.table("google_credentials")
+                    .select(columns)
+                    .in_("user_id", user_ids[i:i + self.lookup_batch_size])
+                    .order("login_provider")
+                )
+                for row in result.data or []:
+                    rows.setdefault(row['user_id'], row)
+        except Exception as e:
+            logger.error(f"Failed to load Google credentials for {len(user_ids)} users: {e}")
+        return rows
+
+    async def _claim_leases(self, user_ids: List[str]) -> set:
+        """Claim the cross-process refresh lease for users, returning those claimed."""
+        if not user_ids:
+            return set()
+        try:
+            result = await execute_async(
+                self.supabase.rpc('claim_google_token_refresh', {
+                    'p_user_ids': user_ids,
+                    'p_lease_seconds': self.lease_seconds
+                })
+            )
+            return {row['user_id'] for row in result.data or []}
+        except Exception as e:
+            # Without leases, in-process single-flight still prevents duplicate exchanges here
+            logger.error(f"Failed to claim Google token refresh leases: {e}")
+            return set(user_ids)
+
+    async def _await_remote_refreshes(self, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Wait for refreshes leased by another process and return the tokens they stored."""
+        results: Dict[str, Dict[str, Any]] = {}
+        pending = list(user_ids)
+        deadline = time.monotonic() + self.lease_seconds
+
+        while pending:
+            rows = await self._load_credential_rows(
+                pending, "user_id, access_token, expires_in, expires_at, refresh_lease_until, login_provider"
+            )
+            now = time.time()
+            for user_id in pending:
+                row = rows.get(user_id)
+                lease_until = self._expiry_timestamp(row.get('refresh_lease_until')) if row else None
+                if lease_until is None or lease_until <= now:
+                    results[user_id] = self._stored_result(user_id, row)
+
+            pending = [user_id for user_id in pending if user_id not in results]
+            if not pending or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(1)
+
+        for user_id in pending:
+            results[user_id] = self._failure(user_id, 'Token refresh in progress in another worker', 'REFRESH_IN_PROGRESS')
+        return results
+
+    def _stored_result(self, user_id: str, row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        expires_at = self._expiry_timestamp(row.get('expires_at')) if row else None
+        if not row or not row.get('access_token') or (expires_at is not None and expires_at <= time.time()):
+            return self._failure(user_id, 'Token refresh in another worker failed', 'REFRESH_FAILED')
+        return {
+            'success': True,
+            'user_id': user_id,
+            'access_token': row['access_token'],
+            'expires_in': max(0, int(expires_at - time.time())) if expires_at else row.get('expires_in'),
+            'expires_at': row.get('expires_at'),
+            'token_type': 'Bearer'
+        }
+
+    async def _store_refreshed_tokens(self, exchanged: List[Dict[str, Any]]) -> set:
+        """
+        Write refreshed tokens back and release every lease in one round trip.
+
+        Returns:
+            The users whose refreshed token could not be stored
+        """
+        tokens = [
+            {
+                'user_id': result['user_id'],
+                'access_token': result.get('access_token'),
+                'expires_in': result.get('expires_in'),
+                'expires_at': result.get('expires_at')
+            }
+            for result in exchanged
+        ]
+        try:
+            await execute_async(self.supabase.rpc('apply_refreshed_google_tokens', {'p_tokens': tokens}))
+            self._metrics['bulk_writes'] += 1
+            return set()
+        except Exception as e:
+            logger.error(f"Bulk write of {len(tokens)} refreshed Google tokens failed, writing individually: {e}")
+
+        unstored = set()
+        for token in tokens:
+            if not token['access_token']:
+                continue
+            try:
+                await execute_async(
+                    self.supabase.table("google_credentials").update({
+                        'access_token': token['access_token'],
+                        'expires_in': token['expires_in'],
+                        'expires_at': token['expires_at'],
+                        'updated_at': datetime.now().isoformat()
+                    }).eq("user_id", token['user_id'])
+                )
+            except Exception as e:
+                self._metrics['write_failures'] += 1
+                logger.error(f"Failed to store refreshed token for user {token['user_id']}: {e}")
+                unstored.add(token['user_id'])
+        return unstored
+
+    async def _update_user_session(self, user_id: str, access_token: str):
+        try:
+            await execute_async(
+                self.supabase.table("user_sessions").update({
+                    'access_token': access_token,
+                    'updated_at': datetime.now().isoformat()
+                }).eq("user_id", user_id)
+            )
+        except Exception as e:
+            logger.error(f"Failed to update sessions for user {user_id}: {e}")
+
+    @staticmethod
+    def _failure(user_id: str, error: str, error_code: str, needs_reauth: bool = False) -> Dict[str, Any]:
+        return {
+            'success': False,
+            'user_id': user_id,
+            'error': error,
+            'error_code': error_code,
+            'needs_reauth': needs_reauth
+        }
+
+    @staticmethod
+    def _expiry_timestamp(value: Optional[str]) -> Optional[float]:
+        """Convert a stored timestamp to epoch seconds; naive values are local time."""
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            return None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get exchange, deduplication and write-back counters."""
+        metrics = dict(self._metrics)
+        metrics['scheduled'] = len(self._scheduled)
+        metrics['in_flight'] = len(self._in_flight)
+        return metrics
+
+
+# Global token refresh engine instance
+_token_refresh_engine: Optional[TokenRefreshEngine] = None
+
+
+def get_token_refresh_engine() -> TokenRefreshEngine:
+    """Get the global Google token refresh engine instance."""
+    global _token_refresh_engine
+    if _token_refresh_engine is None:
+        _token_refresh_engine = TokenRefreshEngine()
+    return _token_refresh_engine
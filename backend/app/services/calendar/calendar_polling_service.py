@@ -4,17 +4,18 @@ Handles Google Calendar synchronization, event processing, and smart polling.
 """
 
 import asyncio
+import functools
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from pydantic import BaseModel
 
 from ...core.database import get_supabase
 from ...core.config import get_settings
 from ...models.schemas.calendar import CalendarEvent, Meeting
+from ..auth.google_api_client_cache import get_google_api_client_cache
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +52,7 @@ class CalendarPollingService:
     def __init__(self):
         self.settings = get_settings()
         self.supabase = get_supabase()
+        self.client_cache = get_google_api_client_cache()
         
         logger.info("Calendar Polling Service initialized")
     
@@ -68,65 +70,74 @@ class CalendarPollingService:
         start_time = datetime.now()
         
         try:
-            # Get user's Google credentials
-            credentials = await self._get_user_credentials(user_id)
-            if not credentials:
+            # Get the user's cached Calendar API client
+            client = await self.client_cache.get_client(user_id, 'calendar', 'v3')
+            if not client:
                 return {
                     'success': False,
                     'error': 'No Google credentials found',
                     'user_id': user_id,
                     'calendar_id': calendar_id
                 }
+            credentials = client.credentials
             
-            # Create Calendar API service
-            service = build('calendar', 'v3', credentials=credentials)
+            # Get last sync state (time and sync token) for this user's calendar
+            sync_state = await self._get_calendar_sync_state(user_id, calendar_id)
             
-            # Get last sync time
-            last_sync = await self._get_last_sync_time(user_id, calendar_id)
-            
-            # Get changes since last sync
-            changes = await self._get_calendar_changes(service, calendar_id, last_sync)
+            # Get events changed since last sync
+            async with client.lock:
+                changes, sync_token, window_end = await self._get_calendar_changes(client.service, user_id, calendar_id, sync_state)
             
             # Process changes
             events_created = 0
             events_updated = 0
             events_deleted = 0
             meetings_detected = 0
+            events_failed = 0
             
-            for change in changes:
+            for event in changes:
                 try:
-                    if change.get('removed'):
+                    if event.get('status') == 'cancelled':
                         # Event was deleted
-                        result = await self._handle_deleted_event(
-                            change['eventId'], user_id, calendar_id
+                        result = await self.handle_deleted_event(
+                            event['id'], user_id, calendar_id
                         )
                         if result:
                             events_deleted += 1
+                        else:
+                            events_failed += 1
                     else:
                         # Event was created or updated
-                        event = change.get('event', {})
-                        if event:
-                            result = await self._process_calendar_event(
-                                event, user_id, credentials
-                            )
-                            if result:
-                                if result.get('action') == 'created':
-                                    events_created += 1
-                                elif result.get('action') == 'updated':
-                                    events_updated += 1
+                        result = await self.process_calendar_event(
+                            event, user_id, credentials
+                        )
+                        if not result and event.get('id'):
+                            events_failed += 1
+                        if result:
+                            if result.get('action') == 'created':
+                                events_created += 1
+                            elif result.get('action') == 'updated':
+                                events_updated += 1
+                            
+                            if result.get('is_meeting'):
+                                meetings_detected += 1
                                 
-                                if result.get('is_meeting'):
-                                    meetings_detected += 1
-                                    
                 except Exception as e:
+                    events_failed += 1
                     logger.error(f"Failed to process calendar change: {e}")
                     continue
             
-            # Update last sync time
-            await self._update_last_sync_time(user_id, calendar_id)
+            # Keep the previous sync token and window when any change failed so the next poll sees it again
+            if events_failed:
+                logger.warning(f"{events_failed} calendar changes failed for user {user_id}, keeping the previous sync token")
+                sync_token = None
+                window_end = None
+            
+            # Update last sync time, sync token and recurrence window
+            await self._update_calendar_sync_state(user_id, calendar_id, sync_token, window_end)
             
             # Calculate processing time
-            processing_time = (datetime.now() - start_time).microseconds // 1000
+            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
             
             # Create polling result
             result = CalendarPollingResult(
@@ -155,6 +166,7 @@ class CalendarPollingService:
                 'events_created': events_created,
                 'events_updated': events_updated,
                 'events_deleted': events_deleted,
+                'events_failed': events_failed,
                 'meetings_detected': meetings_detected,
                 'processing_time_ms': processing_time
             }
@@ -171,7 +183,7 @@ class CalendarPollingService:
                 events_updated=0,
                 events_deleted=0,
                 meetings_detected=0,
-                processing_time_ms=(datetime.now() - start_time).microseconds // 1000,
+                processing_time_ms=int((datetime.now() - start_time).total_seconds() * 1000),
                 success=False,
                 error_message=error_message,
                 timestamp=datetime.now()
@@ -198,7 +210,7 @@ class CalendarPollingService:
                 events_updated=0,
                 events_deleted=0,
                 meetings_detected=0,
-                processing_time_ms=(datetime.now() - start_time).microseconds // 1000,
+                processing_time_ms=int((datetime.now() - start_time).total_seconds() * 1000),
                 success=False,
                 error_message=error_message,
                 timestamp=datetime.now()
@@ -236,7 +248,7 @@ class CalendarPollingService:
             existing_event = await self._get_existing_event(event_id, user_id)
             
             # Extract meeting URL if present
-            meeting_url = await self._extract_meeting_url(event)
+            meeting_url = await self.extract_meeting_url(event)
             
             # Determine if this is a meeting
             is_meeting = await self._is_meeting_event(event, meeting_url)
@@ -284,8 +296,9 @@ class CalendarPollingService:
             Deletion result or None if failed
         """
         try:
-            # Mark event as deleted in database
+            # Mark event as deleted in database, along with the instances of a recurring series
             await self._mark_event_deleted(event_id, user_id)
+            await self._mark_series_instances_deleted(event_id, user_id)
             
             # Check if this was a meeting and handle accordingly
             meeting = await self._get_meeting_by_event_id(event_id)
@@ -397,132 +410,171 @@ class CalendarPollingService:
     
     # Private helper methods
     
-    async def _get_user_credentials(self, user_id: str) -> Optional[Credentials]:
-        """Get Google credentials for a user."""
-        try:
-            result = self.supabase.table("google_credentials") \
-                .select("access_token, refresh_token, token_uri, client_id, client_secret, scopes") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-            
-            if result.data:
-                cred_data = result.data
-                return Credentials(
-                    token=cred_data['access_token'],
-                    refresh_token=cred_data['refresh_token'],
-                    token_uri=cred_data['token_uri'],
-                    client_id=cred_data['client_id'],
-                    client_secret=cred_data['client_secret'],
-                    scopes=cred_data['scopes']
-                )
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Failed to get credentials for user {user_id}: {e}")
-            return None
-    
-    async def _get_last_sync_time(self, user_id: str, calendar_id: str) -> Optional[str]:
-        """Get last sync time for a user's calendar."""
+    async def _get_calendar_sync_state(self, user_id: str, calendar_id: str) -> Dict[str, Any]:
+        """Get last sync time and sync token for a user's calendar."""
         try:
             result = self.supabase.table("calendar_sync_states") \
-                .select("last_sync_at") \
+                .select("last_sync_at, sync_token, window_end") \
                 .eq("user_id", user_id) \
                 .eq("calendar_id", calendar_id) \
                 .single() \
                 .execute()
             
-            return result.data.get('last_sync_at') if result.data else None
+            return result.data or {}
             
         except Exception as e:
-            logger.error(f"Failed to get last sync time for user {user_id}: {e}")
-            return None
+            logger.error(f"Failed to get calendar sync state for user {user_id}: {e}")
+            return {}
     
-    async def _get_calendar_changes(self, service, calendar_id: str, 
-                                  last_sync: Optional[str]) -> List[Dict[str, Any]]:
-        """Get calendar changes since last sync."""
-        try:
-            if last_sync:
-                # Use sync token if available
-                sync_token = await self._get_sync_token(calendar_id)
-                if sync_token:
-                    try:
-                        changes = service.events().list(
-                            calendarId=calendar_id,
-                            syncToken=sync_token,
-                            singleEvents=True,
-                            showDeleted=True
-                        ).execute()
-                        
-                        # Store new sync token
-                        await self._update_sync_token(calendar_id, changes.get('nextSyncToken'))
-                        
-                        return changes.get('items', [])
-                        
-                    except HttpError as e:
-                        if e.resp.status == 410:
-                            # Sync token expired, fall back to time-based polling
-                            logger.info(f"Sync token expired for calendar {calendar_id}, falling back to time-based polling")
-                            return await self._get_changes_by_time(service, calendar_id, last_sync)
-                        else:
-                            logger.error(f"Google API error with sync token: {e}")
-                            return await self._get_changes_by_time(service, calendar_id, last_sync)
-                else:
-                    # No sync token, use time-based polling
-                    return await self._get_changes_by_time(service, calendar_id, last_sync)
-            else:
-                # First sync - get events from last 30 days
-                return await self._get_changes_by_time(service, calendar_id, None)
-            
-        except Exception as e:
-            logger.error(f"Failed to get calendar changes: {e}")
-            return []
+    async def _get_calendar_changes(self, service, user_id: str, calendar_id: str,
+                                    sync_state: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str], datetime]:
+        """
+        Get events changed since the last sync.
+        
+        Uses the stored sync token when there is one, so steady-state polls only
+        return changed events; falls back to a full sync from calendar_full_sync_days
+        ago when there is no token or Google rejects it with 410 Gone.
+        
+        Recurring series are listed as single series events and expanded into
+        instances only up to window_end, now plus calendar_recurrence_horizon_days,
+        so an open-ended series cannot turn into an unbounded number of meetings.
+        Once a day the window rolls forward and the instances that entered it are listed.
+        
+        Returns:
+            Tuple of (changed events, sync token to store for the next sync, new window end)
+        """
+        now = datetime.now(timezone.utc)
+        time_min = now - timedelta(days=self.settings.calendar_full_sync_days)
+        window_end = now + timedelta(days=self.settings.calendar_recurrence_horizon_days)
+        
+        events = None
+        sync_token = sync_state.get('sync_token')
+        previous_window_end = self._parse_time(sync_state.get('window_end'))
+        if sync_token and previous_window_end:
+            try:
+                events, next_sync_token = await self._list_events(service, calendar_id, sync_token=sync_token)
+            except HttpError as e:
+                if e.resp.status != 410:
+                    raise
+                logger.info(f"Sync token expired for calendar {calendar_id} of user {user_id}, running full sync")
+        
+        if events is None:
+            events, next_sync_token = await self._list_events(service, calendar_id, time_min=time_min.isoformat())
+            previous_window_end = window_end
+        elif window_end - previous_window_end < timedelta(days=1):
+            # Roll the window forward once a day rather than listing a sliver of it every poll
+            window_end = previous_window_end
+        
+        changes = await self._expand_recurring_events(service, calendar_id, events, time_min, window_end)
+        
+        if window_end > previous_window_end:
+            # Instances that rolled into the window; their series did not change, so the feed has no entry for them
+            entered, _ = await self._list_events(
+                service, calendar_id, time_min=previous_window_end.isoformat(),
+                time_max=window_end.isoformat(), single_events=True
+            )
+            changes.extend(event for event in entered if event.get('recurringEventId'))
+        
+        return changes, next_sync_token, window_end
     
-    async def _get_changes_by_time(self, service, calendar_id: str, last_sync: Optional[str]) -> List[Dict[str, Any]]:
-        """Get calendar changes using time-based polling."""
-        try:
-            if last_sync:
-                # Use last sync time
-                time_min = last_sync
-            else:
-                # First sync - get events from last 30 days
-                time_min = (datetime.now() - timedelta(days=30)).isoformat() + 'Z'
-            
-            time_max = (datetime.now() + timedelta(days=30)).isoformat() + 'Z'
-            
-            changes = service.events().list(
+    async def _expand_recurring_events(self, service, calendar_id: str, events: List[Dict[str, Any]],
+                                       time_min: datetime, window_end: datetime) -> List[Dict[str, Any]]:
+        """Replace each live recurring series with its instances inside the window."""
+        changes = []
+        for event in events:
+            if event.get('recurrence') and event.get('status') != 'cancelled':
+                changes.extend(await self._list_instances(service, calendar_id, event['id'], time_min, window_end))
+                continue
+            
+            # Modified or cancelled single instances past the window are listed once they enter it
+            start = self._event_start(event)
+            if event.get('recurringEventId') and start and start >= window_end:
+                continue
+            changes.append(event)
+        
+        return changes
+    
+    async def _list_instances(self, service, calendar_id: str, event_id: str,
+                              time_min: datetime, time_max: datetime) -> List[Dict[str, Any]]:
+        """List the instances of a recurring series between two times."""
+        instances = []
+        page_token = None
+        
+        while True:
+            response = await self._run_blocking(service.events().instances(
                 calendarId=calendar_id,
-                timeMin=time_min,
-                timeMax=time_max,
-                singleEvents=True,
+                eventId=event_id,
+                timeMin=time_min.isoformat(),
+                timeMax=time_max.isoformat(),
                 showDeleted=True,
-                orderBy='startTime'
-            ).execute()
-            
-            return changes.get('items', [])
-            
-        except Exception as e:
-            logger.error(f"Failed to get changes by time: {e}")
-            return []
+                maxResults=self.settings.calendar_sync_page_size,
+                pageToken=page_token
+            ).execute)
+            
+            instances.extend(response.get('items', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return instances
+    
+    @classmethod
+    def _event_start(cls, event: Dict[str, Any]) -> Optional[datetime]:
+        """Get an event's start time; all-day events start at midnight UTC."""
+        start = event.get('start') or {}
+        return cls._parse_time(start.get('dateTime') or start.get('date'))
     
-    async def _update_sync_token(self, calendar_id: str, sync_token: Optional[str]):
-        """Update sync token for a calendar."""
+    @staticmethod
+    def _parse_time(value: Optional[str]) -> Optional[datetime]:
+        """Parse an RFC 3339 time or date into an aware datetime."""
+        if not value:
+            return None
         try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    
+    async def _list_events(self, service, calendar_id: str, sync_token: Optional[str] = None,
+                           time_min: Optional[str] = None, time_max: Optional[str] = None,
+                           single_events: bool = False) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        List events following page tokens until Google returns the next sync token.
+        
+        Recurring series come back as one series event unless single_events is set,
+        which is only used for bounded listings.
+        
+        Returns:
+            Tuple of (events, next sync token)
+        """
+        events = []
+        page_token = None
+        
+        while True:
+            # syncToken cannot be combined with timeMin or orderBy, and the final page carries nextSyncToken
+            params = {
+                'calendarId': calendar_id,
+                'maxResults': self.settings.calendar_sync_page_size,
+                'pageToken': page_token
+            }
+            if single_events:
+                params['singleEvents'] = True
             if sync_token:
-                # Update sync token in database
-                await self.supabase.table("calendar_sync_states") \
-                    .upsert({
-                        'calendar_id': calendar_id,
-                        'sync_token': sync_token,
-                        'updated_at': datetime.now().isoformat()
-                    }) \
-                    .execute()
-                
-                logger.info(f"Updated sync token for calendar {calendar_id}")
-                
-        except Exception as e:
-            logger.error(f"Failed to update sync token for calendar {calendar_id}: {e}")
+                params['syncToken'] = sync_token
+            else:
+                params['timeMin'] = time_min
+                if time_max:
+                    params['timeMax'] = time_max
+            
+            response = await self._run_blocking(service.events().list(**params).execute)
+            
+            events.extend(response.get('items', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return events, response.get('nextSyncToken')
+    
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Run a blocking Google API call off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
     
     async def _get_existing_event(self, event_id: str, user_id: str) -> Optional[Dict[str, Any]]:
         """Get existing calendar event from database."""
@@ -666,6 +718,24 @@ class CalendarPollingService:
         except Exception as e:
             logger.error(f"Failed to mark event as deleted: {e}")
     
+    async def _mark_series_instances_deleted(self, event_id: str, user_id: str):
+        """Cancel the stored instances and meetings of a recurring series, whose IDs are prefixed with the series ID."""
+        try:
+            self.supabase.table("calendar_events") \
+                .update({'status': 'cancelled', 'updated_at': datetime.now().isoformat()}) \
+                .like("event_id", f"{event_id}_%") \
+                .eq("user_id", user_id) \
+                .execute()
+            
+            self.supabase.table("meetings") \
+                .update({'status': 'cancelled', 'updated_at': datetime.now().isoformat()}) \
+                .like("event_id", f"{event_id}_%") \
+                .eq("user_id", user_id) \
+                .execute()
+            
+        except Exception as e:
+            logger.error(f"Failed to mark instances of series {event_id} as deleted: {e}")
+    
     async def _get_meeting_by_event_id(self, event_id: str) -> Optional[Dict[str, Any]]:
         """Get meeting record by event ID."""
         try:
@@ -693,8 +763,9 @@ class CalendarPollingService:
         except Exception as e:
             logger.error(f"Failed to handle meeting deletion: {e}")
     
-    async def _update_last_sync_time(self, user_id: str, calendar_id: str):
-        """Update last sync time for a user's calendar."""
+    async def _update_calendar_sync_state(self, user_id: str, calendar_id: str, sync_token: Optional[str] = None,
+                                          window_end: Optional[datetime] = None):
+        """Update last sync time, sync token and recurrence window end for a user's calendar."""
         try:
             sync_data = {
                 'user_id': user_id,
@@ -702,11 +773,15 @@ class CalendarPollingService:
                 'last_sync_at': datetime.now().isoformat(),
                 'updated_at': datetime.now().isoformat()
             }
+            if sync_token:
+                sync_data['sync_token'] = sync_token
+            if window_end:
+                sync_data['window_end'] = window_end.isoformat()
             
-            self.supabase.table("calendar_sync_states").upsert(sync_data).execute()
+            self.supabase.table("calendar_sync_states").upsert(sync_data, on_conflict='user_id,calendar_id').execute()
             
         except Exception as e:
-            logger.error(f"Failed to update last sync time: {e}")
+            logger.error(f"Failed to update calendar sync state: {e}")
     
     async def _store_polling_result(self, result: CalendarPollingResult):
         """Store calendar polling result in database."""
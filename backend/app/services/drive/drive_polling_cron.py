@@ -71,42 +71,49 @@ class DrivePollingCronService:
                     execution_id, start_time, 0, 0, 0, 0, "completed", None
                 )
             
-            # Execute polling for each file
+            # Group watches by user so each user's changes feed is read once per run
+            watches_by_user: Dict[str, List[Dict[str, Any]]] = {}
+            for file_watch in active_file_watches:
+                watches_by_user.setdefault(file_watch.get('user_id'), []).append(file_watch)
+            
+            # Execute polling for each user; polls are counted per watched file
             successful_polls = 0
             failed_polls = 0
             total_processing_time = 0
             
-            for file_watch in active_file_watches:
+            for user_id, user_watches in watches_by_user.items():
+                if not user_id:
+                    failed_polls += len(user_watches)
+                    logger.warning(f"Skipping {len(user_watches)} file watches without a user ID")
+                    continue
+                
                 try:
-                    file_start_time = datetime.now()
+                    user_start_time = datetime.now()
                     
-                    # Execute polling for file
-                    result = await self.polling_service.poll_drive_for_file(
-                        file_id=file_watch['file_id'],
-                        document_id=file_watch['document_id']
-                    )
+                    # Execute the changes feed poll for the user
+                    result = await self.polling_service.poll_drive_changes_for_user(user_id)
                     
-                    file_processing_time = (datetime.now() - file_start_time).microseconds // 1000
-                    total_processing_time += file_processing_time
+                    total_processing_time += int((datetime.now() - user_start_time).total_seconds() * 1000)
                     
                     if result and result.get('success'):
-                        successful_polls += 1
-                        logger.info(f"File {file_watch['file_id']} polling completed successfully")
+                        successful_polls += len(user_watches)
+                        logger.info(f"Drive changes for user {user_id} polled successfully: "
+                                    f"{result.get('changes_received', 0)} changes")
                     else:
-                        failed_polls += 1
+                        failed_polls += len(user_watches)
                         error_msg = result.get('error', 'Unknown error') if result else 'No result'
-                        logger.warning(f"File {file_watch['file_id']} polling failed: {error_msg}")
+                        logger.warning(f"Drive changes polling for user {user_id} failed: {error_msg}")
                         
                 except Exception as e:
-                    failed_polls += 1
-                    logger.error(f"Error polling file {file_watch['file_id']}: {str(e)}")
+                    failed_polls += len(user_watches)
+                    logger.error(f"Error polling Drive changes for user {user_id}: {str(e)}")
                     continue
             
             # Record execution metrics
             await self._record_cron_metrics(execution_id, successful_polls, failed_polls, total_processing_time)
             
             end_time = datetime.now()
-            total_time = (end_time - start_time).microseconds // 1000
+            total_time = int((end_time - start_time).total_seconds() * 1000)
             
             logger.info(f"Drive polling cron execution {execution_id} completed: "
                        f"{successful_polls} successful, {failed_polls} failed, "
@@ -119,7 +126,7 @@ class DrivePollingCronService:
             
         except Exception as e:
             end_time = datetime.now()
-            total_time = (end_time - start_time).microseconds // 1000
+            total_time = int((end_time - start_time).total_seconds() * 1000)
             
             logger.error(f"Drive polling cron execution {execution_id} failed: {str(e)}")
             
@@ -4,8 +4,9 @@ Handles Google Drive file monitoring, change detection, and n8n integration.
 """
 
 import asyncio
+import functools
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
@@ -16,9 +17,16 @@ import httpx
 from ...core.database import get_supabase
 from ...core.config import get_settings
 from ...models.schemas.drive import DriveFile, DriveFileWatch
+from ..auth.google_api_client_cache import get_google_api_client_cache
 
 logger = logging.getLogger(__name__)
 
+# Only the change fields used to route changes to watched documents
+DRIVE_CHANGE_FIELDS = (
+    'nextPageToken,newStartPageToken,'
+    'changes(fileId,removed,time,file(id,name,mimeType,size,modifiedTime,trashed,headRevisionId))'
+)
+
 
 class DrivePollingResult(BaseModel):
     """Result of a drive polling operation."""
@@ -48,6 +56,7 @@ class DrivePollingService:
     def __init__(self):
         self.settings = get_settings()
         self.supabase = get_supabase()
+        self.client_cache = get_google_api_client_cache()
         self.n8n_classification_webhook = self.settings.n8n_classification_webhook_url
         self.n8n_drivesync_webhook = self.settings.n8n_drivesync_webhook_url
         
@@ -80,10 +89,10 @@ class DrivePollingService:
                     'document_id': document_id
                 }
             
-            # Get user credentials
+            # Get the user's cached Drive API client
             user_id = file_watch['user_id']
-            credentials = await self._get_user_credentials(user_id)
-            if not credentials:
+            client = await self.client_cache.get_client(user_id, 'drive', 'v3')
+            if not client:
                 return {
                     'success': False,
                     'error': 'No Google credentials found',
@@ -91,35 +100,40 @@ class DrivePollingService:
                     'document_id': document_id
                 }
             
-            # Create Drive API service
-            service = build('drive', 'v3', credentials=credentials)
-            
             # Check for file changes
-            changes = await self._check_file_changes(file_id, service, file_watch)
+            async with client.lock:
+                changes = await self._check_file_changes(file_id, client.service, file_watch)
             
             # Process changes
             file_updated = False
             file_deleted = False
+            changes_failed = 0
             changes_detected = len(changes)
             
             for change in changes:
                 try:
                     if change.change_type == 'deleted':
-                        await self._handle_file_deletion(document_id, file_watch['project_id'], file_id)
-                        file_deleted = True
+                        if await self.handle_file_deletion(document_id, file_watch['project_id'], file_id):
+                            file_deleted = True
+                        else:
+                            changes_failed += 1
                     elif change.change_type == 'modified':
-                        await self._handle_file_modification(document_id, file_watch['project_id'], file_id, change)
-                        file_updated = True
+                        if await self._handle_file_modification(document_id, file_watch['project_id'], file_id, change):
+                            file_updated = True
+                        else:
+                            changes_failed += 1
                         
                 except Exception as e:
+                    changes_failed += 1
                     logger.error(f"Failed to process file change: {e}")
                     continue
             
-            # Update last poll time
-            await self._update_last_poll_time(file_id, document_id)
+            # Update last poll time, unless a change failed and has to be detected again
+            if not changes_failed:
+                await self._update_last_poll_time(file_id, document_id)
             
             # Calculate processing time
-            processing_time = (datetime.now() - start_time).microseconds // 1000
+            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
             
             # Create polling result
             result = DrivePollingResult(
@@ -145,6 +159,7 @@ class DrivePollingService:
                 'changes_detected': changes_detected,
                 'file_updated': file_updated,
                 'file_deleted': file_deleted,
+                'changes_failed': changes_failed,
                 'processing_time_ms': processing_time
             }
             
@@ -158,7 +173,7 @@ class DrivePollingService:
                 changes_detected=0,
                 file_updated=False,
                 file_deleted=False,
-                processing_time_ms=(datetime.now() - start_time).microseconds // 1000,
+                processing_time_ms=int((datetime.now() - start_time).total_seconds() * 1000),
                 success=False,
                 error_message=error_message,
                 timestamp=datetime.now()
@@ -183,7 +198,7 @@ class DrivePollingService:
                 changes_detected=0,
                 file_updated=False,
                 file_deleted=False,
-                processing_time_ms=(datetime.now() - start_time).microseconds // 1000,
+                processing_time_ms=int((datetime.now() - start_time).total_seconds() * 1000),
                 success=False,
                 error_message=error_message,
                 timestamp=datetime.now()
@@ -198,6 +213,93 @@ class DrivePollingService:
                 'document_id': document_id
             }
     
+    async def poll_drive_changes_for_user(self, user_id: str) -> Dict[str, Any]:
+        """
+        Poll a user's Drive changes feed and route changes to their watched files.
+        
+        One paginated changes.list stream from the stored page token replaces a
+        metadata and revision check per watched file, so cost follows the number
+        of changes rather than the number of watches. Without a valid page token
+        each watched file is polled once and the feed starts from the current token.
+        
+        Args:
+            user_id: User ID to poll Drive changes for
+            
+        Returns:
+            Polling results and change counts
+        """
+        start_time = datetime.now()
+        
+        try:
+            watches = await self._get_user_file_watches(user_id)
+            if not watches:
+                return {
+                    'success': True,
+                    'user_id': user_id,
+                    'watched_files': 0,
+                    'changes_received': 0,
+                    'files_updated': 0,
+                    'files_deleted': 0,
+                    'processing_time_ms': 0,
+                    'message': 'No active Drive file watches'
+                }
+            
+            client = await self.client_cache.get_client(user_id, 'drive', 'v3')
+            if not client:
+                return {
+                    'success': False,
+                    'error': 'No Google credentials found',
+                    'user_id': user_id
+                }
+            
+            page_token = await self._get_drive_page_token(user_id)
+            changes = None
+            
+            async with client.lock:
+                if page_token:
+                    changes, new_page_token = await self._list_drive_changes(client.service, page_token)
+                    if changes is None:
+                        logger.info(f"Drive page token expired for user {user_id}, re-baselining watched files")
+                
+                if changes is None:
+                    # Take the start token before polling files so changes made meanwhile are picked up next time
+                    response = await self._run_blocking(
+                        client.service.changes().getStartPageToken(supportsAllDrives=True).execute
+                    )
+                    new_page_token = response.get('startPageToken')
+            
+            if changes is None:
+                result = await self._baseline_file_watches(user_id, watches)
+            else:
+                result = await self._route_drive_changes(watches, changes)
+            
+            # Failed changes are kept on their watches for retry, so the feed always moves on
+            if result['changes_failed']:
+                logger.warning(f"{result['changes_failed']} Drive changes failed for user {user_id}, retrying them next poll")
+            await self._mark_user_watches_polled(user_id)
+            await self._update_drive_page_token(user_id, new_page_token)
+            
+            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
+            
+            logger.info(f"Drive changes polling completed for user {user_id}: {result['changes_received']} changes, "
+                        f"{result['files_updated']} updated, {result['files_deleted']} deleted")
+            
+            return {
+                'success': True,
+                'user_id': user_id,
+                'watched_files': len(watches),
+                **result,
+                'processing_time_ms': processing_time
+            }
+            
+        except Exception as e:
+            logger.error(f"Drive changes polling failed for user {user_id}: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'user_id': user_id
+            }
+    
     async def check_file_changes(self, file_id: str, access_token: str) -> Dict[str, Any]:
         """
         Check for changes in a specific Drive file.
@@ -259,7 +361,7 @@ class DrivePollingService:
                 'error': str(e)
             }
     
-    async def handle_file_deletion(self, document_id: str, project_id: str, file_id: str) -> None:
+    async def handle_file_deletion(self, document_id: str, project_id: str, file_id: str) -> bool:
         """
         Handle deletion of a Drive file.
         
@@ -267,21 +369,27 @@ class DrivePollingService:
             document_id: Document ID in our system
             project_id: Project ID
             file_id: Google Drive file ID
+            
+        Returns:
+            True if the deletion was handled, False otherwise
         """
         try:
             # Mark document as deleted
             await self._mark_document_deleted(document_id)
             
-            # Remove file watch
-            await self._remove_file_watch(file_id, document_id)
-            
             # Send to n8n webhook
-            await self._send_to_n8n_webhook(document_id, project_id, file_id, 'deleted')
+            if not await self.send_to_n8n_webhook(document_id, project_id, file_id, 'deleted'):
+                return False
+            
+            # Remove the file watch last, so a failed notification is retried on the next poll
+            await self._remove_file_watch(file_id, document_id)
             
             logger.info(f"Handled deletion of Drive file {file_id} for document {document_id}")
+            return True
             
         except Exception as e:
             logger.error(f"Failed to handle file deletion for {file_id}: {e}")
+            return False
     
     async def send_to_n8n_webhook(self, document_id: str, project_id: str, 
                                  file_id: str, action: str) -> bool:
@@ -313,6 +421,11 @@ class DrivePollingService:
             else:
                 webhook_url = self.n8n_classification_webhook
             
+            if not webhook_url:
+                # Nothing to notify, which is not a failure of the change itself
+                logger.debug(f"No n8n webhook configured for {action} notifications, skipping file {file_id}")
+                return True
+            
             # Send webhook
             response = await self.http_client.post(webhook_url, json=webhook_data)
             response.raise_for_status()
@@ -389,32 +502,6 @@ class DrivePollingService:
             logger.error(f"Failed to get file watch for {file_id}: {e}")
             return None
     
-    async def _get_user_credentials(self, user_id: str) -> Optional[Credentials]:
-        """Get Google credentials for a user."""
-        try:
-            result = self.supabase.table("google_credentials") \
-                .select("access_token, refresh_token, token_uri, client_id, client_secret, scopes") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-            
-            if result.data:
-                cred_data = result.data
-                return Credentials(
-                    token=cred_data['access_token'],
-                    refresh_token=cred_data['refresh_token'],
-                    token_uri=cred_data['token_uri'],
-                    client_id=cred_data['client_id'],
-                    client_secret=cred_data['client_secret'],
-                    scopes=cred_data['scopes']
-                )
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Failed to get credentials for user {user_id}: {e}")
-            return None
-    
     async def _check_file_changes(self, file_id: str, service, 
                                 file_watch: Dict[str, Any]) -> List[FileChangeInfo]:
         """Check for changes in a Drive file."""
@@ -476,24 +563,278 @@ class DrivePollingService:
             logger.error(f"Failed to check file changes for {file_id}: {e}")
             return []
     
+    async def _get_user_file_watches(self, user_id: str) -> List[Dict[str, Any]]:
+        """Get a user's active file watches."""
+        try:
+            result = self.supabase.table("drive_file_watches") \
+                .select("file_id, document_id, project_id, last_revision_id, pending_change") \
+                .eq("user_id", user_id) \
+                .eq("is_active", True) \
+                .execute()
+            
+            return result.data if result.data else []
+            
+        except Exception as e:
+            logger.error(f"Failed to get file watches for user {user_id}: {e}")
+            return []
+    
+    async def _get_drive_page_token(self, user_id: str) -> Optional[str]:
+        """Get the stored Drive changes page token for a user."""
+        try:
+            result = self.supabase.table("drive_sync_states") \
+                .select("page_token") \
+                .eq("user_id", user_id) \
+                .single() \
+                .execute()
+            
+            return result.data.get('page_token') if result.data else None
+            
+        except Exception as e:
+            logger.error(f"Failed to get Drive page token for user {user_id}: {e}")
+            return None
+    
+    async def _update_drive_page_token(self, user_id: str, page_token: Optional[str]):
+        """Store the Drive changes page token to resume from next poll."""
+        try:
+            sync_data = {
+                'user_id': user_id,
+                'last_sync_at': datetime.now().isoformat(),
+                'updated_at': datetime.now().isoformat()
+            }
+            if page_token:
+                sync_data['page_token'] = page_token
+            
+            self.supabase.table("drive_sync_states").upsert(sync_data).execute()
+            
+        except Exception as e:
+            logger.error(f"Failed to update Drive page token for user {user_id}: {e}")
+    
+    async def _list_drive_changes(self, service, page_token: str) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+        """
+        List changes since a page token, following nextPageToken to newStartPageToken.
+        
+        Returns:
+            Tuple of (changes, page token for the next poll); changes is None if
+            the page token is no longer valid
+        """
+        changes = []
+        
+        while True:
+            try:
+                response = await self._run_blocking(service.changes().list(
+                    pageToken=page_token,
+                    pageSize=self.settings.drive_changes_page_size,
+                    spaces='drive',
+                    includeItemsFromAllDrives=True,
+                    supportsAllDrives=True,
+                    fields=DRIVE_CHANGE_FIELDS
+                ).execute)
+            except HttpError as e:
+                if self._is_invalid_page_token_error(e):
+                    return None, None
+                raise
+            
+            changes.extend(response.get('changes', []))
+            if response.get('newStartPageToken'):
+                return changes, response['newStartPageToken']
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return changes, None
+    
+    @staticmethod
+    def _is_invalid_page_token_error(error: HttpError) -> bool:
+        """Check whether changes.list rejected the page token itself rather than failing for another reason."""
+        if error.resp.status == 410:
+            return True
+        # Drive reports a bad pageToken parameter as 400 or 404 naming it as the error location
+        return error.resp.status in (400, 404) and b'pageToken' in (error.content or b'')
+    
+    async def _route_drive_changes(self, watches: List[Dict[str, Any]],
+                                   changes: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Apply the latest change of each watched file to the documents watching it.
+        
+        Watches holding a change that failed on an earlier poll retry it here,
+        unless the feed brought a newer change for the same file.
+        """
+        watched_files = {watch['file_id'] for watch in watches}
+        
+        # The feed can report a file several times; only its latest state matters
+        latest = {}
+        for change in changes:
+            if change.get('fileId') in watched_files:
+                latest[change['fileId']] = change
+        
+        files_updated = 0
+        files_deleted = 0
+        changes_failed = 0
+        for watch in watches:
+            pending = watch.get('pending_change')
+            change = latest.get(watch['file_id'])
+            if change is None and not pending:
+                continue
+            
+            if change is None:
+                outcome = await self._retry_pending_change(watch, pending)
+            else:
+                outcome = await self._apply_drive_change(watch, change)
+            await self._record_change_outcome(watch, change or pending, outcome)
+            
+            if outcome == 'deleted':
+                files_deleted += 1
+            elif outcome == 'updated':
+                files_updated += 1
+            elif outcome is None:
+                changes_failed += 1
+        
+        return {
+            'changes_received': len(changes),
+            'files_updated': files_updated,
+            'files_deleted': files_deleted,
+            'changes_failed': changes_failed
+        }
+    
+    async def _apply_drive_change(self, watch: Dict[str, Any], change: Dict[str, Any]) -> Optional[str]:
+        """Apply one feed change to a watch; returns 'deleted', 'updated' or 'unchanged', or None if it failed."""
+        file_id = watch['file_id']
+        file_metadata = change.get('file') or {}
+        try:
+            if change.get('removed') or file_metadata.get('trashed'):
+                handled = await self.handle_file_deletion(watch['document_id'], watch.get('project_id'), file_id)
+                return 'deleted' if handled else None
+            
+            revision_id = file_metadata.get('headRevisionId')
+            if revision_id and revision_id == watch.get('last_revision_id'):
+                # Metadata-only change such as sharing or renaming
+                return 'unchanged'
+            
+            handled = await self._handle_file_modification(watch['document_id'], watch.get('project_id'), file_id, FileChangeInfo(
+                file_id=file_id,
+                change_type='modified',
+                timestamp=datetime.now(),
+                file_metadata=file_metadata,
+                change_id=revision_id
+            ))
+            return 'updated' if handled else None
+            
+        except Exception as e:
+            logger.error(f"Failed to apply Drive change for file {file_id}: {e}")
+            return None
+    
+    async def _retry_pending_change(self, watch: Dict[str, Any], pending: Dict[str, Any]) -> Optional[str]:
+        """Retry a change that failed on an earlier poll."""
+        if not pending.get('recheck'):
+            return await self._apply_drive_change(watch, pending)
+        
+        # Failed during a re-baseline, where there is no feed entry to replay
+        result = await self.poll_drive_for_file(watch['file_id'], watch['document_id'])
+        return self._poll_outcome(result)
+    
+    @staticmethod
+    def _poll_outcome(result: Dict[str, Any]) -> Optional[str]:
+        """Map a single-file poll result onto a change outcome."""
+        if not result.get('success') or result.get('changes_failed'):
+            return None
+        if result.get('file_deleted'):
+            return 'deleted'
+        if result.get('file_updated'):
+            return 'updated'
+        return 'unchanged'
+    
+    async def _record_change_outcome(self, watch: Dict[str, Any], change: Dict[str, Any], outcome: Optional[str]):
+        """Keep a failed change on its watch for retry, or clear the one that was retried."""
+        pending = watch.get('pending_change')
+        if outcome is not None:
+            if pending and outcome != 'deleted':
+                await self._set_pending_change(watch, None)
+            return
+        
+        # A newer change replaces the pending one and starts its own attempt count
+        attempts = (pending.get('attempts', 0) if change is pending else 0) + 1
+        if attempts >= self.settings.drive_change_max_attempts:
+            logger.error(f"Giving up on Drive change for file {watch['file_id']} of document {watch['document_id']} "
+                         f"after {attempts} attempts")
+            if pending:
+                await self._set_pending_change(watch, None)
+            return
+        
+        await self._set_pending_change(watch, {**change, 'attempts': attempts})
+    
+    async def _set_pending_change(self, watch: Dict[str, Any], pending_change: Optional[Dict[str, Any]]):
+        """Store or clear the change a watch still has to apply."""
+        try:
+            self.supabase.table("drive_file_watches") \
+                .update({'pending_change': pending_change}) \
+                .eq("file_id", watch['file_id']) \
+                .eq("document_id", watch['document_id']) \
+                .execute()
+            
+        except Exception as e:
+            logger.error(f"Failed to update pending Drive change for file {watch['file_id']}: {e}")
+    
+    async def _baseline_file_watches(self, user_id: str, watches: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Poll each watched file once when there is no page token to resume the feed from."""
+        files_updated = 0
+        files_deleted = 0
+        changes_failed = 0
+        for watch in watches:
+            result = await self.poll_drive_for_file(watch['file_id'], watch['document_id'])
+            outcome = self._poll_outcome(result)
+            # A full poll of the file supersedes whatever change was pending on it
+            await self._record_change_outcome(watch, {'fileId': watch['file_id'], 'recheck': True}, outcome)
+            
+            if outcome == 'deleted':
+                files_deleted += 1
+            elif outcome == 'updated':
+                files_updated += 1
+            elif outcome is None:
+                changes_failed += 1
+        
+        return {
+            'changes_received': files_updated + files_deleted,
+            'files_updated': files_updated,
+            'files_deleted': files_deleted,
+            'changes_failed': changes_failed
+        }
+    
+    async def _mark_user_watches_polled(self, user_id: str):
+        """Update last poll time for all of a user's active file watches."""
+        try:
+            self.supabase.table("drive_file_watches") \
+                .update({'last_poll_at': datetime.now().isoformat()}) \
+                .eq("user_id", user_id) \
+                .eq("is_active", True) \
+                .execute()
+            
+        except Exception as e:
+            logger.error(f"Failed to update last poll time for user {user_id}: {e}")
+    
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Run a blocking Google API call off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+    
     async def _handle_file_modification(self, document_id: str, project_id: str, 
-                                      file_id: str, change: FileChangeInfo):
-        """Handle modification of a Drive file."""
+                                      file_id: str, change: FileChangeInfo) -> bool:
+        """Handle modification of a Drive file, returning whether it was handled."""
         try:
             # Update document metadata
             await self._update_document_metadata(document_id, change.file_metadata)
             
-            # Update file watch with new revision
+            # Send to n8n webhook
+            if not await self.send_to_n8n_webhook(document_id, project_id, file_id, 'modified'):
+                return False
+            
+            # Record the new revision only once handled, or a retry would skip it as already seen
             if change.change_id:
                 await self._update_file_watch_revision(file_id, document_id, change.change_id)
             
-            # Send to n8n webhook
-            await self._send_to_n8n_webhook(document_id, project_id, file_id, 'modified')
-            
             logger.info(f"Handled modification of Drive file {file_id} for document {document_id}")
+            return True
             
         except Exception as e:
             logger.error(f"Failed to handle file modification for {file_id}: {e}")
+            return False
     
     async def _mark_document_deleted(self, document_id: str):
         """Mark a document as deleted."""
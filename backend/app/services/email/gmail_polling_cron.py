@@ -5,11 +5,13 @@ Handles scheduled email monitoring and batch operations.
 
 import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 
 from ...core.database import get_supabase
+from ...core.supabase_config import execute_async
 from ...core.config import get_settings
 from .gmail_polling_service import GmailPollingService
 
@@ -71,39 +73,27 @@ class GmailPollingCronService:
                     execution_id, start_time, 0, 0, 0, 0, "completed", None
                 )
             
-            # Execute polling for each user
+            # Execute polling for all users through the bounded worker pool
             successful_polls = 0
             failed_polls = 0
             total_processing_time = 0
             
-            for user in active_users:
-                try:
-                    user_start_time = datetime.now()
-                    
-                    # Execute polling for user
-                    result = await self.polling_service.poll_gmail_for_user(user['email'])
-                    
-                    user_processing_time = (datetime.now() - user_start_time).microseconds // 1000
-                    total_processing_time += user_processing_time
-                    
-                    if result and result.get('success'):
-                        successful_polls += 1
-                        logger.info(f"User {user['email']} Gmail polling completed successfully")
-                    else:
-                        failed_polls += 1
-                        error_msg = result.get('error', 'Unknown error') if result else 'No result'
-                        logger.warning(f"User {user['email']} Gmail polling failed: {error_msg}")
-                        
-                except Exception as e:
+            for user, result, user_processing_time in await self._poll_users_concurrently(active_users):
+                total_processing_time += user_processing_time
+                
+                if result and result.get('success'):
+                    successful_polls += 1
+                    logger.info(f"User {user['email']} Gmail polling completed successfully in {user_processing_time}ms")
+                else:
                     failed_polls += 1
-                    logger.error(f"Error polling Gmail for user {user['email']}: {str(e)}")
-                    continue
+                    error_msg = result.get('error', 'Unknown error') if result else 'No result'
+                    logger.warning(f"User {user['email']} Gmail polling failed: {error_msg}")
             
             # Record execution metrics
             await self._record_cron_metrics(execution_id, successful_polls, failed_polls, total_processing_time)
             
             end_time = datetime.now()
-            total_time = (end_time - start_time).microseconds // 1000
+            total_time = int((end_time - start_time).total_seconds() * 1000)
             
             logger.info(f"Gmail polling cron execution {execution_id} completed: "
                        f"{successful_polls} successful, {failed_polls} failed, "
@@ -116,7 +106,7 @@ class GmailPollingCronService:
             
         except Exception as e:
             end_time = datetime.now()
-            total_time = (end_time - start_time).microseconds // 1000
+            total_time = int((end_time - start_time).total_seconds() * 1000)
             
             logger.error(f"Gmail polling cron execution {execution_id} failed: {str(e)}")
             
@@ -149,34 +139,21 @@ class GmailPollingCronService:
             total_virtual_emails_detected = 0
             total_documents_created = 0
             
-            for user in active_users:
-                try:
-                    # Execute polling for user
-                    result = await self.polling_service.poll_gmail_for_user(user['email'])
-                    
-                    if result:
-                        results.append({
-                            'user_email': user['email'],
-                            'success': result.get('success', False),
-                            'result': result,
-                            'timestamp': datetime.now().isoformat()
-                        })
-                        
-                        if result.get('messages_processed'):
-                            total_messages_processed += result['messages_processed']
-                        if result.get('virtual_emails_detected'):
-                            total_virtual_emails_detected += result['virtual_emails_detected']
-                        if result.get('documents_created'):
-                            total_documents_created += result['documents_created']
-                            
-                except Exception as e:
-                    logger.error(f"Error in batch Gmail polling for user {user['email']}: {str(e)}")
+            for user, result, _ in await self._poll_users_concurrently(active_users):
+                if result:
                     results.append({
                         'user_email': user['email'],
-                        'success': False,
-                        'error': str(e),
+                        'success': result.get('success', False),
+                        'result': result,
                         'timestamp': datetime.now().isoformat()
                     })
+                    
+                    if result.get('messages_processed'):
+                        total_messages_processed += result['messages_processed']
+                    if result.get('virtual_emails_detected'):
+                        total_virtual_emails_detected += result['virtual_emails_detected']
+                    if result.get('documents_created'):
+                        total_documents_created += result['documents_created']
             
             return {
                 'success': True,
@@ -271,13 +248,100 @@ class GmailPollingCronService:
                 'timestamp': datetime.now().isoformat()
             }
     
+    async def _poll_users_concurrently(self, users: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any], int]]:
+        """
+        Poll Gmail for many users through a bounded worker pool.
+        
+        At most gmail_polling_concurrency users are polled at once, and at most
+        gmail_polling_per_project_concurrency per Google Cloud project (OAuth
+        client), since Gmail quotas are enforced per project. A project that
+        reports a rate limit is paused for gmail_polling_quota_cooldown_seconds.
+        Each poll is bounded by gmail_polling_user_timeout_seconds.
+        
+        Args:
+            users: Users to poll (each with an 'email' key)
+            
+        Returns:
+            List of (user, result, processing_time_ms) in input order
+        """
+        pool = asyncio.Semaphore(max(1, self.settings.gmail_polling_concurrency))
+        project_limits: Dict[str, asyncio.Semaphore] = {}
+        project_cooldowns: Dict[str, float] = {}
+        timeout = self.settings.gmail_polling_user_timeout_seconds
+        
+        async def poll_user(user: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any], int]:
+            project = self._get_google_project_key(user)
+            if project not in project_limits:
+                project_limits[project] = asyncio.Semaphore(max(1, self.settings.gmail_polling_per_project_concurrency))
+            
+            async with project_limits[project]:
+                # Sleep out a project's cooldown before taking a global pool slot, so a
+                # throttled project does not hold slots other projects could use
+                while True:
+                    cooldown = project_cooldowns.get(project, 0) - time.monotonic()
+                    if cooldown > 0:
+                        await asyncio.sleep(cooldown)
+                    await pool.acquire()
+                    if project_cooldowns.get(project, 0) <= time.monotonic():
+                        break
+                    pool.release()
+                
+                try:
+                    user_start_time = time.perf_counter()
+                    try:
+                        result = await asyncio.wait_for(
+                            self.polling_service.poll_gmail_for_user(user['email']), timeout=timeout
+                        )
+                    except asyncio.TimeoutError:
+                        result = {
+                            'success': False,
+                            'error': f'Polling timed out after {timeout}s',
+                            'user_email': user['email']
+                        }
+                    except Exception as e:
+                        logger.error(f"Error polling Gmail for user {user['email']}: {str(e)}")
+                        result = {
+                            'success': False,
+                            'error': str(e),
+                            'user_email': user['email']
+                        }
+                    user_processing_time = int((time.perf_counter() - user_start_time) * 1000)
+                finally:
+                    pool.release()
+                
+                if self._is_quota_error(result):
+                    logger.warning(f"Gmail quota limit hit for project {project}, pausing its polls")
+                    project_cooldowns[project] = time.monotonic() + self.settings.gmail_polling_quota_cooldown_seconds
+                
+                return user, result, user_processing_time
+        
+        return await asyncio.gather(*(poll_user(user) for user in users))
+    
+    def _get_google_project_key(self, user: Dict[str, Any]) -> str:
+        """Get the Google Cloud project (OAuth client) whose quota a user's polls count against."""
+        credentials = user.get('google_credentials')
+        if isinstance(credentials, list):
+            credentials = credentials[0] if credentials else None
+        if isinstance(credentials, dict) and credentials.get('client_id'):
+            return credentials['client_id']
+        return self.settings.google_client_id or 'default'
+    
+    def _is_quota_error(self, result: Optional[Dict[str, Any]]) -> bool:
+        """Check whether a polling result failed because of a Gmail rate limit."""
+        if not result or result.get('success'):
+            return False
+        if result.get('quota_exceeded'):
+            return True
+        error = str(result.get('error', ''))
+        return '429' in error or 'rateLimitExceeded' in error or 'RateLimitExceeded' in error
+    
     async def _get_active_users_with_gmail(self) -> List[Dict[str, Any]]:
         """Get all active users with Gmail integration."""
         try:
             # Query users with active Gmail integration
-            response = await self.supabase.table('users').select(
+            response = await execute_async(self.supabase.table('users').select(
                 'id, email, google_credentials, gmail_watches'
-            ).eq('is_active', True).not_.is_('google_credentials', 'null').execute()
+            ).eq('is_active', True).not_.is_('google_credentials', 'null'))
             
             if response.data:
                 return response.data
@@ -314,7 +378,7 @@ class GmailPollingCronService:
     async def _store_cron_result(self, result: CronExecutionResult) -> None:
         """Store cron execution result in database."""
         try:
-            await self.supabase.table('gmail_cron_results').insert(result.dict()).execute()
+            await execute_async(self.supabase.table('gmail_cron_results').insert(result.dict()))
         except Exception as e:
             logger.error(f"Error storing Gmail cron result: {str(e)}")
     
@@ -340,7 +404,7 @@ class GmailPollingCronService:
                 'timestamp': datetime.now().isoformat()
             }
             
-            await self.supabase.table('gmail_cron_metrics').insert(metrics).execute()
+            await execute_async(self.supabase.table('gmail_cron_metrics').insert(metrics))
             
         except Exception as e:
             logger.error(f"Error recording Gmail cron metrics: {str(e)}")
@@ -4,11 +4,10 @@ Handles Gmail monitoring, virtual email detection, and email processing.
 """
 
 import asyncio
+import functools
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 from googleapiclient.errors import HttpError
 from pydantic import BaseModel
 import base64
@@ -18,9 +17,16 @@ import re
 from ...core.database import get_supabase
 from ...core.config import get_settings
 from ...models.schemas.email import Email, VirtualEmail
+from .virtual_email_index import get_virtual_email_index
+from ..auth.google_api_client_cache import get_google_api_client_cache
 
 logger = logging.getLogger(__name__)
 
+# Gmail accepts at most 100 calls per batch request
+GMAIL_MAX_BATCH_SIZE = 100
+GMAIL_MAX_LIST_PAGE_SIZE = 500
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
 
 class GmailPollingResult(BaseModel):
     """Result of a Gmail polling operation."""
@@ -50,6 +56,8 @@ class GmailPollingService:
     def __init__(self):
         self.settings = get_settings()
         self.supabase = get_supabase()
+        self.virtual_email_index = get_virtual_email_index()
+        self.client_cache = get_google_api_client_cache()
         
         logger.info("Gmail Polling Service initialized")
     
@@ -75,23 +83,21 @@ class GmailPollingService:
                     'user_email': user_email
                 }
             
-            # Get user's Google credentials
-            credentials = await self._get_user_credentials(user_id)
-            if not credentials:
+            # Get the user's cached Gmail API client
+            client = await self.client_cache.get_client(user_id, 'gmail', 'v1')
+            if not client:
                 return {
                     'success': False,
                     'error': 'No Google credentials found',
                     'user_email': user_email
                 }
             
-            # Create Gmail API service
-            service = build('gmail', 'v1', credentials=credentials)
-            
-            # Get last sync time
-            last_sync = await self._get_last_gmail_sync(user_id)
+            # Get last sync state (time and Gmail history ID)
+            sync_state = await self._get_gmail_sync_state(user_id)
             
             # Get messages since last sync
-            messages = await self._get_gmail_messages(service, user_email, last_sync)
+            async with client.lock:
+                messages, history_id, pending_ids = await self._get_gmail_messages(client.service, user_email, sync_state)
             
             # Process messages
             messages_processed = 0
@@ -100,20 +106,20 @@ class GmailPollingService:
             
             for message in messages:
                 try:
-                    # Check for virtual emails
-                    virtual_emails = await self._check_for_virtual_emails(
+                    # Check for virtual emails (once per message)
+                    virtual_emails = await self.check_for_virtual_emails(
                         message.get('to', []), 
                         message.get('cc', [])
                     )
                     
                     if virtual_emails:
                         virtual_emails_detected += 1
-                        await self._process_virtual_email_detection(
+                        await self.process_virtual_email_detection(
                             user_email, message['id'], virtual_emails
                         )
                     
                     # Process email content
-                    email_result = await self._process_email_message(message, user_id)
+                    email_result = await self._process_email_message(message, user_id, virtual_emails)
                     if email_result and email_result.get('document_created'):
                         documents_created += 1
                     
@@ -123,11 +129,11 @@ class GmailPollingService:
                     logger.error(f"Failed to process Gmail message: {e}")
                     continue
             
-            # Update last sync time
-            await self._update_last_gmail_sync(user_id)
+            # Update last sync time and history ID, keeping unfetched messages for the next poll
+            await self._update_last_gmail_sync(user_id, history_id, pending_ids)
             
             # Calculate processing time
-            processing_time = (datetime.now() - start_time).microseconds // 1000
+            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
             
             # Create polling result
             result = GmailPollingResult(
@@ -157,13 +163,14 @@ class GmailPollingService:
         except HttpError as e:
             error_message = f"Gmail API error: {e}"
             logger.error(error_message)
+            quota_exceeded = self._is_quota_error(e)
             
             result = GmailPollingResult(
                 user_email=user_email,
                 messages_processed=0,
                 virtual_emails_detected=0,
                 documents_created=0,
-                processing_time_ms=(datetime.now() - start_time).microseconds // 1000,
+                processing_time_ms=int((datetime.now() - start_time).total_seconds() * 1000),
                 success=False,
                 error_message=error_message,
                 timestamp=datetime.now()
@@ -174,6 +181,7 @@ class GmailPollingService:
             return {
                 'success': False,
                 'error': error_message,
+                'quota_exceeded': quota_exceeded,
                 'user_email': user_email
             }
             
@@ -186,7 +194,7 @@ class GmailPollingService:
                 messages_processed=0,
                 virtual_emails_detected=0,
                 documents_created=0,
-                processing_time_ms=(datetime.now() - start_time).microseconds // 1000,
+                processing_time_ms=int((datetime.now() - start_time).total_seconds() * 1000),
                 success=False,
                 error_message=error_message,
                 timestamp=datetime.now()
@@ -247,10 +255,13 @@ class GmailPollingService:
             all_emails = to_emails + cc_emails
             virtual_emails = []
             
+            # Membership checks run against the in-memory alias index
+            await self.virtual_email_index.ensure_covers(all_emails)
+            
             for email_addr in all_emails:
                 if email_addr:
                     # Check if this is a virtual email
-                    is_virtual = await self._is_virtual_email(email_addr)
+                    is_virtual = self.virtual_email_index.contains_loaded(email_addr)
                     if is_virtual:
                         virtual_emails.append({
                             'email': email_addr,
@@ -353,102 +364,286 @@ class GmailPollingService:
             logger.error(f"Failed to get user ID for email {user_email}: {e}")
             return None
     
-    async def _get_user_credentials(self, user_id: str) -> Optional[Credentials]:
-        """Get Google credentials for a user."""
-        try:
-            result = self.supabase.table("google_credentials") \
-                .select("access_token, refresh_token, token_uri, client_id, client_secret, scopes") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-            
-            if result.data:
-                cred_data = result.data
-                return Credentials(
-                    token=cred_data['access_token'],
-                    refresh_token=cred_data['refresh_token'],
-                    token_uri=cred_data['token_uri'],
-                    client_id=cred_data['client_id'],
-                    client_secret=cred_data['client_secret'],
-                    scopes=cred_data['scopes']
-                )
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Failed to get credentials for user {user_id}: {e}")
-            return None
-    
-    async def _get_last_gmail_sync(self, user_id: str) -> Optional[str]:
-        """Get last Gmail sync time for a user."""
+    async def _get_gmail_sync_state(self, user_id: str) -> Dict[str, Any]:
+        """Get last Gmail sync time and history ID for a user."""
         try:
             result = self.supabase.table("gmail_sync_states") \
-                .select("last_sync_at") \
+                .select("last_sync_at, history_id, pending_message_ids") \
                 .eq("user_id", user_id) \
                 .single() \
                 .execute()
             
-            return result.data.get('last_sync_at') if result.data else None
+            return result.data or {}
             
         except Exception as e:
             logger.error(f"Failed to get last Gmail sync for user {user_id}: {e}")
-            return None
+            return {}
     
     async def _get_gmail_messages(self, service, user_email: str, 
-                                 last_sync: Optional[str]) -> List[Dict[str, Any]]:
-        """Get Gmail messages since last sync."""
-        try:
-            if last_sync:
-                # Get messages since last sync
-                last_sync_time = datetime.fromisoformat(last_sync.replace('Z', '+00:00'))
-                query = f'after:{int(last_sync_time.timestamp())}'
+                                 sync_state: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str], List[Dict[str, Any]]]:
+        """
+        Get Gmail messages added since the last sync.
+        
+        Uses the history API from the stored history ID when there is one, and
+        falls back to a bounded full resync when there is none or it has expired.
+        Messages that could not be fetched on an earlier poll because of transient
+        errors are fetched again, for up to gmail_pending_message_max_attempts polls.
+        
+        Returns:
+            Tuple of (messages, history ID to store for the next sync,
+            {'id', 'attempts'} entries for messages still to fetch on the next poll)
+        """
+        pending = list(sync_state.get('pending_message_ids') or [])
+        # Entries were stored as bare IDs before attempts were counted
+        attempts: Dict[str, int] = {}
+        for entry in pending:
+            if isinstance(entry, dict):
+                attempts[entry['id']] = entry.get('attempts', 0)
             else:
-                # First sync - get messages from last 7 days
-                week_ago = datetime.now() - timedelta(days=7)
-                query = f'after:{int(week_ago.timestamp())}'
-            
-            # Get message IDs
-            response = service.users().messages().list(
-                userId='me',
-                q=query,
-                maxResults=100
-            ).execute()
-            
-            messages = response.get('messages', [])
+                attempts[entry] = 0
+        pending_ids = list(attempts)
+        try:
+            message_ids = None
+            history_id = sync_state.get('history_id')
+            
+            if history_id:
+                message_ids, new_history_id = await self._list_history_message_ids(service, history_id)
+                if message_ids is None:
+                    logger.info(f"Gmail history ID {history_id} expired for {user_email}, running full resync")
+            
+            if message_ids is None:
+                message_ids, new_history_id = await self._list_recent_message_ids(service, sync_state.get('last_sync_at'))
+            
+            # The history ID moves past these messages, so earlier failures are carried forward
+            message_ids = list(dict.fromkeys(pending_ids + message_ids))
+            
+            # Get message metadata in batched requests
+            fetched, failed_ids = await self._batch_get_messages(service, message_ids)
+            max_attempts = self.settings.gmail_pending_message_max_attempts
+            still_pending = []
+            for message_id in failed_ids:
+                message_attempts = attempts.get(message_id, 0) + 1
+                if message_attempts >= max_attempts:
+                    logger.error(f"Dropping Gmail message {message_id} for {user_email} after {message_attempts} failed polls")
+                else:
+                    still_pending.append({'id': message_id, 'attempts': message_attempts})
+            if still_pending:
+                logger.warning(f"{len(still_pending)} Gmail messages for {user_email} will be fetched again on the next poll")
             
-            # Get full message details
             full_messages = []
-            for msg in messages:
-                try:
-                    message = service.users().messages().get(
-                        userId='me',
-                        id=msg['id'],
-                        format='metadata',
-                        metadataHeaders=['To', 'Cc', 'From', 'Subject', 'Date']
-                    ).execute()
-                    
-                    # Extract email addresses
-                    headers = message.get('payload', {}).get('headers', [])
-                    to_emails = self._extract_email_addresses(headers, 'To')
-                    cc_emails = self._extract_email_addresses(headers, 'Cc')
-                    
-                    full_messages.append({
-                        'id': msg['id'],
-                        'to': to_emails,
-                        'cc': cc_emails,
-                        'headers': headers,
-                        'internalDate': message.get('internalDate')
-                    })
-                    
-                except Exception as e:
-                    logger.error(f"Failed to get message {msg['id']}: {e}")
+            for message_id in message_ids:
+                message = fetched.get(message_id)
+                if not message:
                     continue
+                
+                # Extract email addresses
+                headers = message.get('payload', {}).get('headers', [])
+                to_emails = await self._extract_email_addresses(headers, 'To')
+                cc_emails = await self._extract_email_addresses(headers, 'Cc')
+                
+                full_messages.append({
+                    'id': message_id,
+                    'to': to_emails,
+                    'cc': cc_emails,
+                    'headers': headers,
+                    'internalDate': message.get('internalDate')
+                })
             
-            return full_messages
+            return full_messages, new_history_id, still_pending
             
+        except HttpError as e:
+            if self._is_quota_error(e):
+                # Surface rate limits so the polling cron can back off this project
+                raise
+            logger.error(f"Failed to get Gmail messages: {e}")
+            return [], sync_state.get('history_id'), pending
         except Exception as e:
             logger.error(f"Failed to get Gmail messages: {e}")
-            return []
+            return [], sync_state.get('history_id'), pending
+    
+    async def _list_history_message_ids(self, service, start_history_id: str) -> Tuple[Optional[List[str]], Optional[str]]:
+        """
+        List IDs of messages added since a history ID, following page tokens.
+        
+        Returns:
+            Tuple of (message IDs, latest history ID); message IDs is None if the
+            start history ID is too old and a full resync is needed
+        """
+        message_ids = []
+        latest_history_id = start_history_id
+        page_token = None
+        
+        while True:
+            try:
+                response = await self._run_blocking(service.users().history().list(
+                    userId='me',
+                    startHistoryId=start_history_id,
+                    historyTypes=['messageAdded'],
+                    maxResults=self.settings.gmail_history_page_size,
+                    pageToken=page_token
+                ).execute)
+            except HttpError as e:
+                if e.resp.status == 404:
+                    return None, None
+                raise
+            
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message_ids.append(added['message']['id'])
+            
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        
+        return list(dict.fromkeys(message_ids)), latest_history_id
+    
+    async def _list_recent_message_ids(self, service, last_sync: Optional[str]) -> Tuple[List[str], Optional[str]]:
+        """
+        List IDs of recent messages for a full resync, bounded in age and count.
+        
+        Returns:
+            Tuple of (message IDs, current mailbox history ID)
+        """
+        # Read the history ID first so changes made while listing are picked up next sync
+        profile = await self._run_blocking(service.users().getProfile(userId='me').execute)
+        history_id = profile.get('historyId')
+        
+        oldest = datetime.now(timezone.utc) - timedelta(days=self.settings.gmail_full_resync_days)
+        if last_sync:
+            last_sync_time = datetime.fromisoformat(last_sync.replace('Z', '+00:00'))
+            if last_sync_time.tzinfo is None:
+                last_sync_time = last_sync_time.replace(tzinfo=timezone.utc)
+            oldest = max(oldest, last_sync_time)
+        query = f'after:{int(oldest.timestamp())}'
+        
+        max_messages = self.settings.gmail_full_resync_max_messages
+        message_ids = []
+        page_token = None
+        
+        while len(message_ids) < max_messages:
+            response = await self._run_blocking(service.users().messages().list(
+                userId='me',
+                q=query,
+                maxResults=min(GMAIL_MAX_LIST_PAGE_SIZE, max_messages - len(message_ids)),
+                pageToken=page_token
+            ).execute)
+            
+            message_ids.extend(msg['id'] for msg in response.get('messages', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        
+        if page_token:
+            logger.warning(f"Gmail full resync capped at {max_messages} messages")
+        
+        return message_ids, history_id
+    
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Run a blocking Google API call off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+    
+    async def _batch_get_messages(self, service, message_ids: List[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """
+        Fetch message metadata for many IDs using batched HTTP requests.
+        
+        Each batch holds at most gmail_batch_size requests. IDs that fail with a
+        retryable error (rate limit, server error, transport error) are retried
+        with exponential backoff. Messages that no longer exist, or that fail with
+        a non-retryable error, are logged and skipped.
+        
+        Args:
+            service: Gmail API service
+            message_ids: Gmail message IDs to fetch
+            
+        Returns:
+            Tuple of (dict mapping message ID to message metadata,
+            IDs that still failed with a retryable error after the last retry)
+        """
+        batch_size = max(1, min(self.settings.gmail_batch_size, GMAIL_MAX_BATCH_SIZE))
+        max_retries = self.settings.gmail_batch_max_retries
+        backoff = self.settings.gmail_batch_retry_backoff_seconds
+        
+        results: Dict[str, Dict[str, Any]] = {}
+        pending = list(dict.fromkeys(message_ids))
+        
+        for attempt in range(max_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                await asyncio.sleep(backoff * (2 ** (attempt - 1)))
+                logger.info(f"Retrying {len(pending)} Gmail messages (attempt {attempt + 1})")
+            
+            retry_ids = []
+            for i in range(0, len(pending), batch_size):
+                chunk = pending[i:i + batch_size]
+                try:
+                    fetched, failed = await self._run_blocking(self._execute_message_batch, service, chunk)
+                except Exception as e:
+                    # The whole batch request failed (e.g. transport error) - retry all of it
+                    logger.error(f"Gmail batch request failed for {len(chunk)} messages: {e}")
+                    retry_ids.extend(chunk)
+                    continue
+                
+                results.update(fetched)
+                for message_id, error in failed.items():
+                    if self._is_retryable_error(error):
+                        retry_ids.append(message_id)
+                    elif isinstance(error, HttpError) and error.resp.status == 404:
+                        logger.info(f"Gmail message {message_id} no longer exists, skipping")
+                    else:
+                        # Fetching it again will fail the same way (e.g. 400, or a 403 that is not a rate limit)
+                        logger.error(f"Failed to get message {message_id}, skipping: {error}")
+            
+            pending = retry_ids
+        
+        if pending:
+            logger.error(f"Giving up on {len(pending)} Gmail messages after {max_retries} retries")
+        
+        return results, pending
+    
+    def _execute_message_batch(self, service, message_ids: List[str]):
+        """Execute one batched messages.get request. Returns (fetched, failed) dicts keyed by message ID."""
+        fetched: Dict[str, Dict[str, Any]] = {}
+        failed: Dict[str, Exception] = {}
+        
+        def callback(request_id, response, exception):
+            if exception is not None:
+                failed[request_id] = exception
+            else:
+                fetched[request_id] = response
+        
+        batch = service.new_batch_http_request(callback=callback)
+        for message_id in message_ids:
+            batch.add(
+                service.users().messages().get(
+                    userId='me',
+                    id=message_id,
+                    format='metadata',
+                    metadataHeaders=['To', 'Cc', 'From', 'Subject', 'Date']
+                ),
+                request_id=message_id
+            )
+        batch.execute()
+        
+        return fetched, failed
+    
+    def _is_retryable_error(self, error: Exception) -> bool:
+        """Check whether a per-message batch error is worth retrying."""
+        if isinstance(error, HttpError):
+            if error.resp.status == 403:
+                return self._is_quota_error(error)
+            return error.resp.status in RETRYABLE_STATUS_CODES
+        return True
+    
+    def _is_quota_error(self, error: HttpError) -> bool:
+        """Check whether a Gmail API error is a rate or quota limit."""
+        if error.resp.status == 429:
+            return True
+        # Gmail reports per-user rate limits as 403 rateLimitExceeded
+        content = error.content or b''
+        return error.resp.status == 403 and (b'RateLimitExceeded' in content or b'rateLimitExceeded' in content)
     
     async def _extract_email_addresses(self, headers: List[Dict[str, Any]], 
                                      header_name: str) -> List[str]:
@@ -475,21 +670,14 @@ class GmailPollingService:
     async def _is_virtual_email(self, email_addr: str) -> bool:
         """Check if an email address is a virtual email."""
         try:
-            # Check if this email exists in our virtual emails table
-            result = self.supabase.table("virtual_emails") \
-                .select("id") \
-                .eq("email", email_addr) \
-                .eq("status", "active") \
-                .single() \
-                .execute()
-            
-            return result.data is not None
+            return await self.virtual_email_index.contains(email_addr)
             
         except Exception as e:
             logger.error(f"Failed to check if {email_addr} is virtual: {e}")
             return False
     
-    async def _process_email_message(self, message: Dict[str, Any], user_id: str) -> Optional[Dict[str, Any]]:
+    async def _process_email_message(self, message: Dict[str, Any], user_id: str,
+                                     virtual_emails: Optional[List[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
         """Process a Gmail message."""
         try:
             # Extract message content
@@ -497,8 +685,9 @@ class GmailPollingService:
             to_emails = message.get('to', [])
             cc_emails = message.get('cc', [])
             
-            # Check for virtual emails
-            virtual_emails = await self._check_for_virtual_emails(to_emails, cc_emails)
+            # Check for virtual emails unless the caller already did
+            if virtual_emails is None:
+                virtual_emails = await self.check_for_virtual_emails(to_emails, cc_emails)
             
             # Create email record
             email_data = {
@@ -561,14 +750,18 @@ class GmailPollingService:
             logger.error(f"Failed to create virtual email document: {e}")
             return None
     
-    async def _update_last_gmail_sync(self, user_id: str):
-        """Update last Gmail sync time for a user."""
+    async def _update_last_gmail_sync(self, user_id: str, history_id: Optional[str] = None,
+                                      pending_message_ids: Optional[List[Dict[str, Any]]] = None):
+        """Update last Gmail sync time, history ID and messages left to fetch for a user."""
         try:
             sync_data = {
                 'user_id': user_id,
                 'last_sync_at': datetime.now().isoformat(),
+                'pending_message_ids': pending_message_ids or [],
                 'updated_at': datetime.now().isoformat()
             }
+            if history_id:
+                sync_data['history_id'] = str(history_id)
             
             self.supabase.table("gmail_sync_states").upsert(sync_data).execute()
             
@@ -0,0 +1,148 @@
+"""
+Virtual email alias index for BeSunny.ai Python backend.
+Keeps the set of active virtual email addresses in memory for O(1) inbound routing checks.
+"""
+
+import logging
+import re
+import time
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+from ...core.config import get_settings
+from ...core.database import get_supabase
+from ...core.supabase_config import execute_async
+
+logger = logging.getLogger(__name__)
+
+# Virtual email aliases follow the ai+username@besunny.ai pattern
+ALIAS_PATTERN = re.compile(r'^ai\+[^@]+@besunny\.ai$')
+
+
+class VirtualEmailIndex:
+    """In-memory set of active virtual email addresses, reloaded on a TTL."""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.supabase = get_supabase()
+        self.ttl_seconds = self.settings.virtual_email_index_ttl_seconds
+        self.page_size = 1000
+        # Minimum gap between reloads triggered by alias-shaped misses
+        self.miss_reload_seconds = min(self.ttl_seconds, 30)
+
+        self._aliases: Set[str] = set()
+        self._loaded_at: Optional[float] = None
+        self._reload_attempted_at: float = 0.0
+
+        self._metrics = {
+            'lookups': 0,
+            'matches': 0,
+            'reloads': 0,
+            'reload_errors': 0,
+            'miss_reloads': 0,
+            'invalidations': 0
+        }
+
+    @staticmethod
+    def normalize(email_addr: str) -> str:
+        return (email_addr or '').strip().lower()
+
+    async def ensure_fresh(self):
+        """Reload the alias set if it has never been loaded or its TTL has passed."""
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return
+        await self._reload()
+
+    async def ensure_covers(self, email_addrs: Iterable[str]):
+        """Refresh the set, reloading early if an alias-shaped address is missing from it.
+
+        Aliases created by another process are not in this process's set until the next
+        reload, so a miss that looks like an alias triggers one (at most every
+        miss_reload_seconds) instead of rejecting the message.
+        """
+        await self.ensure_fresh()
+        missing = [
+            email_addr for email_addr in email_addrs
+            if self.looks_like_alias(email_addr) and self.normalize(email_addr) not in self._aliases
+        ]
+        if not missing or time.monotonic() - self._reload_attempted_at < self.miss_reload_seconds:
+            return
+        self._metrics['miss_reloads'] += 1
+        await self._reload()
+
+    async def contains(self, email_addr: str) -> bool:
+        """Check whether an address is an active virtual email."""
+        await self.ensure_covers([email_addr])
+        return self.contains_loaded(email_addr)
+
+    async def filter_virtual(self, email_addrs: Iterable[str]) -> List[str]:
+        """Return the addresses that are active virtual emails, in input order."""
+        email_addrs = list(email_addrs)
+        await self.ensure_covers(email_addrs)
+        return [email_addr for email_addr in email_addrs if self.contains_loaded(email_addr)]
+
+    @classmethod
+    def looks_like_alias(cls, email_addr: str) -> bool:
+        """Check whether an address has the shape of a virtual email alias."""
+        return bool(ALIAS_PATTERN.match(cls.normalize(email_addr)))
+
+    def contains_loaded(self, email_addr: str) -> bool:
+        """Check membership against the currently loaded set without refreshing it."""
+        self._metrics['lookups'] += 1
+        found = self.normalize(email_addr) in self._aliases
+        if found:
+            self._metrics['matches'] += 1
+        return found
+
+    def invalidate(self):
+        """Force a reload on the next lookup."""
+        self._loaded_at = None
+        self._metrics['invalidations'] += 1
+
+    async def _reload(self):
+        """Load all active virtual email addresses from Supabase."""
+        self._reload_attempted_at = time.monotonic()
+        try:
+            aliases = set()
+            offset = 0
+            while True:
+                result = await execute_async(
+                    self.supabase.table("virtual_emails")
+                    .select("email")
+                    .eq("status", "active")
+                    .range(offset, offset + self.page_size - 1)
+                )
+                rows = result.data or []
+                aliases.update(self.normalize(row.get('email')) for row in rows if row.get('email'))
+                if len(rows) < self.page_size:
+                    break
+                offset += self.page_size
+
+            self._aliases = aliases
+            self._loaded_at = time.monotonic()
+            self._metrics['reloads'] += 1
+            logger.info(f"Virtual email index loaded with {len(aliases)} active aliases")
+
+        except Exception as e:
+            self._metrics['reload_errors'] += 1
+            logger.error(f"Failed to load virtual email index: {e}")
+            # Keep serving the previous set; retry after a short delay rather than on every lookup
+            self._loaded_at = time.monotonic() - self.ttl_seconds + min(self.ttl_seconds, 30)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get lookup and reload counters."""
+        metrics = dict(self._metrics)
+        metrics['aliases'] = len(self._aliases)
+        metrics['age_seconds'] = time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+        return metrics
+
+
+# Global virtual email index instance
+_virtual_email_index: Optional[VirtualEmailIndex] = None
+
+
+def get_virtual_email_index() -> VirtualEmailIndex:
+    """Get the global virtual email index instance."""
+    global _virtual_email_index
+    if _virtual_email_index is None:
+        _virtual_email_index = VirtualEmailIndex()
+    return _virtual_email_index
@@ -4,13 +4,16 @@ Handles multi-service synchronization, activity tracking, and adaptive sync inte
 """
 
 import asyncio
+import heapq
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from typing import Awaitable, Callable, List, Dict, Any, Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 
 from ...core.database import get_supabase
 from ...core.config import get_settings
+from ...core.supabase_config import execute_async
 from ..attendee.attendee_service import AttendeeService
 from ..calendar.calendar_polling_service import CalendarPollingService
 from ..drive.drive_polling_service import DrivePollingService
@@ -18,6 +21,12 @@ from ..email.gmail_polling_service import GmailPollingService
 
 logger = logging.getLogger(__name__)
 
+# Lower rank is synced first among users that are due at the same time
+SYNC_PRIORITY_RANK = {'high': 0, 'normal': 1, 'low': 2}
+
+# Users active within this window are synced once they go quiet, as _should_sync_user does
+RECENT_ACTIVITY_MINUTES = 15
+
 
 class SyncResult(BaseModel):
     """Result of a sync operation."""
@@ -72,15 +81,40 @@ class EnhancedAdaptiveSyncService:
         self.drive_service = DrivePollingService()
         self.gmail_service = GmailPollingService()
         
+        # Fleet sync concurrency: users in flight, and calls in flight per provider across all users
+        self.max_concurrent_users = max(1, self.settings.sync_max_concurrent_users)
+        self.provider_concurrency = {
+            'calendar': self.settings.sync_calendar_concurrency,
+            'drive': self.settings.sync_drive_concurrency,
+            'gmail': self.settings.sync_gmail_concurrency,
+            'attendee': self.settings.sync_attendee_concurrency
+        }
+        self._provider_semaphores: Dict[str, asyncio.Semaphore] = {}
+        
         logger.info("Enhanced Adaptive Sync Service initialized")
     
-    async def sync_all_services(self, user_id: str, force_sync: bool = False) -> List[Dict[str, Any]]:
+    def _provider_semaphore(self, provider: str) -> asyncio.Semaphore:
+        # Created on first use so they bind to the running event loop
+        semaphore = self._provider_semaphores.get(provider)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max(1, self.provider_concurrency[provider]))
+            self._provider_semaphores[provider] = semaphore
+        return semaphore
+    
+    async def _with_provider_limit(self, provider: str, sync: Awaitable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Run one provider sync under that provider's concurrency cap."""
+        async with self._provider_semaphore(provider):
+            return await sync
+    
+    async def sync_all_services(self, user_id: str, force_sync: bool = False,
+                                user_email: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Synchronize all services for a user.
         
         Args:
             user_id: User ID to sync
             force_sync: Force sync regardless of timing
+            user_email: User's email if the caller already has it
             
         Returns:
             List of sync results for each service
@@ -100,7 +134,8 @@ class EnhancedAdaptiveSyncService:
                     }]
             
             # Get user's email for Gmail sync
-            user_email = await self._get_user_email(user_id)
+            if not user_email:
+                user_email = await self._get_user_email(user_id)
             if not user_email:
                 return [{
                     'success': False,
@@ -108,34 +143,20 @@ class EnhancedAdaptiveSyncService:
                     'user_id': user_id
                 }]
             
-            # Execute sync for each service
-            sync_results = []
-            
-            # Calendar sync
-            calendar_result = await self.sync_calendar(user_id, force_sync)
-            sync_results.append(calendar_result)
-            
-            # Drive sync
-            drive_result = await self.sync_drive(user_id, force_sync)
-            sync_results.append(drive_result)
-            
-            # Gmail sync
-            gmail_result = await self.sync_gmail(user_id, user_email, force_sync)
-            sync_results.append(gmail_result)
-            
-            # Attendee sync
-            attendee_result = await self.sync_attendee(user_id, force_sync)
-            sync_results.append(attendee_result)
+            # Execute sync for each service concurrently, each under its provider's cap
+            sync_results = list(await asyncio.gather(
+                self._with_provider_limit('calendar', self.sync_calendar(user_id, force_sync)),
+                self._with_provider_limit('drive', self.sync_drive(user_id, force_sync)),
+                self._with_provider_limit('gmail', self.sync_gmail(user_id, user_email, force_sync)),
+                self._with_provider_limit('attendee', self.sync_attendee(user_id, force_sync))
+            ))
             
             # Record user activity
             await self._record_user_activity(user_id, 'multi_service_sync')
             
-            # Update user activity state
+            # Update user activity state (includes the next sync interval)
             await self._update_user_activity_state(user_id, sync_results)
             
-            # Calculate next sync interval
-            next_sync_interval = await self._calculate_next_sync_interval(user_id, sync_results)
-            
             logger.info(f"Multi-service sync completed for user {user_id}: {len(sync_results)} services synced")
             
             return sync_results
@@ -165,7 +186,7 @@ class EnhancedAdaptiveSyncService:
             # Execute smart calendar polling
             result = await self.calendar_service.smart_calendar_polling(user_id)
             
-            processing_time = (datetime.now() - start_time).microseconds // 1000
+            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
             
             if result.get('skipped'):
                 return {
@@ -228,10 +249,18 @@ class EnhancedAdaptiveSyncService:
         try:
             start_time = datetime.now()
             
-            # Get user's active Drive files
-            active_files = await self._get_user_active_drive_files(user_id)
+            # Pull the user's Drive changes feed once for all watched files
+            result = await self.drive_service.poll_drive_changes_for_user(user_id)
+            
+            if not result.get('success'):
+                return {
+                    'service': 'drive',
+                    'user_id': user_id,
+                    'success': False,
+                    'error': result.get('error', 'Drive changes polling failed')
+                }
             
-            if not active_files:
+            if not result.get('watched_files'):
                 return {
                     'service': 'drive',
                     'user_id': user_id,
@@ -244,33 +273,12 @@ class EnhancedAdaptiveSyncService:
                     'message': 'No active Drive files to sync'
                 }
             
-            # Sync each file
-            total_processed = 0
+            total_processed = result.get('changes_received', 0)
             total_created = 0
-            total_updated = 0
-            total_deleted = 0
+            total_updated = result.get('files_updated', 0)
+            total_deleted = result.get('files_deleted', 0)
             
-            for file_info in active_files:
-                try:
-                    result = await self.drive_service.smart_drive_polling(
-                        file_info['file_id'], 
-                        file_info['document_id']
-                    )
-                    
-                    if result.get('success'):
-                        total_processed += 1
-                        if result.get('file_updated'):
-                            total_updated += 1
-                        if result.get('file_deleted'):
-                            total_deleted += 1
-                    elif result.get('skipped'):
-                        continue
-                        
-                except Exception as e:
-                    logger.error(f"Failed to sync Drive file {file_info['file_id']}: {e}")
-                    continue
-            
-            processing_time = (datetime.now() - start_time).microseconds // 1000
+            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
             
             # Create sync result
             sync_result = SyncResult(
@@ -326,7 +334,7 @@ class EnhancedAdaptiveSyncService:
             # Execute smart Gmail polling
             result = await self.gmail_service.smart_gmail_polling(user_email)
             
-            processing_time = (datetime.now() - start_time).microseconds // 1000
+            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
             
             if result.get('skipped'):
                 return {
@@ -392,7 +400,7 @@ class EnhancedAdaptiveSyncService:
             # Execute smart attendee polling
             result = await self.attendee_service.poll_all_meetings(user_id)
             
-            processing_time = (datetime.now() - start_time).microseconds // 1000
+            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
             
             # Create sync result
             sync_result = SyncResult(
@@ -445,7 +453,7 @@ class EnhancedAdaptiveSyncService:
                 "timestamp": datetime.now().isoformat()
             }
             
-            self.supabase.table("user_activity_logs").insert(activity_data).execute()
+            await execute_async(self.supabase.table("user_activity_logs").insert(activity_data))
             
             logger.info(f"Recorded user activity: {activity_type} for user {user_id}")
             
@@ -493,7 +501,7 @@ class EnhancedAdaptiveSyncService:
                 sync_priority = 'low'
             
             # Calculate next sync interval
-            next_sync_interval = await self._calculate_next_sync_interval(user_id, results)
+            next_sync_interval = await self.calculate_next_sync_interval(user_id, results)
             
             # Update user activity state
             state_data = {
@@ -507,7 +515,7 @@ class EnhancedAdaptiveSyncService:
                 'updated_at': datetime.now().isoformat()
             }
             
-            self.supabase.table("user_sync_states").upsert(state_data).execute()
+            await execute_async(self.supabase.table("user_sync_states").upsert(state_data))
             
             logger.info(f"Updated user activity state for user {user_id}: {change_frequency} frequency, {sync_priority} priority")
             
@@ -590,7 +598,7 @@ class EnhancedAdaptiveSyncService:
             last_activity = await self._get_user_last_activity(user_id)
             if last_activity:
                 time_since_activity = datetime.now() - last_activity
-                if time_since_activity < timedelta(minutes=15):
+                if time_since_activity < timedelta(minutes=RECENT_ACTIVITY_MINUTES):
                     return False
             
             return True
@@ -602,11 +610,10 @@ class EnhancedAdaptiveSyncService:
     async def _get_user_email(self, user_id: str) -> Optional[str]:
         """Get user's email address."""
         try:
-            result = self.supabase.table("users") \
+            result = await execute_async(self.supabase.table("users") \
                 .select("email") \
                 .eq("id", user_id) \
-                .single() \
-                .execute()
+                .single())
             
             return result.data.get('email') if result.data else None
             
@@ -614,21 +621,6 @@ class EnhancedAdaptiveSyncService:
             logger.error(f"Failed to get user email for {user_id}: {e}")
             return None
     
-    async def _get_user_active_drive_files(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get user's active Drive files."""
-        try:
-            result = self.supabase.table("drive_file_watches") \
-                .select("file_id, document_id") \
-                .eq("user_id", user_id) \
-                .eq("status", "active") \
-                .execute()
-            
-            return result.data if result.data else []
-            
-        except Exception as e:
-            logger.error(f"Failed to get active Drive files for user {user_id}: {e}")
-            return []
-    
     async def _record_user_activity(self, user_id: str, activity_type: str):
         """Record user activity."""
         await self.record_user_activity(user_id, activity_type)
@@ -643,7 +635,7 @@ class EnhancedAdaptiveSyncService:
             result_data = result.dict()
             result_data['timestamp'] = result_data['timestamp'].isoformat()
             
-            self.supabase.table("sync_results").insert(result_data).execute()
+            await execute_async(self.supabase.table("sync_results").insert(result_data))
             
         except Exception as e:
             logger.error(f"Failed to store sync result: {e}")
@@ -651,11 +643,10 @@ class EnhancedAdaptiveSyncService:
     async def _get_user_activity_state(self, user_id: str) -> Dict[str, Any]:
         """Get user's current activity state."""
         try:
-            result = self.supabase.table("user_sync_states") \
+            result = await execute_async(self.supabase.table("user_sync_states") \
                 .select("*") \
                 .eq("user_id", user_id) \
-                .single() \
-                .execute()
+                .single())
             
             return result.data if result.data else {}
             
@@ -666,11 +657,10 @@ class EnhancedAdaptiveSyncService:
     async def _get_user_last_sync(self, user_id: str) -> Optional[datetime]:
         """Get user's last sync time."""
         try:
-            result = self.supabase.table("user_sync_states") \
+            result = await execute_async(self.supabase.table("user_sync_states") \
                 .select("last_sync_at") \
                 .eq("user_id", user_id) \
-                .single() \
-                .execute()
+                .single())
             
             if result.data and result.data.get('last_sync_at'):
                 return datetime.fromisoformat(result.data['last_sync_at'].replace('Z', '+00:00'))
@@ -683,11 +673,10 @@ class EnhancedAdaptiveSyncService:
     async def _get_next_sync_interval(self, user_id: str) -> int:
         """Get user's next sync interval."""
         try:
-            result = self.supabase.table("user_sync_states") \
+            result = await execute_async(self.supabase.table("user_sync_states") \
                 .select("next_sync_interval") \
                 .eq("user_id", user_id) \
-                .single() \
-                .execute()
+                .single())
             
             return result.data.get('next_sync_interval', 30) if result.data else 30
             
@@ -698,13 +687,12 @@ class EnhancedAdaptiveSyncService:
     async def _get_user_last_activity(self, user_id: str) -> Optional[datetime]:
         """Get user's last activity timestamp."""
         try:
-            result = self.supabase.table("user_activity_logs") \
+            result = await execute_async(self.supabase.table("user_activity_logs") \
                 .select("timestamp") \
                 .eq("user_id", user_id) \
                 .order("timestamp", desc=True) \
                 .limit(1) \
-                .single() \
-                .execute()
+                .single())
             
             if result.data and result.data.get('timestamp'):
                 return datetime.fromisoformat(result.data['timestamp'].replace('Z', '+00:00'))
@@ -715,7 +703,12 @@ class EnhancedAdaptiveSyncService:
             return None
     
     async def sync_all_users(self) -> List[Dict[str, Any]]:
-        """Sync all services for all users."""
+        """
+        Sync all services for all users.
+        
+        Users are taken from a priority queue ordered by when their adaptive
+        interval falls due, and at most sync_max_concurrent_users are synced at once.
+        """
         try:
             logger.info("Starting sync for all users")
             
@@ -728,11 +721,27 @@ class EnhancedAdaptiveSyncService:
                     'total_users': 0
                 }]
             
-            # Sync each user
+            # Users whose interval has not elapsed are skipped without querying their state again
+            now = time.time()
             all_results = []
-            for user in users:
-                user_result = await self.sync_all_services(user['id'], force_sync=False)
-                all_results.extend(user_result)
+            queue = []
+            for entry in await self._build_sync_queue(users):
+                due_at, _, _, user, state = entry
+                if due_at > now:
+                    all_results.append({
+                        'skipped': True,
+                        'reason': 'User activity optimization',
+                        'user_id': user['id'],
+                        'next_sync_in_minutes': state.get('next_sync_interval', 30)
+                    })
+                else:
+                    heapq.heappush(queue, entry)
+            
+            async def sync_user(user: Dict[str, Any]):
+                # The queue already decided this user is due and the user row carries the email
+                all_results.extend(await self.sync_all_services(user['id'], force_sync=True, user_email=user.get('email')))
+            
+            await self._run_user_pool(queue, sync_user)
             
             return all_results
             
@@ -748,23 +757,10 @@ class EnhancedAdaptiveSyncService:
         """Sync calendar for all users."""
         try:
             logger.info("Starting calendar sync for all users")
-            
-            # Get all active users
-            users = await self._get_all_active_users()
-            if not users:
-                return [{
-                    'success': True,
-                    'message': 'No active users found',
-                    'total_users': 0
-                }]
-            
-            # Sync calendar for each user
-            all_results = []
-            for user in users:
-                user_result = await self.sync_calendar(user['id'], force_sync=False)
-                all_results.append(user_result)
-            
-            return all_results
+            return await self._sync_service_for_all_users(
+                'calendar',
+                lambda user: self.sync_calendar(user['id'], force_sync=False)
+            )
             
         except Exception as e:
             logger.error(f"Sync all calendars failed: {e}")
@@ -778,23 +774,10 @@ class EnhancedAdaptiveSyncService:
         """Sync drive for all users."""
         try:
             logger.info("Starting drive sync for all users")
-            
-            # Get all active users
-            users = await self._get_all_active_users()
-            if not users:
-                return [{
-                    'success': True,
-                    'message': 'No active users found',
-                    'total_users': 0
-                }]
-            
-            # Sync drive for each user
-            all_results = []
-            for user in users:
-                user_result = await self.sync_drive(user['id'], force_sync=False)
-                all_results.append(user_result)
-            
-            return all_results
+            return await self._sync_service_for_all_users(
+                'drive',
+                lambda user: self.sync_drive(user['id'], force_sync=False)
+            )
             
         except Exception as e:
             logger.error(f"Sync all drives failed: {e}")
@@ -808,25 +791,11 @@ class EnhancedAdaptiveSyncService:
         """Sync Gmail for all users."""
         try:
             logger.info("Starting Gmail sync for all users")
-            
-            # Get all active users
-            users = await self._get_all_active_users()
-            if not users:
-                return [{
-                    'success': True,
-                    'message': 'No active users found',
-                    'total_users': 0
-                }]
-            
-            # Sync Gmail for each user
-            all_results = []
-            for user in users:
-                user_email = await self._get_user_email(user['id'])
-                if user_email:
-                    user_result = await self.sync_gmail(user['id'], user_email, force_sync=False)
-                    all_results.append(user_result)
-            
-            return all_results
+            return await self._sync_service_for_all_users(
+                'gmail',
+                lambda user: self.sync_gmail(user['id'], user['email'], force_sync=False),
+                user_filter=lambda user: bool(user.get('email'))
+            )
             
         except Exception as e:
             logger.error(f"Sync all Gmail accounts failed: {e}")
@@ -840,23 +809,10 @@ class EnhancedAdaptiveSyncService:
         """Sync attendee for all users."""
         try:
             logger.info("Starting attendee sync for all users")
-            
-            # Get all active users
-            users = await self._get_all_active_users()
-            if not users:
-                return [{
-                    'success': True,
-                    'message': 'No active users found',
-                    'total_users': 0
-                }]
-            
-            # Sync attendee for each user
-            all_results = []
-            for user in users:
-                user_result = await self.sync_attendee(user['id'], force_sync=False)
-                all_results.append(user_result)
-            
-            return all_results
+            return await self._sync_service_for_all_users(
+                'attendee',
+                lambda user: self.sync_attendee(user['id'], force_sync=False)
+            )
             
         except Exception as e:
             logger.error(f"Sync all attendees failed: {e}")
@@ -866,6 +822,108 @@ class EnhancedAdaptiveSyncService:
                 'total_users': 0
             }]
     
+    async def _sync_service_for_all_users(
+        self,
+        provider: str,
+        sync: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        user_filter: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> List[Dict[str, Any]]:
+        """Run one provider's sync for every active user, most overdue first, under the user pool and provider cap."""
+        users = await self._get_all_active_users()
+        if not users:
+            return [{
+                'success': True,
+                'message': 'No active users found',
+                'total_users': 0
+            }]
+        
+        if user_filter:
+            users = [user for user in users if user_filter(user)]
+        
+        all_results = []
+        
+        async def sync_user(user: Dict[str, Any]):
+            all_results.append(await self._with_provider_limit(provider, sync(user)))
+        
+        await self._run_user_pool(await self._build_sync_queue(users), sync_user)
+        return all_results
+    
+    async def _build_sync_queue(self, users: List[Dict[str, Any]]) -> List[tuple]:
+        """
+        Build a heap of users keyed by when their next sync is due.
+        
+        Entries are (due_at, priority_rank, index, user, sync_state). A user is due
+        at last_sync_at plus the next_sync_interval stored by
+        calculate_next_sync_interval; users that have never synced are due immediately.
+        As in _should_sync_user, a user who has synced before and was active in the
+        last RECENT_ACTIVITY_MINUTES is not due until that long after their last activity.
+        """
+        sync_states = await self._get_user_sync_states()
+        last_activity = await self._get_recent_user_activity()
+        
+        queue = []
+        for index, user in enumerate(users):
+            state = sync_states.get(user['id'], {})
+            due_at = 0.0
+            if state.get('last_sync_at'):
+                try:
+                    last_sync = datetime.fromisoformat(state['last_sync_at'].replace('Z', '+00:00'))
+                    due_at = last_sync.timestamp() + (state.get('next_sync_interval') or 30) * 60
+                except ValueError:
+                    pass
+                if user['id'] in last_activity:
+                    due_at = max(due_at, last_activity[user['id']] + RECENT_ACTIVITY_MINUTES * 60)
+            rank = SYNC_PRIORITY_RANK.get(state.get('sync_priority'), SYNC_PRIORITY_RANK['normal'])
+            queue.append((due_at, rank, index, user, state))
+        
+        heapq.heapify(queue)
+        return queue
+    
+    async def _run_user_pool(self, queue: List[tuple], sync_user: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """Drain a sync queue with at most max_concurrent_users workers, each taking the most overdue user next."""
+        async def worker():
+            while queue:
+                user = heapq.heappop(queue)[3]
+                try:
+                    await sync_user(user)
+                except Exception as e:
+                    logger.error(f"Sync worker failed for user {user['id']}: {e}")
+        
+        await asyncio.gather(*(worker() for _ in range(min(self.max_concurrent_users, len(queue)))))
+    
+    async def _get_recent_user_activity(self) -> Dict[str, float]:
+        """Get the last activity time of every user active in the last RECENT_ACTIVITY_MINUTES, keyed by user ID."""
+        try:
+            cutoff = datetime.now().astimezone() - timedelta(minutes=RECENT_ACTIVITY_MINUTES)
+            result = await execute_async(self.supabase.table("user_activity_logs") \
+                .select("user_id, timestamp") \
+                .gte("timestamp", cutoff.isoformat()))
+            
+            last_activity: Dict[str, float] = {}
+            for row in result.data or []:
+                try:
+                    activity_at = datetime.fromisoformat(row['timestamp'].replace('Z', '+00:00')).timestamp()
+                except (KeyError, AttributeError, ValueError):
+                    continue
+                last_activity[row['user_id']] = max(activity_at, last_activity.get(row['user_id'], 0.0))
+            return last_activity
+            
+        except Exception as e:
+            logger.error(f"Failed to get recent user activity: {e}")
+            return {}
+    
+    async def _get_user_sync_states(self) -> Dict[str, Dict[str, Any]]:
+        """Get every user's sync schedule in one query, keyed by user ID."""
+        try:
+            result = await execute_async(self.supabase.table("user_sync_states") \
+                .select("user_id, last_sync_at, next_sync_interval, sync_priority"))
+            
+            return {row['user_id']: row for row in result.data or []}
+            
+        except Exception as e:
+            logger.error(f"Failed to get user sync states: {e}")
+            return {}
+    
     async def optimize_all_sync_intervals(self) -> Dict[str, Any]:
         """Optimize sync intervals for all users."""
         try:
@@ -907,9 +965,8 @@ class EnhancedAdaptiveSyncService:
     async def _get_all_active_users(self) -> List[Dict[str, Any]]:
         """Get all active users."""
         try:
-            result = self.supabase.table("users") \
-                .select("id") \
-                .execute()
+            result = await execute_async(self.supabase.table("users") \
+                .select("id, email"))
             
             return result.data if result.data else []
             
@@ -940,13 +997,12 @@ class EnhancedAdaptiveSyncService:
     async def _update_user_sync_interval(self, user_id: str, interval_minutes: int):
         """Update user's sync interval."""
         try:
-            self.supabase.table("user_sync_states") \
+            await execute_async(self.supabase.table("user_sync_states") \
                 .upsert({
                     'user_id': user_id,
                     'next_sync_interval': interval_minutes,
                     'updated_at': datetime.now().isoformat()
-                }) \
-                .execute()
+                }))
             
         except Exception as e:
             logger.error(f"Failed to update sync interval for user {user_id}: {e}")
@@ -0,0 +1,21 @@
+-- Store the Gmail history ID per user so polling can pull only deltas via the history API
+CREATE TABLE IF NOT EXISTS gmail_sync_states (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    last_sync_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE gmail_sync_states ADD COLUMN IF NOT EXISTS history_id TEXT;
+
+-- Messages the last poll listed but could not fetch after transient errors, as
+-- {"id", "attempts"} objects; retried on later polls since the stored history ID
+-- has already moved past them, up to gmail_pending_message_max_attempts polls
+ALTER TABLE gmail_sync_states ADD COLUMN IF NOT EXISTS pending_message_ids JSONB NOT NULL DEFAULT '[]'::jsonb;
+
+-- Add RLS policies
+ALTER TABLE gmail_sync_states ENABLE ROW LEVEL SECURITY;
+
+-- Allow service role to manage sync states
+DROP POLICY IF EXISTS "Service role can manage gmail sync states" ON gmail_sync_states;
+CREATE POLICY "Service role can manage gmail sync states" ON gmail_sync_states
+    FOR ALL USING (auth.role() = 'service_role');
@@ -0,0 +1,7 @@
+-- MinHash signatures and LSH band hashes for near-duplicate chunk detection
+-- across a project's stored chunks.
+ALTER TABLE vector_chunk_manifest ADD COLUMN IF NOT EXISTS minhash TEXT;
+ALTER TABLE vector_chunk_manifest ADD COLUMN IF NOT EXISTS band_hashes TEXT[];
+
+-- Candidate lookup uses array overlap on band hashes within a project
+CREATE INDEX IF NOT EXISTS idx_vector_chunk_manifest_band_hashes ON vector_chunk_manifest USING GIN (band_hashes);
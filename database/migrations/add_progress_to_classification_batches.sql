@@ -0,0 +1,12 @@
+-- Progress tracking for batch classification.
+-- Batches write processed/success/error counts as items complete, so long backfills
+-- can be monitored while they run.
+ALTER TABLE classification_batches
+    ADD COLUMN IF NOT EXISTS total_count INTEGER,
+    ADD COLUMN IF NOT EXISTS processed_count INTEGER DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS success_count INTEGER DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS error_count INTEGER DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+
+-- Create index for finding running batches
+CREATE INDEX IF NOT EXISTS idx_classification_batches_status ON classification_batches(status);
@@ -0,0 +1,42 @@
+-- Support for the Google token refresh engine: expiry-ordered scans of due
+-- tokens, a short cross-process refresh lease, and bulk token write-back.
+ALTER TABLE google_credentials ADD COLUMN IF NOT EXISTS refresh_lease_until TIMESTAMPTZ;
+
+-- Create index for expiry range scans
+CREATE INDEX IF NOT EXISTS idx_google_credentials_expires_at ON google_credentials(expires_at)
+    WHERE refresh_token IS NOT NULL;
+
+-- Claim the refresh lease for every listed user whose lease is free and return the claimed users
+CREATE OR REPLACE FUNCTION claim_google_token_refresh(p_user_ids UUID[], p_lease_seconds INTEGER)
+RETURNS TABLE(user_id UUID) AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE google_credentials AS g
+    SET refresh_lease_until = NOW() + make_interval(secs => p_lease_seconds)
+    WHERE g.user_id = ANY(p_user_ids)
+      AND g.refresh_token IS NOT NULL
+      AND (g.refresh_lease_until IS NULL OR g.refresh_lease_until < NOW())
+    RETURNING g.user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Write back refreshed access tokens and release their leases in one statement.
+-- Entries without an access_token only release the lease.
+CREATE OR REPLACE FUNCTION apply_refreshed_google_tokens(p_tokens JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    updated_count INTEGER;
+BEGIN
+    UPDATE google_credentials AS g
+    SET access_token = COALESCE(t.access_token, g.access_token),
+        expires_in = COALESCE(t.expires_in, g.expires_in),
+        expires_at = COALESCE(t.expires_at, g.expires_at),
+        updated_at = CASE WHEN t.access_token IS NULL THEN g.updated_at ELSE NOW() END,
+        refresh_lease_until = NULL
+    FROM jsonb_to_recordset(p_tokens) AS t(user_id UUID, access_token TEXT, expires_in INTEGER, expires_at TIMESTAMPTZ)
+    WHERE g.user_id = t.user_id;
+
+    GET DIAGNOSTICS updated_count = ROW_COUNT;
+    RETURN updated_count;
+END;
+$$ LANGUAGE plpgsql;
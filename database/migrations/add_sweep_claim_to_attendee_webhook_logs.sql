@@ -0,0 +1,49 @@
+-- Support for the attendee webhook sweep: unprocessed rows are claimed for a while
+-- when queued, so concurrent or repeated sweeps do not queue the same row again.
+ALTER TABLE attendee_webhook_logs ADD COLUMN IF NOT EXISTS sweeping_until TIMESTAMPTZ;
+
+-- Create index for the sweep's scan of unprocessed rows
+CREATE INDEX IF NOT EXISTS idx_attendee_webhook_logs_unprocessed ON attendee_webhook_logs(received_at)
+    WHERE processed = false;
+
+-- Claim up to p_limit unprocessed rows received before p_received_before whose claim is free,
+-- skipping p_exclude_ids, and return them
+CREATE OR REPLACE FUNCTION claim_unprocessed_attendee_webhook_logs(
+    p_received_before TIMESTAMPTZ,
+    p_claim_seconds INTEGER,
+    p_limit INTEGER,
+    p_exclude_ids UUID[] DEFAULT '{}'
+)
+RETURNS TABLE(id UUID, user_id UUID, bot_id TEXT, webhook_data JSONB) AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE attendee_webhook_logs AS w
+    SET sweeping_until = NOW() + make_interval(secs => p_claim_seconds)
+    WHERE w.id IN (
+        SELECT l.id FROM attendee_webhook_logs AS l
+        WHERE l.processed = false
+          AND l.received_at < p_received_before
+          AND (l.sweeping_until IS NULL OR l.sweeping_until < NOW())
+          AND NOT (l.id = ANY(p_exclude_ids))
+        ORDER BY l.received_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING w.id, w.user_id, w.bot_id, w.webhook_data;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Extend the claim on rows waiting for their transcript so the sweep leaves them alone
+CREATE OR REPLACE FUNCTION extend_attendee_webhook_log_claims(p_ids UUID[], p_claim_seconds INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    updated_count INTEGER;
+BEGIN
+    UPDATE attendee_webhook_logs
+    SET sweeping_until = NOW() + make_interval(secs => p_claim_seconds)
+    WHERE id = ANY(p_ids) AND processed = false;
+
+    GET DIAGNOSTICS updated_count = ROW_COUNT;
+    RETURN updated_count;
+END;
+$$ LANGUAGE plpgsql;
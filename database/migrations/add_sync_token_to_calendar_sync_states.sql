@@ -0,0 +1,24 @@
+-- Store the Calendar sync token per user and calendar so polling only pulls changed events
+CREATE TABLE IF NOT EXISTS calendar_sync_states (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    calendar_id TEXT NOT NULL,
+    last_sync_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE calendar_sync_states ADD COLUMN IF NOT EXISTS sync_token TEXT;
+
+-- Recurring events are expanded into instances up to this time; the window rolls forward each poll
+ALTER TABLE calendar_sync_states ADD COLUMN IF NOT EXISTS window_end TIMESTAMPTZ;
+
+-- One state per user and calendar; 'primary' is a per-user alias, not a shared calendar
+CREATE UNIQUE INDEX IF NOT EXISTS idx_calendar_sync_states_user_calendar
+    ON calendar_sync_states(user_id, calendar_id);
+
+-- Add RLS policies
+ALTER TABLE calendar_sync_states ENABLE ROW LEVEL SECURITY;
+
+-- Allow service role to manage sync states
+DROP POLICY IF EXISTS "Service role can manage calendar sync states" ON calendar_sync_states;
+CREATE POLICY "Service role can manage calendar sync states" ON calendar_sync_states
+    FOR ALL USING (auth.role() = 'service_role');
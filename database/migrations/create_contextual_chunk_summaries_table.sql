@@ -0,0 +1,17 @@
+-- Cache of contextual chunk summaries used for contextual retrieval.
+-- document_hash covers the summary model, prompt and truncated document; chunk_hash
+-- covers the chunk text. Re-ingesting an unchanged document reuses every summary.
+CREATE TABLE IF NOT EXISTS contextual_chunk_summaries (
+    document_hash TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (document_hash, chunk_hash)
+);
+
+-- Add RLS policies
+ALTER TABLE contextual_chunk_summaries ENABLE ROW LEVEL SECURITY;
+
+-- Allow service role to manage the summary cache
+CREATE POLICY "Service role can manage contextual chunk summaries" ON contextual_chunk_summaries
+    FOR ALL USING (auth.role() = 'service_role');
@@ -0,0 +1,21 @@
+-- Store the Drive changes feed page token per user so polling reads one change stream instead of checking every watched file
+CREATE TABLE IF NOT EXISTS drive_sync_states (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    page_token TEXT,
+    last_sync_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- A change that failed to apply is kept on its watch and retried on later polls
+ALTER TABLE drive_file_watches ADD COLUMN IF NOT EXISTS pending_change JSONB;
+
+-- Watches are routed per user on every poll
+CREATE INDEX IF NOT EXISTS idx_drive_file_watches_user_active ON drive_file_watches(user_id, is_active);
+
+-- Add RLS policies
+ALTER TABLE drive_sync_states ENABLE ROW LEVEL SECURITY;
+
+-- Allow service role to manage sync states
+DROP POLICY IF EXISTS "Service role can manage drive sync states" ON drive_sync_states;
+CREATE POLICY "Service role can manage drive sync states" ON drive_sync_states
+    FOR ALL USING (auth.role() = 'service_role');
@@ -0,0 +1,162 @@
+-- Persistent per-project inverted index used for BM25 keyword retrieval.
+-- Postings are maintained incrementally by KeywordIndexService; row changes on
+-- documents and meetings are captured by triggers into keyword_index_changes so
+-- every writer keeps the index current without touching the index tables itself.
+
+-- Indexed documents (one row per document or meeting per project)
+CREATE TABLE IF NOT EXISTS keyword_index_documents (
+    project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    document_id UUID NOT NULL,
+    source_type TEXT NOT NULL CHECK (source_type = ANY (ARRAY['document', 'meeting'])),
+    doc_type TEXT,
+    title TEXT,
+    doc_length INTEGER NOT NULL DEFAULT 0,
+    indexed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (project_id, source_type, document_id)
+);
+
+-- Postings lists: one row per (term, document); doc_length is denormalized so a
+-- BM25 query only has to read the postings of its query terms
+CREATE TABLE IF NOT EXISTS keyword_index_postings (
+    project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    term TEXT NOT NULL,
+    document_id UUID NOT NULL,
+    source_type TEXT NOT NULL,
+    term_frequency INTEGER NOT NULL,
+    doc_length INTEGER NOT NULL,
+    PRIMARY KEY (project_id, term, source_type, document_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_keyword_index_postings_document ON keyword_index_postings(project_id, source_type, document_id);
+
+-- Corpus statistics per project (document count and total length for avgdl/IDF)
+CREATE TABLE IF NOT EXISTS keyword_index_stats (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    document_count INTEGER NOT NULL DEFAULT 0,
+    total_length BIGINT NOT NULL DEFAULT 0,
+    built_at TIMESTAMPTZ,
+    build_lease_until TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Pending changes to apply to the index
+CREATE TABLE IF NOT EXISTS keyword_index_changes (
+    id BIGSERIAL PRIMARY KEY,
+    project_id UUID NOT NULL,
+    document_id UUID NOT NULL,
+    source_type TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_keyword_index_changes_project_id ON keyword_index_changes(project_id, id);
+
+-- Keep keyword_index_stats in step with keyword_index_documents
+CREATE OR REPLACE FUNCTION update_keyword_index_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE keyword_index_stats
+        SET document_count = GREATEST(document_count - 1, 0),
+            total_length = GREATEST(total_length - OLD.doc_length, 0),
+            updated_at = NOW()
+        WHERE project_id = OLD.project_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO keyword_index_stats (project_id, document_count, total_length)
+        VALUES (NEW.project_id, 1, NEW.doc_length)
+        ON CONFLICT (project_id) DO UPDATE
+        SET document_count = keyword_index_stats.document_count + 1,
+            total_length = keyword_index_stats.total_length + NEW.doc_length,
+            updated_at = NOW();
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_update_keyword_index_stats
+    AFTER INSERT OR UPDATE OR DELETE ON keyword_index_documents
+    FOR EACH ROW
+    EXECUTE FUNCTION update_keyword_index_stats();
+
+-- Claim the lease for rebuilding a project's index; false while another build holds it
+CREATE OR REPLACE FUNCTION claim_keyword_index_build(p_project_id UUID, p_lease_seconds INTEGER)
+RETURNS BOOLEAN AS $$
+DECLARE
+    claimed_project UUID;
+BEGIN
+    INSERT INTO keyword_index_stats (project_id)
+    VALUES (p_project_id)
+    ON CONFLICT (project_id) DO NOTHING;
+
+    UPDATE keyword_index_stats
+    SET build_lease_until = NOW() + make_interval(secs => p_lease_seconds),
+        updated_at = NOW()
+    WHERE project_id = p_project_id
+      AND (build_lease_until IS NULL OR build_lease_until < NOW())
+    RETURNING project_id INTO claimed_project;
+
+    RETURN claimed_project IS NOT NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Record document/meeting changes for incremental index maintenance.
+-- TG_ARGV[0] is the source type ('document' or 'meeting').
+CREATE OR REPLACE FUNCTION enqueue_keyword_index_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.project_id IS NOT NULL THEN
+        INSERT INTO keyword_index_changes (project_id, document_id, source_type, operation)
+        VALUES (OLD.project_id, OLD.id, TG_ARGV[0], TG_OP);
+    END IF;
+
+    IF TG_OP = 'INSERT' AND NEW.project_id IS NOT NULL THEN
+        INSERT INTO keyword_index_changes (project_id, document_id, source_type, operation)
+        VALUES (NEW.project_id, NEW.id, TG_ARGV[0], TG_OP);
+    ELSIF TG_OP = 'UPDATE' AND NEW.project_id IS NOT NULL AND NEW.project_id IS DISTINCT FROM OLD.project_id THEN
+        INSERT INTO keyword_index_changes (project_id, document_id, source_type, operation)
+        VALUES (NEW.project_id, NEW.id, TG_ARGV[0], TG_OP);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_documents_keyword_index_insert_delete
+    AFTER INSERT OR DELETE ON documents
+    FOR EACH ROW
+    EXECUTE FUNCTION enqueue_keyword_index_change('document');
+
+-- Covers every documents column KeywordIndexService.extract_content_text reads
+CREATE TRIGGER trigger_documents_keyword_index_update
+    AFTER UPDATE OF title, summary, content, metadata, type, project_id, meeting_id ON documents
+    FOR EACH ROW
+    EXECUTE FUNCTION enqueue_keyword_index_change('document');
+
+CREATE TRIGGER trigger_meetings_keyword_index_insert_delete
+    AFTER INSERT OR DELETE ON meetings
+    FOR EACH ROW
+    EXECUTE FUNCTION enqueue_keyword_index_change('meeting');
+
+CREATE TRIGGER trigger_meetings_keyword_index_update
+    AFTER UPDATE OF title, description, transcript, transcript_summary, project_id ON meetings
+    FOR EACH ROW
+    EXECUTE FUNCTION enqueue_keyword_index_change('meeting');
+
+-- Add RLS policies
+ALTER TABLE keyword_index_documents ENABLE ROW LEVEL SECURITY;
+ALTER TABLE keyword_index_postings ENABLE ROW LEVEL SECURITY;
+ALTER TABLE keyword_index_stats ENABLE ROW LEVEL SECURITY;
+ALTER TABLE keyword_index_changes ENABLE ROW LEVEL SECURITY;
+
+-- Allow service role to manage the keyword index
+CREATE POLICY "Service role can manage keyword index documents" ON keyword_index_documents
+    FOR ALL USING (auth.role() = 'service_role');
+CREATE POLICY "Service role can manage keyword index postings" ON keyword_index_postings
+    FOR ALL USING (auth.role() = 'service_role');
+CREATE POLICY "Service role can manage keyword index stats" ON keyword_index_stats
+    FOR ALL USING (auth.role() = 'service_role');
+CREATE POLICY "Service role can manage keyword index changes" ON keyword_index_changes
+    FOR ALL USING (auth.role() = 'service_role');
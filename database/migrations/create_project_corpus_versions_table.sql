@@ -0,0 +1,64 @@
+-- Per-project corpus version used to key cached RAG retrieval results.
+-- The version is bumped whenever a project's documents or meetings change
+-- (via triggers) or its vectors change (via bump_project_corpus_version RPC).
+CREATE TABLE IF NOT EXISTS project_corpus_versions (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Increment a project's corpus version and return the new value
+CREATE OR REPLACE FUNCTION bump_project_corpus_version(p_project_id UUID)
+RETURNS BIGINT AS $$
+DECLARE
+    new_version BIGINT;
+BEGIN
+    INSERT INTO project_corpus_versions (project_id, version)
+    VALUES (p_project_id, 1)
+    ON CONFLICT (project_id) DO UPDATE
+    SET version = project_corpus_versions.version + 1,
+        updated_at = NOW()
+    RETURNING version INTO new_version;
+
+    RETURN new_version;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Bump the corpus version of the old and new project of a changed row
+CREATE OR REPLACE FUNCTION bump_corpus_version_on_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.project_id IS NOT NULL THEN
+        PERFORM bump_project_corpus_version(OLD.project_id);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.project_id IS NOT NULL
+       AND (TG_OP = 'INSERT' OR NEW.project_id IS DISTINCT FROM OLD.project_id) THEN
+        PERFORM bump_project_corpus_version(NEW.project_id);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_documents_corpus_version
+    AFTER INSERT OR UPDATE OR DELETE ON documents
+    FOR EACH ROW
+    EXECUTE FUNCTION bump_corpus_version_on_change();
+
+CREATE TRIGGER trigger_meetings_corpus_version_insert_delete
+    AFTER INSERT OR DELETE ON meetings
+    FOR EACH ROW
+    EXECUTE FUNCTION bump_corpus_version_on_change();
+
+CREATE TRIGGER trigger_meetings_corpus_version_update
+    AFTER UPDATE OF title, description, transcript, transcript_summary, project_id ON meetings
+    FOR EACH ROW
+    EXECUTE FUNCTION bump_corpus_version_on_change();
+
+-- Add RLS policies
+ALTER TABLE project_corpus_versions ENABLE ROW LEVEL SECURITY;
+
+-- Allow service role to manage corpus versions
+CREATE POLICY "Service role can manage project corpus versions" ON project_corpus_versions
+    FOR ALL USING (auth.role() = 'service_role');
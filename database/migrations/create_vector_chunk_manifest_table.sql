@@ -0,0 +1,21 @@
+-- Manifest of chunks embedded into Pinecone per source (email, Drive file, transcript).
+-- Vector IDs are derived from the source and chunk content hash, so re-ingesting a
+-- source only embeds new chunks and deletes the ones that disappeared.
+CREATE TABLE IF NOT EXISTS vector_chunk_manifest (
+    source_id TEXT NOT NULL,
+    vector_id TEXT NOT NULL,
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    user_id UUID,
+    embedded_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (source_id, vector_id)
+);
+
+-- Create index for efficient lookups
+CREATE INDEX IF NOT EXISTS idx_vector_chunk_manifest_project_id ON vector_chunk_manifest(project_id);
+
+-- Add RLS policies
+ALTER TABLE vector_chunk_manifest ENABLE ROW LEVEL SECURITY;
+
+-- Allow service role to manage the manifest
+CREATE POLICY "Service role can manage vector chunk manifest" ON vector_chunk_manifest
+    FOR ALL USING (auth.role() = 'service_role');